@@ -0,0 +1,145 @@
+"""partition progress by month
+
+Revision ID: e7c5a1d9f432
+Revises: d6b3f9e2a810
+Create Date: 2026-10-17 22:47:13.862501
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7c5a1d9f432'
+down_revision: Union[str, None] = 'd6b3f9e2a810'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# PostgreSQL only, progress stays a plain table on other databases.
+#
+# progress becomes a table partitioned by RANGE (date). The rows are not copied:
+# the existing table is attached as the partition progress_legacy with all
+# weigh-ins before the first day of the month after next, and monthly
+# partitions follow up to 3 months ahead. The primary key of a partitioned table must
+# contain the partition key, so it becomes (id, date); id keeps its sequence
+# and stays unique. Nothing references progress by foreign key
+# (progress_anomalies.progress_id has none on purpose).
+#
+# The migration runs at every rollout, so nothing holds a long lock on progress:
+# the (id, date) index is built concurrently and the bound of the legacy
+# partition is checked with a validated CHECK constraint, outside the
+# transaction. The attach then finds the matching indexes, constraints and
+# foreign key and reuses them, so the swap only changes the catalog. It waits at
+# most lock_timeout for running queries, a failed attempt is retried at the next
+# start. The constraint rejects weigh-ins after the bound, which leaves a month
+# to retry.
+#
+# (date, id) is not an index of the partitioned table: services.partitions
+# gives every monthly partition a btree while it is written and swaps it for a
+# BRIN index when the month is over. progress_legacy keeps its btree.
+
+LEGACY_BOUND = ("(SELECT date_trunc('month', greatest(max(date), current_date))::date + interval '2 months' "
+                "FROM progress)")
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name != 'postgresql':
+        return
+
+    with op.get_context().autocommit_block():
+        # Both steps are skipped when a failed attempt got this far
+        op.create_index('ix_progress_id_date', 'progress', ['id', 'date'], unique=True,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.execute(f"""
+            DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'progress_legacy_date') THEN
+                    EXECUTE format('ALTER TABLE progress ADD CONSTRAINT progress_legacy_date '
+                                   'CHECK (date < %L) NOT VALID', {LEGACY_BOUND}::date);
+                END IF;
+            END $$
+        """)
+        # Scans progress without blocking writes
+        op.execute('ALTER TABLE progress VALIDATE CONSTRAINT progress_legacy_date')
+
+    op.execute("SET LOCAL lock_timeout = '10s'")
+    op.execute('ALTER TABLE progress ADD CONSTRAINT progress_id_date_key UNIQUE USING INDEX ix_progress_id_date')
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.rename_table('progress', 'progress_legacy')
+    op.execute('ALTER INDEX progress_pkey RENAME TO progress_legacy_pkey')
+    op.execute('ALTER INDEX ix_progress_customer_id_date RENAME TO ix_progress_legacy_customer_id_date')
+    op.execute('ALTER INDEX ix_progress_date_id RENAME TO ix_progress_legacy_date_id')
+
+    op.create_table('progress',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('progress_id_seq'::regclass)"), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=True),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('weight', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['customer_id'], ['customers.id'], ),
+    sa.PrimaryKeyConstraint('id', 'date', name='progress_pkey'),
+    postgresql_partition_by='RANGE (date)'
+    )
+    op.create_index('ix_progress_customer_id_date', 'progress', ['customer_id', 'date', 'id'], unique=False,
+                    postgresql_include=['weight'])
+    # ### end Alembic commands ###
+
+    # The bound of the legacy partition is the one of its validated constraint
+    op.execute("""
+        DO $$
+        DECLARE
+            bound date;
+            month date;
+        BEGIN
+            SELECT substring(pg_get_constraintdef(oid) from '[0-9]{4}-[0-9]{2}-[0-9]{2}')::date INTO bound
+            FROM pg_constraint WHERE conname = 'progress_legacy_date' AND conrelid = 'progress_legacy'::regclass;
+
+            EXECUTE format('ALTER TABLE progress ATTACH PARTITION progress_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+                           bound);
+
+            month := bound;
+            WHILE month <= date_trunc('month', current_date) + interval '3 months' LOOP
+                EXECUTE format('CREATE TABLE %I PARTITION OF progress FOR VALUES FROM (%L) TO (%L)',
+                               'progress_' || to_char(month, 'YYYY_MM'), month, month + interval '1 month');
+                EXECUTE format('CREATE INDEX %I ON %I (date, id)',
+                               'ix_progress_' || to_char(month, 'YYYY_MM') || '_date_id',
+                               'progress_' || to_char(month, 'YYYY_MM'));
+                month := month + interval '1 month';
+            END LOOP;
+        END $$
+    """)
+
+    op.execute('ALTER SEQUENCE progress_id_seq OWNED BY progress.id')
+    # Future partitions and BRIN indexes: python -m services.partitions (also runs at startup)
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name != 'postgresql':
+        return
+
+    # Copies the rows back, progress is locked until the commit
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.rename_table('progress', 'progress_partitioned')
+    op.execute('ALTER INDEX progress_pkey RENAME TO progress_partitioned_pkey')
+    op.execute('ALTER INDEX ix_progress_customer_id_date RENAME TO ix_progress_partitioned_customer_id_date')
+
+    op.create_table('progress',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('progress_id_seq'::regclass)"), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=True),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('weight', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['customer_id'], ['customers.id'], ),
+    sa.PrimaryKeyConstraint('id', name='progress_pkey')
+    )
+    op.execute('INSERT INTO progress (id, customer_id, date, weight) '
+               'SELECT id, customer_id, date, weight FROM progress_partitioned')
+    op.create_index('ix_progress_customer_id_date', 'progress', ['customer_id', 'date', 'id'], unique=False,
+                    postgresql_include=['weight'])
+    op.create_index('ix_progress_date_id', 'progress', ['date', 'id'], unique=False)
+
+    op.execute('ALTER SEQUENCE progress_id_seq OWNED BY progress.id')
+    # Drops the attached partitions too, detached ones are left alone
+    op.drop_table('progress_partitioned')
+    # ### end Alembic commands ###
@@ -0,0 +1,128 @@
+"""
+Compare the latency of the hot lookup endpoints with primary keys only (the
+initial migration) and with the indexes of the models (up to migration d6b3f9e2a810).
+
+Fills a scratch database with gyms, customers with a weigh-in history and
+historic goals, then requests every endpoint for different customers, gyms and
+names. BENCHMARK_DB_URL must point to a database that may be wiped, it defaults
+to a SQLite file in the temp directory.
+
+Usage:
+    python -m benchmarks.endpoints [customers] [days of history] [goals]    (default 20000 180 10)
+"""
+import os
+import sys
+import random
+import tempfile
+import statistics
+from time import perf_counter
+from datetime import date, timedelta
+
+benchmark_url = os.getenv("BENCHMARK_DB_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'endpoints.db')}")
+os.environ.setdefault("DB_URL", benchmark_url)
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert
+
+from main import app
+from models.entities import Base, Gym, Customer, Goal, Progress
+from services.cache import plan_cache
+from services.functions import engine
+
+GYMS = 200
+PLACES = 50
+REQUESTS = 200
+FIRST_NAMES = ["Anna", "Bram", "Daan", "Emma", "Fenna", "Jan", "Lotte", "Noah", "Sara", "Tim"]
+
+# Indexed tables, created without their indexes for the baseline
+TABLES = (Customer.__table__, Gym.__table__, Progress.__table__, Goal.__table__)
+
+def fill_database(connection, customers, days, goals):
+    rng = random.Random(42)
+    first_day = date.today() - timedelta(days=days)
+
+    connection.execute(insert(Gym), [
+        {"id": i, "name": f"Gym{i}", "address_place": f"Place{i % PLACES}"} for i in range(1, GYMS + 1)
+    ])
+
+    for start in range(1, customers + 1, 5000):
+        ids = range(start, min(start + 5000, customers + 1))
+        connection.execute(insert(Customer), [
+            {"id": i, "first_name": FIRST_NAMES[i % len(FIRST_NAMES)], "last_name": f"Customer{i // 10}",
+             "gender": rng.choice(["male", "female"]), "birth_date": date(1990, 1, 1) + timedelta(days=i % 9000),
+             "length": rng.randint(150, 210), "gym_id": i % GYMS + 1, "activity_level": 1.5}
+            for i in ids
+        ])
+        connection.execute(insert(Progress), [
+            {"customer_id": i, "weight": 100 - x // 30, "date": first_day + timedelta(days=x)}
+            for i in ids for x in range(days)
+        ])
+        connection.execute(insert(Goal), [
+            {"customer_id": i, "weight_goal": 90 - x, "start_date": first_day + timedelta(days=x * 30),
+             "end_date": first_day + timedelta(days=x * 30 + 60)}
+            for i in ids for x in range(goals)
+        ])
+
+def endpoints(customers):
+    """Per endpoint a function from the request number to a URL and query parameters"""
+    def customer(n):
+        return n * 7919 % customers + 1
+
+    return {
+        "GET /customers/?first_name&last_name": lambda n: ("/customers/", {
+            "first_name": FIRST_NAMES[customer(n) % len(FIRST_NAMES)], "last_name": f"Customer{customer(n) // 10}"
+        }),
+        "GET /gyms/?address_place": lambda n: ("/gyms/", {"address_place": f"Place{n % PLACES}"}),
+        "GET /gyms/{id}/customers": lambda n: (f"/gyms/{n % GYMS + 1}/customers", {"limit": 50}),
+        "GET /customers/{id}/goals": lambda n: (f"/customers/{customer(n)}/goals", {}),
+        "GET /customers/{id}/progress": lambda n: (f"/customers/{customer(n)}/progress", {}),
+        "GET /customers/{id}/daily_calorie_intake": lambda n: (f"/customers/{customer(n)}/daily_calorie_intake", {}),
+    }
+
+def timed(client, request):
+    """Latencies of REQUESTS requests in ms, the plans are not served from the cache"""
+    latencies = []
+    for n in range(REQUESTS):
+        url, params = request(n)
+        plan_cache.clear()
+
+        start = perf_counter()
+        response = client.get(url, params=params)
+        latencies.append((perf_counter() - start) * 1000)
+
+        assert response.status_code == 200, (url, response.status_code, response.text)
+
+    return statistics.median(latencies), statistics.quantiles(latencies, n=20)[-1]
+
+def main(customers=20000, days=180, goals=10):
+    bench_engine = create_engine(benchmark_url)
+
+    Base.metadata.drop_all(bench_engine)
+    Base.metadata.create_all(bench_engine)
+
+    with bench_engine.begin() as connection:
+        fill_database(connection, customers, days, goals)
+
+    client = TestClient(app)
+    indexes = [x for table in TABLES for x in table.indexes]
+
+    for index in indexes:
+        index.drop(bench_engine)
+    engine.dispose()
+    before = {name: timed(client, request) for name, request in endpoints(customers).items()}
+
+    for index in indexes:
+        index.create(bench_engine)
+    engine.dispose()
+    after = {name: timed(client, request) for name, request in endpoints(customers).items()}
+
+    print(f"{customers} customers, {days} weigh-ins and {goals} goals per customer, {REQUESTS} requests per endpoint")
+    print(f"{'endpoint':<42} {'primary keys p50/p95 (ms)':>26} {'indexed p50/p95 (ms)':>22}")
+    for name in before:
+        print(f"{name:<42} {before[name][0]:>17.2f} / {before[name][1]:>6.2f} "
+              f"{after[name][0]:>13.2f} / {after[name][1]:>6.2f}")
+
+    Base.metadata.drop_all(bench_engine)
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:4]])
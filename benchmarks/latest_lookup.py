@@ -0,0 +1,100 @@
+"""
+Compare the old progress x goals cross product lookup of get_data_from_db_to_calculate
+(without the indexes of migration 3e8f1b6d2a47) with the index-backed lookups of
+the latest progress and goal.
+
+Fills a scratch database with customers with a long history (daily weigh-ins
+and historic goals) and times both lookups. BENCHMARK_DB_URL must point to a
+database that may be wiped, it defaults to a SQLite file in the temp directory.
+
+Usage:
+    python -m benchmarks.latest_lookup [days of history] [goals]    (default 730 20)
+"""
+import os
+import sys
+import tempfile
+from time import perf_counter
+from datetime import date, timedelta
+
+benchmark_url = os.getenv("BENCHMARK_DB_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'latest_lookup.db')}")
+os.environ.setdefault("DB_URL", benchmark_url)
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from models.entities import Base, Gym, Customer, Goal, Progress
+from services.functions import get_data_from_db_to_calculate
+
+CUSTOMERS = 50
+LOOKUPS = 500
+
+def cross_product_lookup(customer_id, db):
+    """get_data_from_db_to_calculate before the rewrite"""
+    result = db.execute(
+        select(
+            Progress.weight, Progress.date, Goal.weight_goal, Goal.start_date, Goal.end_date,
+            Customer.activity_level, Customer.length, Customer.gender, Customer.birth_date
+        )
+        .join(Goal, Goal.customer_id == Progress.customer_id)
+        .join(Customer, Customer.id == Progress.customer_id)
+        .where(Progress.customer_id == customer_id)
+        .order_by(Progress.date.desc(), Goal.start_date.desc())
+        .limit(1)
+    ).fetchone()
+
+    return dict(result._mapping) if result else None
+
+def fill_database(session, days, goals):
+    first_day = date.today() - timedelta(days=days)
+
+    session.execute(insert(Gym), [{"id": 1, "name": "Benchmark Gym", "address_place": "Zwolle"}])
+    session.execute(insert(Customer), [
+        {"id": i, "first_name": f"Customer{i}", "last_name": "Benchmark", "gender": "male",
+         "birth_date": date(1990, 1, 1), "length": 180, "gym_id": 1, "activity_level": 1.5}
+        for i in range(1, CUSTOMERS + 1)
+    ])
+    session.execute(insert(Progress), [
+        {"customer_id": i, "weight": 100 - x // 30, "date": first_day + timedelta(days=x)}
+        for i in range(1, CUSTOMERS + 1) for x in range(days)
+    ])
+    session.execute(insert(Goal), [
+        {"customer_id": i, "weight_goal": 90 - x, "start_date": first_day + timedelta(days=x * 30),
+         "end_date": first_day + timedelta(days=x * 30 + 60)}
+        for i in range(1, CUSTOMERS + 1) for x in range(goals)
+    ])
+    session.commit()
+
+def timed(function, session):
+    start = perf_counter()
+    results = [function(i % CUSTOMERS + 1, session) for i in range(LOOKUPS)]
+    return (perf_counter() - start) / LOOKUPS * 1000, results
+
+def main(days=730, goals=20):
+    engine = create_engine(benchmark_url)
+    Session = sessionmaker(bind=engine)
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    indexes = [x for table in (Progress.__table__, Goal.__table__) for x in table.indexes]
+
+    with Session() as session:
+        fill_database(session, days, goals)
+
+        for index in indexes:
+            index.drop(engine)
+        old_time, old_results = timed(cross_product_lookup, session)
+
+        for index in indexes:
+            index.create(engine)
+        new_time, new_results = timed(get_data_from_db_to_calculate, session)
+
+    assert old_results == new_results
+    print(f"{days} weigh-ins and {goals} goals per customer ({days * goals} cross product rows)")
+    print(f"cross product: {old_time:.2f} ms per lookup")
+    print(f"index lookups: {new_time:.2f} ms per lookup")
+
+    Base.metadata.drop_all(engine)
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:3]])
@@ -0,0 +1,86 @@
+"""
+Compare the app-side and SQL-side calculation of all daily plans.
+
+Fills a scratch database with N customers (one progress row and one goal each)
+and times calculate_daily_calories_all_customers against its SQL-side version.
+BENCHMARK_DB_URL must point to a database that may be wiped, it defaults to a
+SQLite file in the temp directory.
+
+Usage:
+    python -m benchmarks.sql_plans [sizes ...]    (default 10000 100000 1000000)
+"""
+import os
+import sys
+import random
+import tempfile
+from time import perf_counter
+from datetime import date, timedelta
+
+benchmark_url = os.getenv("BENCHMARK_DB_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'sql_plans.db')}")
+os.environ.setdefault("DB_URL", benchmark_url)
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from models.entities import Base, Gym, Customer, Goal, Progress
+from services.functions import calculate_daily_calories_all_customers
+from services.sql_plans import calculate_daily_calories_all_customers_sql
+
+def fill_database(session, count):
+    rng = random.Random(42)
+    today = date.today()
+
+    session.execute(insert(Gym), [{"id": 1, "name": "Benchmark Gym", "address_place": "Zwolle"}])
+
+    for start in range(1, count + 1, 50000):
+        ids = range(start, min(start + 50000, count + 1))
+        session.execute(insert(Customer), [
+            {"id": i, "first_name": f"Customer{i}", "last_name": "Benchmark",
+             "gender": rng.choice(["male", "female"]),
+             "birth_date": today - timedelta(days=rng.randint(16 * 365, 80 * 365)),
+             "length": rng.randint(150, 210), "gym_id": 1, "activity_level": rng.uniform(1.2, 1.725)}
+            for i in ids
+        ])
+        session.execute(insert(Progress), [
+            {"customer_id": i, "weight": rng.randint(45, 150), "date": today - timedelta(days=rng.randint(0, 60))}
+            for i in ids
+        ])
+        session.execute(insert(Goal), [
+            {"customer_id": i, "weight_goal": rng.randint(45, 150),
+             "start_date": today - timedelta(days=rng.randint(61, 120)),
+             "end_date": today + timedelta(days=rng.randint(1, 365))}
+            for i in ids
+        ])
+
+    session.commit()
+
+def timed(function, *args):
+    start = perf_counter()
+    result = function(*args)
+    return perf_counter() - start, result
+
+def main(sizes):
+    engine = create_engine(benchmark_url)
+    Session = sessionmaker(bind=engine)
+
+    print(f"{'customers':>10} {'app-side (s)':>13} {'sql-side (s)':>13}")
+
+    for size in sizes:
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+
+        with Session() as session:
+            fill_database(session, size)
+
+        with Session() as session:
+            app_time, app_plans = timed(calculate_daily_calories_all_customers, False, session)
+        with Session() as session:
+            sql_time, sql_plans = timed(calculate_daily_calories_all_customers_sql, False, session)
+
+        assert len(app_plans) == len(sql_plans) == size
+        print(f"{size:>10} {app_time:>13.2f} {sql_time:>13.2f}")
+
+    Base.metadata.drop_all(engine)
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or [10000, 100000, 1000000])
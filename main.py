@@ -1,17 +1,30 @@
 ### Dependencies ###
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import Optional, Literal
 
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Header
 from fastapi.exceptions import HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select
 
 ### Imports ###
-from routers import customers, gyms, goals, progress
+from routers import customers, gyms, goals, progress, calories
 from models.entities import Customer as CustomerTable
-from services.functions import get_db, calculate_daily_calories_all_customers
+from services.cache import get_cache_stats as cache_stats
+from services.functions import get_db, calculate_daily_calories_all_customers, stream_daily_calories_all_customers
+from services.parallel import calculate_daily_calories_all_customers_parallel, shutdown_executor
+from services.sql_plans import calculate_daily_calories_all_customers_sql, stream_daily_calories_all_customers_sql
+from services.partitions import maintain_partitions
+
+@asynccontextmanager
+async def lifespan(app):
+    # Partitions of the coming months, skipped unless progress is partitioned (PostgreSQL)
+    maintain_partitions()
+    yield
+    shutdown_executor()
 
 # API Initialisation
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
 def read_root():
@@ -21,20 +34,42 @@ def read_root():
 
 @app.get("/daily_intake_all")
 async def get_daily_intake_all(from_start_date: Optional[bool] = False,
-                                        db = Depends(get_db)):
+                               stream: Optional[Literal["ndjson"]] = None,
+                               parallel: Optional[bool] = False,
+                               sql: Optional[bool] = False,
+                               accept: Optional[str] = Header(None),
+                               db = Depends(get_db)):
     try:
-        statement = select(CustomerTable.id).order_by(CustomerTable.id.asc())
+        # Streaming mode, requested with ?stream=ndjson or an NDJSON Accept header
+        if stream == "ndjson" or (accept and "application/x-ndjson" in accept):
+            if not db.execute(select(CustomerTable.id).limit(1)).first():
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"No customers found"
+                )
+
+            if sql:
+                lines = stream_daily_calories_all_customers_sql(from_start_date, db)
+            else:
+                lines = stream_daily_calories_all_customers(from_start_date, db)
+
+            return StreamingResponse(lines, media_type="application/x-ndjson")
 
-        customer_ids = db.execute(statement).scalars().all()
+        # SQL mode, the plans are calculated by the database
+        if sql:
+            detailed_daily_cal_intake = calculate_daily_calories_all_customers_sql(from_start_date, db)
+        # Process pool mode for large batches, see PLAN_WORKERS and PLAN_SHARD_SIZE
+        elif parallel:
+            detailed_daily_cal_intake = await calculate_daily_calories_all_customers_parallel(from_start_date, db)
+        else:
+            detailed_daily_cal_intake = calculate_daily_calories_all_customers(from_start_date, db)
 
-        if not customer_ids:
+        if not detailed_daily_cal_intake:
             raise HTTPException(
                 status_code=404,
                 detail=f"No customers found"
             )
 
-        detailed_daily_cal_intake = calculate_daily_calories_all_customers(customer_ids, from_start_date, db)
-
         response_data = {"data": detailed_daily_cal_intake}
 
         return response_data
@@ -45,7 +80,13 @@ async def get_daily_intake_all(from_start_date: Optional[bool] = False,
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
 
+@app.get("/cache/stats")
+def get_cache_stats(db = Depends(get_db)):
+    """Counters of the caches of the replica serving the request, with the invalidations of all replicas"""
+    return cache_stats(db)
+
 app.include_router(customers.router)
 app.include_router(gyms.router)
 app.include_router(goals.router)
 app.include_router(progress.router)
+app.include_router(calories.router)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, Date, Float, CheckConstraint
+from sqlalchemy import Column, String, Integer, ForeignKey, Date, Float, Boolean, CheckConstraint, JSON, Index
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
@@ -19,7 +19,11 @@ class Customer(Base):
     __table_args__ = (
         CheckConstraint('activity_level >= 1.2', name='chk_activity_level_minimum'),
         CheckConstraint('activity_level <= 1.725', name='chk_activity_level_maximum'),
-        CheckConstraint("gender IN ('male', 'female')", name='chk_gender_male_female')
+        CheckConstraint("gender IN ('male', 'female')", name='chk_gender_male_female'),
+        # Members of a gym
+        Index('ix_customers_gym_id', 'gym_id'),
+        # Search by name
+        Index('ix_customers_last_name_first_name', 'last_name', 'first_name', 'id')
     )
 
 class Gym(Base):
@@ -28,13 +32,28 @@ class Gym(Base):
     name = Column(String, nullable=False)
     customers = relationship("Customer")
     address_place = Column(String, nullable=False)
+    # Names in services.formulas, NULL for the defaults
+    bmr_formula = Column(String, nullable=True)
+    macro_profile = Column(String, nullable=True)
+    __table_args__ = (
+        # Search by place
+        Index('ix_gyms_address_place', 'address_place', 'id'),
+    )
 
 class Progress(Base):
+    # On PostgreSQL partitioned by month on date (migration e7c5a1d9f432, services.partitions),
+    # with primary key (id, date), see there for the date indexes of the partitions
     __tablename__ = "progress"
     id = Column(Integer, primary_key=True, autoincrement=True)
     customer_id = Column(Integer, ForeignKey("customers.id"))
     date = Column(Date, nullable=False)
     weight = Column(Integer, nullable=False)
+    __table_args__ = (
+        # Latest progress of a customer, covering the weight for index-only scans of the history on PostgreSQL
+        Index('ix_progress_customer_id_date', 'customer_id', 'date', 'id', postgresql_include=['weight']),
+        # Progress in a date range, per partition on PostgreSQL (btree, BRIN once the month is over)
+        Index('ix_progress_date_id', 'date', 'id'),
+    )
 
 class Goal(Base):
     __tablename__ = "goals"
@@ -43,3 +62,167 @@ class Goal(Base):
     weight_goal = Column(Integer, nullable=False)
     start_date = Column(Date, nullable=False)
     end_date = Column(Date, nullable=False)
+    __table_args__ = (
+        # Latest goal of a customer
+        Index('ix_goals_customer_id_start_date', 'customer_id', 'start_date', 'id'),
+        # Goals that end or ended in a period
+        Index('ix_goals_end_date_customer_id', 'end_date', 'customer_id'),
+        # Goals of a customer ending in a date range
+        Index('ix_goals_customer_id_end_date', 'customer_id', 'end_date', 'id'),
+    )
+
+
+class DailyPlan(Base):
+    __tablename__ = "daily_plans"
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    # Data the plan was calculated from (see get_data_from_db_to_calculate)
+    weight = Column(Integer, nullable=False)
+    date = Column(Date, nullable=False)
+    weight_goal = Column(Integer, nullable=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    activity_level = Column(Float, nullable=False)
+    length = Column(Integer, nullable=False)
+    gender = Column(String, nullable=False)
+    birth_date = Column(Date, nullable=False)
+    bmr_formula = Column(String, nullable=True)
+    macro_profile = Column(String, nullable=True)
+    age = Column(Integer, nullable=False)
+    # Calculated plans, deadline from the progress date and from the goal start date
+    plan = Column(JSON, nullable=True)
+    plan_from_start_date = Column(JSON, nullable=True)
+
+
+class TdeeCalibration(Base):
+    __tablename__ = "tdee_calibrations"
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    calculated_on = Column(Date, nullable=False)
+    # Weigh-ins since the start of the goal and their trend in kg per week
+    measurements = Column(Integer, nullable=False)
+    weight_trend = Column(Float, nullable=False)
+    planned_intake = Column(Float, nullable=False)
+    bmr = Column(Float, nullable=False)
+    observed_tdee = Column(Float, nullable=False)
+    activity_level = Column(Float, nullable=False)
+    suggested_activity_level = Column(Float, nullable=False)
+
+
+class LeaderboardEntry(Base):
+    __tablename__ = "leaderboard"
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    gym_id = Column(Integer, ForeignKey("gyms.id"), nullable=True)
+    # Weight at the start of the latest goal, latest weight and the goal
+    start_weight = Column(Integer, nullable=False)
+    weight = Column(Integer, nullable=False)
+    weight_goal = Column(Integer, nullable=False)
+    # Percentage of the goal achieved (see services.leaderboard.goal_progress)
+    goal_progress = Column(Float, nullable=False)
+    __table_args__ = (
+        # Top entries of a gym
+        Index('ix_leaderboard_gym_id_goal_progress', 'gym_id', goal_progress.desc(), 'customer_id'),
+    )
+
+
+class GymStatMember(Base):
+    __tablename__ = "gym_stat_members"
+    # What a customer last added to the gym statistics (see services.gym_stats)
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    gym_id = Column(Integer, ForeignKey("gyms.id"), nullable=True)
+    gender = Column(String, nullable=False)
+    birth_date = Column(Date, nullable=False)
+    age_bucket = Column(String, nullable=False)
+    length = Column(Integer, nullable=False)
+    weight = Column(Integer, nullable=True)
+    bmi_category = Column(String, nullable=True)
+    goal_start_date = Column(Date, nullable=True)
+    goal_end_date = Column(Date, nullable=True)
+    active_goal = Column(Boolean, nullable=False)
+    __table_args__ = (
+        # Members whose age bucket or active goal changes on a day (see services.gym_stats.move_members)
+        Index('ix_gym_stat_members_birth_date', 'birth_date'),
+        Index('ix_gym_stat_members_goal_start_date', 'goal_start_date'),
+        Index('ix_gym_stat_members_goal_end_date', 'goal_end_date'),
+    )
+
+
+class GymStatCounter(Base):
+    __tablename__ = "gym_stat_counters"
+    gym_id = Column(Integer, ForeignKey("gyms.id"), primary_key=True)
+    metric = Column(String, primary_key=True)
+    bucket = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False)
+
+
+class ProgressRollup(Base):
+    __tablename__ = "progress_rollups"
+    # Weigh-ins of a customer in the week starting on Monday `week`
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    week = Column(Date, primary_key=True)
+    measurements = Column(Integer, nullable=False)
+    weight_sum = Column(Integer, nullable=False)
+    min_weight = Column(Integer, nullable=False)
+    max_weight = Column(Integer, nullable=False)
+    last_weight = Column(Integer, nullable=False)
+
+
+class ProgressStat(Base):
+    __tablename__ = "progress_stats"
+    # Running weight statistics of a customer (Welford), see services.anomalies
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+    count = Column(Integer, nullable=False)
+    mean = Column(Float, nullable=False)
+    m2 = Column(Float, nullable=False)
+
+
+class ProgressAnomaly(Base):
+    __tablename__ = "progress_anomalies"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # No foreign keys, the progress table may be partitioned and rows are kept as a log
+    progress_id = Column(Integer, nullable=False)
+    customer_id = Column(Integer, nullable=False)
+    date = Column(Date, nullable=False)
+    weight = Column(Integer, nullable=False)
+    expected_weight = Column(Float, nullable=False)
+    std = Column(Float, nullable=False)
+    z_score = Column(Float, nullable=False)
+    detected_on = Column(Date, nullable=False)
+    __table_args__ = (
+        # Anomalies of a customer
+        Index('ix_progress_anomalies_customer_id_id', 'customer_id', 'id'),
+    )
+
+
+class GoalOutcome(Base):
+    __tablename__ = "goal_outcomes"
+    goal_id = Column(Integer, ForeignKey("goals.id"), primary_key=True)
+    # Customer and gym when the goal was evaluated
+    customer_id = Column(Integer, nullable=True)
+    gym_id = Column(Integer, nullable=True)
+    end_date = Column(Date, nullable=False)
+    weight_goal = Column(Integer, nullable=False)
+    start_weight = Column(Integer, nullable=True)
+    # Weigh-in nearest to the end date
+    final_weight = Column(Integer, nullable=True)
+    final_date = Column(Date, nullable=True)
+    # met, missed or no_data, the margin is negative when missed
+    outcome = Column(String, nullable=False)
+    margin = Column(Float, nullable=True)
+    evaluated_on = Column(Date, nullable=False)
+    __table_args__ = (
+        # Success rate of a gym
+        Index('ix_goal_outcomes_gym_id', 'gym_id'),
+    )
+
+
+class JobWatermark(Base):
+    __tablename__ = "job_watermarks"
+    # Progress of an incremental job, see services.goal_outcomes
+    name = Column(String, primary_key=True)
+    value = Column(Date, nullable=False)
+
+
+class CacheGeneration(Base):
+    __tablename__ = "cache_generations"
+    # Generation of cached data, bumped by every write, see services.cache
+    name = Column(String, primary_key=True)
+    generation = Column(Integer, nullable=False)
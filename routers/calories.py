@@ -0,0 +1,72 @@
+from datetime import date
+
+from fastapi import Depends, APIRouter, HTTPException
+
+from schemas.dtos import CalorieSimulationDTO
+from services.functions import get_db, get_customer_profile, calculate_age, \
+    calculate_daily_calories_and_macros_batch, plans_from_batch, MINIMUM_DAILY_CALORIES
+from services.formulas import check_selection
+
+router = APIRouter(
+    prefix="/calories",
+    tags=["calories"]
+)
+
+@router.post("/simulate")
+async def simulate_daily_calorie_intake(simulation: CalorieSimulationDTO, db = Depends(get_db)):
+    """
+    Calculate the daily calorie intake of a customer for many hypothetical goals
+    in one vectorized pass. Nothing is written to the database.
+    """
+    try:
+        check_selection(simulation.bmr_formula, simulation.macro_profile)
+        customer_data = get_customer_profile(simulation.customer_id, db)
+
+        if not customer_data:
+            raise HTTPException(
+                status_code=404,
+                detail=f"the customer with id {simulation.customer_id} does not exist or is missing essential data"
+            )
+
+        # Same deadlines as the daily calorie intake endpoint, scenarios without a start date start today
+        if simulation.from_start_date:
+            deadlines = [(x.end_date - (x.start_date or date.today())).days for x in simulation.scenarios]
+        else:
+            deadlines = [(x.end_date - customer_data["date"]).days for x in simulation.scenarios]
+
+        count = len(simulation.scenarios)
+        batch = calculate_daily_calories_and_macros_batch(
+            [customer_data["weight"]] * count,
+            [x.weight_goal for x in simulation.scenarios],
+            deadlines,
+            [customer_data["length"]] * count,
+            [calculate_age(customer_data["birth_date"])] * count,
+            [customer_data["gender"]] * count,
+            [customer_data["activity_level"]] * count,
+            [simulation.bmr_formula or customer_data.get("bmr_formula")] * count,
+            [simulation.macro_profile or customer_data.get("macro_profile")] * count
+        )
+        realism = (batch["total_daily_calories"] >= MINIMUM_DAILY_CALORIES).tolist()
+
+        return {
+            "customer_id": simulation.customer_id,
+            "customer_data": customer_data,
+            "scenarios": [
+                {
+                    "weight_goal": scenario.weight_goal,
+                    "start_date": scenario.start_date,
+                    "end_date": scenario.end_date,
+                    "deadline_in_days": deadline,
+                    "detailed_daily_cal_intake": plan,
+                    "realism": realistic
+                }
+                for scenario, deadline, plan, realistic
+                in zip(simulation.scenarios, deadlines, plans_from_batch(batch), realism)
+            ]
+        }
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
@@ -1,16 +1,37 @@
 from sqlalchemy import select
-from fastapi import Depends, APIRouter, HTTPException
+from fastapi import Depends, APIRouter, HTTPException, Query, Response
 from fastapi.responses import JSONResponse
-from typing import Optional
-from datetime import date
+from typing import Optional, Literal, Annotated
+from datetime import date, timedelta
 
 from schemas.dtos import CustomerDTO, ProgressDTO, GoalDTO, CustomerUpdateDTO
-from schemas.responses import CustomerResponse, CustomerProgressResponse, CustomerGoalResponse, SingleCustomerResponse
+from schemas.responses import CustomerResponse, CustomerProgressResponse, CustomerGoalResponse, SingleCustomerResponse, \
+    CustomerProgressBucketResponse
 from models.entities import Customer as CustomerTable
 from models.entities import Goal as GoalsTable
 from models.entities import Progress as ProgressTable
+from models.entities import DailyPlan as DailyPlanTable
+from models.entities import TdeeCalibration as TdeeCalibrationTable
+from models.entities import LeaderboardEntry as LeaderboardTable
+from models.entities import ProgressRollup as ProgressRollupTable
+from models.entities import ProgressStat as ProgressStatTable
+from models.entities import ProgressAnomaly as ProgressAnomalyTable
+from services.cache import plan_cache, invalidate_plan, invalidate_expiring_goals, get_generation, plan_generation, \
+    is_expiring, has_expiring_goals
+from services.pagination import paginate, get_page, set_next_cursor
+from services.daily_plans import refresh_daily_plan, get_daily_plan, get_customer_data, get_plan
+from services.leaderboard import refresh_leaderboard_entry
+from services.gym_stats import refresh_gym_stats
+from services.progress_rollups import refresh_progress_rollup, get_progress_buckets
+from services.progress_analytics import get_progress_analytics
+from services.anomalies import check_progress
+from services.schedules import calculate_schedules
+from services.forecasts import forecast_customers
+from services.calibration import calibrate_customer, CALIBRATION_FIELDS
+from services.formulas import check_selection
 from services.functions import get_db, violates_constraint, calculate_age, \
-    get_data_from_db_to_calculate, calculate_daily_calories_and_macros, calculate_daily_calories_all_customers
+    get_data_from_db_to_calculate, calculate_daily_calories_and_macros, calculate_daily_calories_all_customers, \
+    MINIMUM_DAILY_CALORIES
 
 # Define router endpoint
 router = APIRouter(
@@ -24,6 +45,9 @@ router = APIRouter(
 async def get_customer_by_name(
         first_name: Optional[str] = None,
         last_name: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        response: Response = None,
         db = Depends(get_db)
 ): # (;
     try:
@@ -54,8 +78,12 @@ async def get_customer_by_name(
                 select(CustomerTable)
             )
 
+        # Keyset pagination on id
+        statement = paginate(statement, [CustomerTable.id], cursor, limit)
+
         # Execute statement and store result
         result = db.execute(statement).scalars().all()
+        result, next_cursor = get_page(result, limit, lambda x: [x.id])
 
         # Check if customer is found in database
         if not result:
@@ -66,8 +94,10 @@ async def get_customer_by_name(
                        f"{last_name if last_name else ""}"
             )
 
+        set_next_cursor(response, next_cursor)
+
         # Convert response to response model
-        response = [
+        customers = [
             CustomerResponse(
                 id = x.id,
                 first_name=x.first_name,
@@ -82,7 +112,7 @@ async def get_customer_by_name(
         ]
 
         # Return data dictionary
-        return response
+        return customers
 
     except HTTPException as e:
         raise e
@@ -195,15 +225,37 @@ async def get_customer_goals(customer_id: int, db = Depends(get_db)):
         )
 
 @router.get("/{customer_id}/progress")
-async def get_customer_progress(customer_id: int, db = Depends(get_db)):
+async def get_customer_progress(
+    customer_id: int,
+    bucket: Optional[Literal["day", "week", "month"]] = None,
+    from_date: Annotated[Optional[date], Query(alias="from", description="Progress on or after this date")] = None,
+    to_date: Annotated[Optional[date], Query(alias="to", description="Progress on or before this date")] = None,
+    db = Depends(get_db)
+):
+    """
+    Progress of a customer, optionally per bucket. A date range only reads the
+    partitions of progress in the range.
+    """
     try:
-        # Define sqlalchemy statement
-        statement = (
-            select(ProgressTable)
-            .where(ProgressTable.customer_id==customer_id)
-        )
-        # Execute statement and store result
-        result = db.execute(statement).scalars().all()
+        if from_date and to_date and from_date > to_date:
+            raise HTTPException(status_code=422, detail="from must not be after to.")
+
+        if bucket:
+            # Minimum, maximum, mean and last weight per bucket, grouped in SQL
+            result = get_progress_buckets(customer_id, bucket, db, from_date,
+                                          to_date + timedelta(days=1) if to_date else None)
+        else:
+            # Define sqlalchemy statement
+            statement = (
+                select(ProgressTable)
+                .where(ProgressTable.customer_id==customer_id)
+            )
+            if from_date:
+                statement = statement.where(ProgressTable.date >= from_date)
+            if to_date:
+                statement = statement.where(ProgressTable.date <= to_date)
+            # Execute statement and store result
+            result = db.execute(statement).scalars().all()
 
         # Check if user has progress saved
         if not result:
@@ -213,13 +265,16 @@ async def get_customer_progress(customer_id: int, db = Depends(get_db)):
             )
 
         # Define results in goal response model
-        response = [
-            CustomerProgressResponse(
-                date=x.date,
-                weight=x.weight,
-            )
-            for x in result
-        ]
+        if bucket:
+            response = [CustomerProgressBucketResponse(**x) for x in result]
+        else:
+            response = [
+                CustomerProgressResponse(
+                    date=x.date,
+                    weight=x.weight,
+                )
+                for x in result
+            ]
 
         # Get customer details from database
         customer_details = db.query(CustomerTable).filter(CustomerTable.id == customer_id).first()
@@ -292,45 +347,95 @@ async def get_customer_progress_by_id(customer_id: int, db = Depends(get_db)):
             detail=f"An error occurred: {e}"
         )
 
+@router.get("/{customer_id}/progress/analytics")
+async def get_customer_progress_analytics(customer_id: int, db = Depends(get_db)):
+    """Rolling averages, week-over-week change and trend of every weigh-in, calculated in one query."""
+    try:
+        analytics = get_progress_analytics(customer_id, db)
+
+        if not analytics:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No progress found for customer with id {customer_id}"
+            )
+
+        return {"customer_id": customer_id, "analytics": analytics}
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
 @router.get("/{customer_id}/daily_calorie_intake")
 async def get_daily_calorie_intake(customer_id: int,
                                    from_start_date: Optional[bool] = False,
+                                   bmr_formula: Optional[str] = None,
+                                   macro_profile: Optional[str] = None,
                                    db = Depends(get_db)):
     try:
-        customer_data = get_data_from_db_to_calculate(customer_id, db)
+        # The formula and profile of the gym are used, unless the request selects others
+        selected = bmr_formula is not None or macro_profile is not None
+        check_selection(bmr_formula, macro_profile)
 
-        if not customer_data:
-            raise HTTPException(
-                status_code=404,
-                detail=f"the customer with id {customer_id} does not exist or is missing essential data"
-            )
+        # Plans cached by this replica are served until a write on any replica bumps the generation
+        generation = None if selected else get_generation(plan_generation(customer_id), db)
+        cached_response = None if selected else plan_cache.get((customer_id, bool(from_start_date)), generation)
+
+        if cached_response:
+            return cached_response
 
-        if from_start_date:
-            deadline_in_days = (customer_data["end_date"] - customer_data["start_date"]).days
+        # Serve the stored plan, kept up to date by the write endpoints
+        daily_plan = None if selected else get_daily_plan(customer_id, db)
+        detailed_daily_cal_intake = get_plan(daily_plan, from_start_date) if daily_plan else None
+
+        if detailed_daily_cal_intake:
+            customer_data = get_customer_data(daily_plan)
         else:
-            deadline_in_days =  (customer_data["end_date"] - customer_data["date"]).days
-
-        detailed_daily_cal_intake = calculate_daily_calories_and_macros(
-            customer_data["weight"],
-            customer_data["weight_goal"],
-            deadline_in_days,
-            customer_data["length"],
-            calculate_age(customer_data["birth_date"]),
-            customer_data["gender"],
-            customer_data["activity_level"]
-        )
+            customer_data = get_data_from_db_to_calculate(customer_id, db)
+
+            if not customer_data:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"the customer with id {customer_id} does not exist or is missing essential data"
+                )
+
+            if bmr_formula is not None:
+                customer_data["bmr_formula"] = bmr_formula
+            if macro_profile is not None:
+                customer_data["macro_profile"] = macro_profile
+
+            if from_start_date:
+                deadline_in_days = (customer_data["end_date"] - customer_data["start_date"]).days
+            else:
+                deadline_in_days =  (customer_data["end_date"] - customer_data["date"]).days
+
+            detailed_daily_cal_intake = calculate_daily_calories_and_macros(
+                customer_data["weight"],
+                customer_data["weight_goal"],
+                deadline_in_days,
+                customer_data["length"],
+                calculate_age(customer_data["birth_date"]),
+                customer_data["gender"],
+                customer_data["activity_level"],
+                customer_data.get("bmr_formula"),
+                customer_data.get("macro_profile")
+            )
 
         response_data = {"customer_data": customer_data,
                          "detailed_daily_cal_intake": detailed_daily_cal_intake}
 
 
-        if detailed_daily_cal_intake["total_daily_calories"] < 1200:
+        if detailed_daily_cal_intake["total_daily_calories"] < MINIMUM_DAILY_CALORIES:
             response_data["realism"] = False
             response_data["message"] = (f"the expected weight loss before the deadline is unrealistic "
                                         f"and results a calorie intake less than 1200 per day!")
         else:
             response_data["realism"] = True
 
+        if not selected:
+            plan_cache.set((customer_id, bool(from_start_date)), response_data, generation)
+
         return response_data
 
     except HTTPException as e:
@@ -339,6 +444,98 @@ async def get_daily_calorie_intake(customer_id: int,
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
 
+@router.get("/{customer_id}/daily_calorie_intake/schedule")
+async def get_daily_calorie_intake_schedule(customer_id: int, db = Depends(get_db)):
+    """
+    Day-by-day plan from today until the end date of the goal, recalculated for
+    the projected weight of every day.
+    """
+    try:
+        daily_plan = get_daily_plan(customer_id, db)
+        customer_data = get_customer_data(daily_plan) if daily_plan else get_data_from_db_to_calculate(customer_id, db)
+
+        if not customer_data:
+            raise HTTPException(
+                status_code=404,
+                detail=f"the customer with id {customer_id} does not exist or is missing essential data"
+            )
+
+        schedule = calculate_schedules([customer_data])[0]
+
+        if not schedule:
+            raise HTTPException(
+                status_code=400,
+                detail=f"the goal of the customer with id {customer_id} ended on {customer_data['end_date']}"
+            )
+
+        return {"customer_data": customer_data,
+                "schedule": schedule,
+                "realism": all(x["total_daily_calories"] >= MINIMUM_DAILY_CALORIES for x in schedule)}
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
+@router.get("/{customer_id}/forecast")
+async def get_weight_forecast(customer_id: int, history_days: Optional[int] = None, db = Depends(get_db)):
+    """
+    Forecast the weight at the end date of the goal from the trend of the recent
+    weigh-ins, and the date the goal is reached if the trend continues.
+    """
+    try:
+        if history_days is not None and history_days < 1:
+            raise HTTPException(status_code=422, detail="history_days must be at least 1.")
+
+        rows, forecasts = forecast_customers(db, customer_id=customer_id, history_days=history_days)
+
+        if not rows:
+            raise HTTPException(status_code=404, detail=f"Customer with id {customer_id} does not exist")
+
+        if "error" in forecasts[0]:
+            raise HTTPException(
+                status_code=404,
+                detail=f"the customer with id {customer_id} has no goal or not enough recent progress to forecast"
+            )
+
+        return {"customer_id": customer_id, "forecast": forecasts[0]}
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
+@router.get("/{customer_id}/calibration")
+async def get_tdee_calibration(customer_id: int, db = Depends(get_db)):
+    """
+    Energy expenditure observed from the weigh-ins since the start of the goal
+    and the activity level that matches it. Served from the nightly calibration
+    job, or calculated now for customers it has not calibrated.
+    """
+    try:
+        calibration = db.get(TdeeCalibrationTable, customer_id)
+
+        if calibration:
+            calibration = {column: getattr(calibration, column) for column in CALIBRATION_FIELDS}
+        else:
+            calibration = calibrate_customer(customer_id, db)
+
+        if not calibration:
+            raise HTTPException(
+                status_code=404,
+                detail=f"the customer with id {customer_id} does not exist or has not enough progress since the start of the goal"
+            )
+
+        return {"customer_id": customer_id, "calibration": calibration}
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
 ### POST REQUESTS ###
 @router.post("/")
 async def create_customer(customer: CustomerDTO, db = Depends(get_db)):
@@ -384,6 +581,8 @@ async def create_customer(customer: CustomerDTO, db = Depends(get_db)):
                 )
 
         db.add(customer) # Add entity to database
+        db.flush() # Assign the id for the gym statistics
+        refresh_gym_stats(customer.id, db)
         db.commit() # Commit changes
         db.refresh(customer) # Refresh database
 
@@ -421,12 +620,21 @@ async def create_progress_for_customer(customer_id: int, progress: ProgressDTO,
             )
         else:
             db.add(progress) # Add entity to database
+            db.flush() # Make the progress visible to the plan refresh
+            anomaly = check_progress(progress, db)
+            refresh_progress_rollup(customer_id, progress.date, db)
+            customer_data = get_data_from_db_to_calculate(customer_id, db) # Loaded once for both refreshes
+            refresh_daily_plan(customer_id, db, customer_data)
+            refresh_leaderboard_entry(customer_id, db, customer_data)
+            refresh_gym_stats(customer_id, db)
+            invalidate_plan(customer_id, db)
             db.commit() # Commit changes
             db.refresh(progress) # Refresh database
 
+        # Weigh-ins far from the running statistics of the customer are flagged
         return JSONResponse(
             status_code=201,
-            content={"message": f"Progress successfully saved."}
+            content={"message": f"Progress successfully saved.", "anomaly": anomaly}
         )
 
     except HTTPException as e:
@@ -465,6 +673,15 @@ async def create_goal_for_customer(customer_id: int, goal: GoalDTO, db = Depends
             )
         else:
             db.add(goal) # Add entity to database
+            db.flush() # Make the goal visible to the plan refresh
+            customer_data = get_data_from_db_to_calculate(customer_id, db)
+            refresh_daily_plan(customer_id, db, customer_data)
+            refresh_leaderboard_entry(customer_id, db, customer_data)
+            refresh_gym_stats(customer_id, db)
+            invalidate_plan(customer_id, db)
+            if is_expiring(goal.end_date):
+                gym_id = db.query(CustomerTable.gym_id).filter(CustomerTable.id == customer_id).scalar()
+                invalidate_expiring_goals(db, gym_id)
             db.commit() # Commit changes
             db.refresh(goal) # Refresh database
 
@@ -506,10 +723,20 @@ async def update_customer(customer_id, data: CustomerUpdateDTO, db = Depends(get
                 )
 
         customer_dict = data.dict(exclude_unset=True)
+        # The expiring goals list the name of the customer and are filtered by gym
+        listed = (customer.first_name, customer.last_name, customer.gym_id)
 
         for key, value in customer_dict.items():
             setattr(customer, key, value)
 
+        db.flush() # Make the changes visible to the plan refresh
+        customer_data = get_data_from_db_to_calculate(customer.id, db)
+        refresh_daily_plan(customer.id, db, customer_data)
+        refresh_leaderboard_entry(customer.id, db, customer_data)
+        refresh_gym_stats(customer.id, db)
+        invalidate_plan(customer.id, db)
+        if (customer.first_name, customer.last_name, customer.gym_id) != listed and has_expiring_goals(customer.id, db):
+            invalidate_expiring_goals(db, listed[2], customer.gym_id)
         db.commit() # Commit changes
         db.refresh(customer) # Refresh database
 
@@ -540,7 +767,17 @@ async def delete_customer(customer_id: int, db = Depends(get_db)):
                 detail=f"Customer {customer_id} does not exist."
             )
 
+        db.query(DailyPlanTable).filter(DailyPlanTable.customer_id == customer_id).delete()
+        db.query(TdeeCalibrationTable).filter(TdeeCalibrationTable.customer_id == customer_id).delete()
+        db.query(LeaderboardTable).filter(LeaderboardTable.customer_id == customer_id).delete()
+        db.query(ProgressRollupTable).filter(ProgressRollupTable.customer_id == customer_id).delete()
+        db.query(ProgressStatTable).filter(ProgressStatTable.customer_id == customer_id).delete()
+        db.query(ProgressAnomalyTable).filter(ProgressAnomalyTable.customer_id == customer_id).delete()
+        refresh_gym_stats(customer_id, db, removed=True)
+        if has_expiring_goals(customer_id, db):
+            invalidate_expiring_goals(db, customer.gym_id)
         db.delete(customer)
+        invalidate_plan(customer_id, db)
         db.commit()
 
         return JSONResponse(
@@ -1,11 +1,21 @@
+from typing import Optional, Annotated
+from datetime import date, timedelta
+
 from sqlalchemy import select
-from fastapi import Depends, APIRouter, HTTPException, Query
+from fastapi import Depends, APIRouter, HTTPException, Query, Response
 from fastapi.responses import JSONResponse
 
 from schemas.responses import GoalResponse
 from models.entities import Goal as GoalsTable
 from models.entities import Customer as CustomerTable
-from services.functions import get_db
+from models.entities import GoalOutcome as GoalOutcomeTable
+from services.functions import get_db, get_data_from_db_to_calculate
+from services.daily_plans import refresh_daily_plan
+from services.leaderboard import refresh_leaderboard_entry
+from services.gym_stats import refresh_gym_stats
+from services.cache import invalidate_plan, invalidate_expiring_goals, expiring_goals_cache, \
+    EXPIRING_GOALS_CACHED_WINDOWS, get_expiring_goals_generation, is_expiring
+from services.pagination import paginate, get_page, set_next_cursor
 
 router = APIRouter(
     prefix="/goals",
@@ -14,15 +24,27 @@ router = APIRouter(
 
 @router.get("/")
 async def read_goals(
-    start_date: str = Query(None, description="Filter by start date (YYYY-MM-DD)"),
-    end_date: str = Query(None, description="Filter by end date (YYYY-MM-DD)"),
+    start_date: Annotated[Optional[date], Query(description="Filter by start date (YYYY-MM-DD)")] = None,
+    end_date: Annotated[Optional[date], Query(description="Filter by end date (YYYY-MM-DD)")] = None,
+    from_date: Annotated[Optional[date], Query(alias="from", description="Goals ending on or after this date")] = None,
+    to_date: Annotated[Optional[date], Query(alias="to", description="Goals ending on or before this date")] = None,
+    customer_id: Annotated[Optional[int], Query(description="Goals of this customer")] = None,
+    gym_id: Annotated[Optional[int], Query(description="Goals of the members of this gym")] = None,
+    cursor: Annotated[Optional[str], Query(description="Cursor of the next page (X-Next-Cursor header)")] = None,
+    limit: Annotated[Optional[int], Query(description="Maximum number of goals per page")] = None,
+    response: Response = None,
     db=Depends(get_db)
 ):
     """
-    Fetch all goals. Optionally filter by start_date or end_date.
-    Includes customer details (first and last name).
+    Fetch all goals, one page at a time. Optionally filter by start_date or end_date,
+    by a range of end dates (from, to), by customer or by gym. Every filter is
+    served by an index: ix_goals_end_date_customer_id, ix_goals_customer_id_end_date
+    and ix_customers_gym_id. Includes customer details (first and last name).
     """
     try:
+        if from_date and to_date and from_date > to_date:
+            raise HTTPException(status_code=422, detail="from must not be after to.")
+
         # Define the base query with a join between GoalsTable and CustomerTable
         statement = (
             select(GoalsTable, CustomerTable.first_name, CustomerTable.last_name)
@@ -34,12 +56,21 @@ async def read_goals(
             statement = statement.where(GoalsTable.start_date == start_date)
         if end_date:
             statement = statement.where(GoalsTable.end_date == end_date)
+        if from_date:
+            statement = statement.where(GoalsTable.end_date >= from_date)
+        if to_date:
+            statement = statement.where(GoalsTable.end_date <= to_date)
+        if customer_id is not None:
+            statement = statement.where(GoalsTable.customer_id == customer_id)
+        if gym_id is not None:
+            statement = statement.where(CustomerTable.gym_id == gym_id)
 
-        # Order the results by end_date
-        statement = statement.order_by(GoalsTable.end_date)
+        # Order the results by end_date, with keyset pagination on (end_date, id)
+        statement = paginate(statement, [GoalsTable.end_date, GoalsTable.id], cursor, limit)
 
         # Execute the statement and retrieve results
         result = db.execute(statement).all()
+        result, next_cursor = get_page(result, limit, lambda x: [x[0].end_date, x[0].id])
 
         # Check if results are empty
         if not result:
@@ -48,8 +79,10 @@ async def read_goals(
                 detail="No goals found (matching the given criteria)."
             )
 
+        set_next_cursor(response, next_cursor)
+
         # Format the response data
-        response = [
+        goals = [
             GoalResponse(
                 id=goal.id,
                 customer_id=goal.customer_id,
@@ -62,7 +95,7 @@ async def read_goals(
         ]
 
         # Return the formatted response
-        return response
+        return goals
 
     except HTTPException as e:
         # Re-raise HTTPExceptions, no wrapping needed
@@ -75,6 +108,66 @@ async def read_goals(
             detail=f"Could not fetch goals: {e}"
         )
 
+@router.get("/expiring")
+async def read_expiring_goals(
+    within_days: Annotated[int, Query(description="Goals ending today or in the next days")] = 7,
+    gym_id: Annotated[Optional[int], Query(description="Only goals of members of this gym")] = None,
+    db=Depends(get_db)
+):
+    """
+    Fetch the goals ending in the next within_days days, soonest first, with a
+    range scan on ix_goals_end_date_customer_id. The common windows are cached
+    until midnight.
+    """
+    try:
+        if within_days < 0 or within_days > 365:
+            raise HTTPException(status_code=422, detail="within_days must be between 0 and 365.")
+
+        cache_key = (within_days, gym_id)
+        generation = None
+        if within_days in EXPIRING_GOALS_CACHED_WINDOWS:
+            generation = get_expiring_goals_generation(gym_id, db)
+            goals = expiring_goals_cache.get(cache_key, generation)
+            if goals is not None:
+                return goals
+
+        today = date.today()
+        statement = (
+            select(GoalsTable, CustomerTable.first_name, CustomerTable.last_name)
+            .join(CustomerTable, GoalsTable.customer_id == CustomerTable.id)
+            .where(GoalsTable.end_date >= today, GoalsTable.end_date <= today + timedelta(days=within_days))
+            .order_by(GoalsTable.end_date, GoalsTable.customer_id, GoalsTable.id)
+        )
+
+        if gym_id is not None:
+            statement = statement.where(CustomerTable.gym_id == gym_id)
+
+        goals = [
+            GoalResponse(
+                id=goal.id,
+                customer_id=goal.customer_id,
+                customer_name=f"{first_name} {last_name}",
+                weight_goal=goal.weight_goal,
+                start_date=goal.start_date,
+                end_date=goal.end_date,
+            )
+            for goal, first_name, last_name in db.execute(statement).all()
+        ]
+
+        if within_days in EXPIRING_GOALS_CACHED_WINDOWS:
+            expiring_goals_cache.set(cache_key, goals, generation)
+
+        return goals
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Could not fetch goals: {e}"
+        )
+
 @router.get("/{goals_id}", response_model=GoalResponse)
 async def get_goal_by_id(goals_id: int, db=Depends(get_db)):
     """
@@ -136,7 +229,20 @@ async def delete_goal(goal_id: int, db = Depends(get_db)):
                 detail=f"Goal with ID {goal_id} not found."
             )
 
+        customer_id = goal.customer_id
+        expiring = is_expiring(goal.end_date)
+
+        db.query(GoalOutcomeTable).filter(GoalOutcomeTable.goal_id == goal_id).delete()
         db.delete(goal)
+        db.flush() # Make the deletion visible to the plan refresh
+        customer_data = get_data_from_db_to_calculate(customer_id, db)
+        refresh_daily_plan(customer_id, db, customer_data)
+        refresh_leaderboard_entry(customer_id, db, customer_data)
+        refresh_gym_stats(customer_id, db)
+        invalidate_plan(customer_id, db)
+        if expiring:
+            gym_id = db.query(CustomerTable.gym_id).filter(CustomerTable.id == customer_id).scalar()
+            invalidate_expiring_goals(db, gym_id)
         db.commit()
 
         return JSONResponse(
@@ -1,10 +1,23 @@
-from fastapi import Depends, APIRouter, HTTPException
-from fastapi.responses import JSONResponse
-from typing import Optional
+from collections import Counter
+
+from fastapi import Depends, APIRouter, HTTPException, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Optional, Literal
 from schemas.dtos import GymDTO
 from models.entities import Gym, Customer
+from models.entities import LeaderboardEntry as LeaderboardTable
 from schemas.responses import GymResponse, CustomerResponse, SingleGymResponse
-from services.functions import get_db
+from services.functions import get_db, calculation_data_statement, calculate_plans_or_errors, \
+    stream_daily_calories_all_customers
+from services.schedules import stream_schedules
+from services.forecasts import forecast_customers
+from services.leaderboard import get_leaderboard, leaderboard_max_top
+from services.gym_stats import get_counters, stats_from_counters, remove_gym
+from services.progress_rollups import get_gym_weekly_series
+from services.progress_analytics import get_latest_analytics
+from services.goal_outcomes import get_gym_success_rate
+from services.formulas import check_selection
+from services.pagination import paginate, get_page, set_next_cursor, page_size, decode_cursor
 
 router = APIRouter(
     prefix="/gyms",
@@ -12,18 +25,24 @@ router = APIRouter(
 )
 
 @router.get("/")
-async def get_gyms(address_place: Optional[str] = None, db = Depends(get_db)):
+async def get_gyms(address_place: Optional[str] = None, cursor: Optional[str] = None, limit: Optional[int] = None,
+                   response: Response = None, db = Depends(get_db)):
     try:
         if address_place is None:
-            all_gyms = db.query(Gym).all()
+            all_gyms = paginate(db.query(Gym), [Gym.id], cursor, limit).all()
+            all_gyms, next_cursor = get_page(all_gyms, limit, lambda x: [x.id])
             # check if the gyms table in database has rows
             if all_gyms:
+                set_next_cursor(response, next_cursor)
+
                 # make an array of gyms with certain structure
                 gyms_structured = [
                     GymResponse(
                         id=gym.id,
                         name=gym.name,
-                        address_place=gym.address_place
+                        address_place=gym.address_place,
+                        bmr_formula=gym.bmr_formula,
+                        macro_profile=gym.macro_profile
                     )
                     for gym in all_gyms
                 ]
@@ -35,15 +54,20 @@ async def get_gyms(address_place: Optional[str] = None, db = Depends(get_db)):
 
         # if a city name WAS given in the request
         else:
-            gyms = db.query(Gym).filter(Gym.address_place == address_place).all()
+            gyms = paginate(db.query(Gym).filter(Gym.address_place == address_place), [Gym.id], cursor, limit).all()
+            gyms, next_cursor = get_page(gyms, limit, lambda x: [x.id])
 
             if not gyms:
                 raise HTTPException(status_code=404, detail=f"No gyms found in {address_place}")
 
+            set_next_cursor(response, next_cursor)
+
             return [GymResponse(
                 id=gym.id,
                 name=gym.name,
-                address_place=gym.address_place
+                address_place=gym.address_place,
+                bmr_formula=gym.bmr_formula,
+                macro_profile=gym.macro_profile
             ) for gym in gyms]
 
     except HTTPException as e:
@@ -55,9 +79,13 @@ async def get_gyms(address_place: Optional[str] = None, db = Depends(get_db)):
 @router.post("/")
 async def create_gym(gym: GymDTO, db = Depends(get_db)):
     try:
+        check_selection(gym.bmr_formula, gym.macro_profile)
+
         gym= Gym(
             name=gym.name,
-            address_place=gym.address_place
+            address_place=gym.address_place,
+            bmr_formula=gym.bmr_formula,
+            macro_profile=gym.macro_profile
         ) # Create db entity from data
 
         # Check if a gym with same values already exists
@@ -80,6 +108,26 @@ async def create_gym(gym: GymDTO, db = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
 
+@router.get("/stats")
+async def get_stats_of_all_gyms(db = Depends(get_db)):
+    """Member statistics of every gym and of the company, from the maintained counters."""
+    try:
+        counters = get_counters(db)
+        total = Counter()
+        for gym_counters in counters.values():
+            total.update(gym_counters)
+
+        return {
+            "total": stats_from_counters(total),
+            "data": {
+                gym.id: {"gym": gym.name, **stats_from_counters(counters.get(gym.id, Counter()))}
+                for gym in db.query(Gym).order_by(Gym.id)
+            }
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
 @router.get("/{gym_id}")
 async def get_gym_by_id(gym_id: int, db = Depends(get_db)):
     try:
@@ -91,7 +139,9 @@ async def get_gym_by_id(gym_id: int, db = Depends(get_db)):
         gym_to_return = SingleGymResponse(
             id=gym.id,
             name=gym.name,
-            address_place=gym.address_place
+            address_place=gym.address_place,
+            bmr_formula=gym.bmr_formula,
+            macro_profile=gym.macro_profile
         )
 
         return gym_to_return
@@ -110,6 +160,9 @@ async def delete_gym_by_id(gym_id: int, db = Depends(get_db)):
         if gym is None:
             raise HTTPException(status_code=404, detail=f"Gym with id {gym_id} not found")
 
+        # Members are detached from the gym, so are their leaderboard entries
+        db.query(LeaderboardTable).filter(LeaderboardTable.gym_id == gym_id).update({"gym_id": None})
+        remove_gym(gym_id, db)
         db.delete(gym)
         db.commit()
 
@@ -126,17 +179,21 @@ async def delete_gym_by_id(gym_id: int, db = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
 
 @router.get("/{gym_id}/customers")
-async def get_customers_by_gym_id(gym_id: int, db = Depends(get_db)):
+async def get_customers_by_gym_id(gym_id: int, cursor: Optional[str] = None, limit: Optional[int] = None,
+                                  response: Response = None, db = Depends(get_db)):
     try:
         gym = db.query(Gym).filter(Gym.id == gym_id).first()
         if not gym:
             raise HTTPException(status_code=404, detail=f"Gym with id {gym_id} does not exist")
 
-        customers = db.query(Customer).filter(Customer.gym_id == gym_id).all()
+        customers = paginate(db.query(Customer).filter(Customer.gym_id == gym_id), [Customer.id], cursor, limit).all()
+        customers, next_cursor = get_page(customers, limit, lambda x: [x.id])
         # check if the customers variable empty
         if not customers:
             raise HTTPException(status_code=404, detail=f"Gym with id {gym_id} has no customers")
 
+        set_next_cursor(response, next_cursor)
+
         return {
             "gym": gym.name,
             "customers": [
@@ -157,4 +214,179 @@ async def get_customers_by_gym_id(gym_id: int, db = Depends(get_db)):
         raise e
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
+@router.get("/{gym_id}/daily_intake")
+async def get_daily_intake_by_gym_id(gym_id: int, from_start_date: Optional[bool] = False,
+                                     stream: Optional[Literal["ndjson"]] = None, cursor: Optional[str] = None,
+                                     limit: Optional[int] = None, response: Response = None, db = Depends(get_db)):
+    try:
+        gym = db.query(Gym).filter(Gym.id == gym_id).first()
+        if not gym:
+            raise HTTPException(status_code=404, detail=f"Gym with id {gym_id} does not exist")
+
+        # Streaming mode, one NDJSON line per member
+        if stream == "ndjson":
+            return StreamingResponse(
+                stream_daily_calories_all_customers(from_start_date, db, gym_id),
+                media_type="application/x-ndjson"
+            )
+
+        # One page of members, loaded and calculated in one batch
+        min_id = decode_cursor(cursor, [Customer.id])[0] + 1 if cursor else None
+        size = page_size(limit) + 1
+        # A single page is fetched at once, without the server-side cursor of the bulk loader
+        rows = [dict(row) for row in
+                db.execute(calculation_data_statement(gym_id, min_id=min_id, limit=size)).mappings()]
+        rows, next_cursor = get_page(rows, limit, lambda x: [x["customer_id"]])
+
+        if not rows:
+            raise HTTPException(status_code=404, detail=f"Gym with id {gym_id} has no customers")
+
+        set_next_cursor(response, next_cursor)
+
+        return {
+            "gym": gym.name,
+            "data": {
+                row["customer_id"]: plan
+                for row, plan in zip(rows, calculate_plans_or_errors(rows, from_start_date))
+            }
+        }
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
+@router.get("/{gym_id}/daily_intake/schedule")
+async def get_daily_intake_schedules_by_gym_id(gym_id: int, db = Depends(get_db)):
+    """Day-by-day plans of all members as NDJSON, one line per member."""
+    try:
+        gym = db.query(Gym).filter(Gym.id == gym_id).first()
+        if not gym:
+            raise HTTPException(status_code=404, detail=f"Gym with id {gym_id} does not exist")
+
+        return StreamingResponse(stream_schedules(db, gym_id), media_type="application/x-ndjson")
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
+@router.get("/{gym_id}/forecast")
+async def get_weight_forecasts_by_gym_id(gym_id: int, history_days: Optional[int] = None, db = Depends(get_db)):
+    """Weight forecasts of all members, fitted in one batch."""
+    try:
+        if history_days is not None and history_days < 1:
+            raise HTTPException(status_code=422, detail="history_days must be at least 1.")
+
+        gym = db.query(Gym).filter(Gym.id == gym_id).first()
+        if not gym:
+            raise HTTPException(status_code=404, detail=f"Gym with id {gym_id} does not exist")
+
+        rows, forecasts = forecast_customers(db, gym_id=gym_id, history_days=history_days)
+
+        if not rows:
+            raise HTTPException(status_code=404, detail=f"Gym with id {gym_id} has no customers")
+
+        return {
+            "gym": gym.name,
+            "data": {row["customer_id"]: forecast for row, forecast in zip(rows, forecasts)}
+        }
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
+@router.get("/{gym_id}/leaderboard")
+async def get_leaderboard_by_gym_id(gym_id: int, top: Optional[int] = 10, db = Depends(get_db)):
+    """Members ranked by the percentage of their weight goal achieved, read from the maintained leaderboard."""
+    try:
+        if top is None or top < 1 or top > leaderboard_max_top:
+            raise HTTPException(status_code=422, detail=f"top must be between 1 and {leaderboard_max_top}.")
+
+        gym = db.query(Gym).filter(Gym.id == gym_id).first()
+        if not gym:
+            raise HTTPException(status_code=404, detail=f"Gym with id {gym_id} does not exist")
+
+        return {
+            "gym": gym.name,
+            "data": [
+                {"rank": rank, **entry}
+                for rank, entry in enumerate(get_leaderboard(gym_id, top, db), start=1)
+            ]
+        }
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
+@router.get("/{gym_id}/stats")
+async def get_stats_by_gym_id(gym_id: int, db = Depends(get_db)):
+    """Member statistics of a gym, from the maintained counters."""
+    try:
+        gym = db.query(Gym).filter(Gym.id == gym_id).first()
+        if not gym:
+            raise HTTPException(status_code=404, detail=f"Gym with id {gym_id} does not exist")
+
+        return {"gym": gym.name, **stats_from_counters(get_counters(db, gym_id).get(gym_id, Counter()))}
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
+@router.get("/{gym_id}/progress/weekly")
+async def get_weekly_progress_by_gym_id(gym_id: int, db = Depends(get_db)):
+    """Average weight of the members per week, from the weekly progress rollups."""
+    try:
+        gym = db.query(Gym).filter(Gym.id == gym_id).first()
+        if not gym:
+            raise HTTPException(status_code=404, detail=f"Gym with id {gym_id} does not exist")
+
+        return {"gym": gym.name, "data": get_gym_weekly_series(gym_id, db)}
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
+@router.get("/{gym_id}/progress/analytics")
+async def get_latest_progress_analytics_by_gym_id(gym_id: int, db = Depends(get_db)):
+    """Rolling metrics of the latest weigh-in of every member, in one query."""
+    try:
+        gym = db.query(Gym).filter(Gym.id == gym_id).first()
+        if not gym:
+            raise HTTPException(status_code=404, detail=f"Gym with id {gym_id} does not exist")
+
+        return {"gym": gym.name, "data": get_latest_analytics(gym_id, db)}
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
+@router.get("/{gym_id}/goal_outcomes")
+async def get_goal_outcomes_by_gym_id(gym_id: int, db = Depends(get_db)):
+    """Success rate of the ended goals of the members, from the outcomes of the nightly evaluation."""
+    try:
+        gym = db.query(Gym).filter(Gym.id == gym_id).first()
+        if not gym:
+            raise HTTPException(status_code=404, detail=f"Gym with id {gym_id} does not exist")
+
+        return {"gym": gym.name, **get_gym_success_rate(gym_id, db)}
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
@@ -1,9 +1,12 @@
-from typing import Optional
+from typing import Optional, Annotated
+from datetime import date
 
-from fastapi import Depends, APIRouter, HTTPException
-from models.entities import Progress, Customer
-from schemas.responses import ProgressResponse
+from fastapi import Depends, APIRouter, HTTPException, Query, Response
+from models.entities import Progress, Customer, ProgressAnomaly
+from schemas.responses import ProgressResponse, ProgressAnomalyResponse
 from services.functions import get_db
+from services.pagination import paginate, get_page, set_next_cursor
+from services.anomalies import get_anomalies_statement
 
 router = APIRouter(
     prefix="/progress",
@@ -11,12 +14,46 @@ router = APIRouter(
 )
 
 @router.get("/")
-async def get_progress(db = Depends(get_db)):
+async def get_progress(
+    from_date: Annotated[Optional[date], Query(alias="from", description="Progress on or after this date")] = None,
+    to_date: Annotated[Optional[date], Query(alias="to", description="Progress on or before this date")] = None,
+    customer_id: Annotated[Optional[int], Query(description="Progress of this customer")] = None,
+    gym_id: Annotated[Optional[int], Query(description="Progress of the members of this gym")] = None,
+    cursor: Optional[str] = None, limit: Optional[int] = None, response: Response = None, db = Depends(get_db)
+):
+    """
+    Fetch all progress, one page at a time. Filtered lists are ordered by date and
+    served by an index: ix_progress_date_id, ix_progress_customer_id_date and
+    ix_customers_gym_id. A date range only reads the partitions of progress in the range.
+    """
     try:
-        progresses = db.query(Progress).all()
+        if from_date and to_date and from_date > to_date:
+            raise HTTPException(status_code=422, detail="from must not be after to.")
+
+        query = db.query(Progress)
+        filtered = from_date or to_date or customer_id is not None or gym_id is not None
+
+        if from_date:
+            query = query.filter(Progress.date >= from_date)
+        if to_date:
+            query = query.filter(Progress.date <= to_date)
+        if customer_id is not None:
+            query = query.filter(Progress.customer_id == customer_id)
+        if gym_id is not None:
+            query = query.join(Customer, Customer.id == Progress.customer_id).filter(Customer.gym_id == gym_id)
+
+        # Keyset pagination on (date, id) when filtered, so the filter index also gives the order
+        if filtered:
+            progresses = paginate(query, [Progress.date, Progress.id], cursor, limit).all()
+            progresses, next_cursor = get_page(progresses, limit, lambda x: [x.date, x.id])
+        else:
+            progresses = paginate(query, [Progress.id], cursor, limit).all()
+            progresses, next_cursor = get_page(progresses, limit, lambda x: [x.id])
         if not progresses:
             raise HTTPException(status_code=404, detail="no progresses found")
 
+        set_next_cursor(response, next_cursor)
+
         return [
             ProgressResponse(
                 id=progress.id,
@@ -32,10 +69,51 @@ async def get_progress(db = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
 
+@router.get("/anomalies")
+async def get_progress_anomalies(customer_id: Optional[int] = None, cursor: Optional[str] = None,
+                                 limit: Optional[int] = None, response: Response = None, db = Depends(get_db)):
+    """Weigh-ins that were flagged as outliers when they were stored, oldest first."""
+    try:
+        anomalies = db.execute(
+            paginate(get_anomalies_statement(customer_id), [ProgressAnomaly.id], cursor, limit)
+        ).scalars().all()
+        anomalies, next_cursor = get_page(anomalies, limit, lambda x: [x.id])
+
+        set_next_cursor(response, next_cursor)
+
+        return [
+            ProgressAnomalyResponse(
+                id=anomaly.id,
+                progress_id=anomaly.progress_id,
+                customer_id=anomaly.customer_id,
+                date=anomaly.date,
+                weight=anomaly.weight,
+                expected_weight=anomaly.expected_weight,
+                std=anomaly.std,
+                z_score=anomaly.z_score,
+                detected_on=anomaly.detected_on
+            ) for anomaly in anomalies
+        ]
+
+    except HTTPException as e:
+        raise e
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
 @router.get("/{progress_id}")
-async def get_progress_by_id(progress_id: int, db = Depends(get_db)):
+async def get_progress_by_id(
+    progress_id: int,
+    progress_date: Annotated[Optional[date], Query(alias="date", description="Date of the progress, "
+                                                                           "so only its partition is read")] = None,
+    db = Depends(get_db)
+):
     try:
-        progress = db.query(Progress).filter(Progress.id == progress_id).first()
+        conditions = [Progress.id == progress_id]
+        if progress_date:
+            conditions.append(Progress.date == progress_date)
+
+        progress = db.query(Progress).filter(*conditions).first()
         if not progress:
             raise HTTPException(status_code=404, detail=f"No progress found with id '{progress_id}'")
 
@@ -1,8 +1,11 @@
-from typing import Optional
+from typing import Optional, List, Annotated
 
-from pydantic import BaseModel, PositiveInt, PastDate, FutureDate, PositiveFloat
+from pydantic import BaseModel, PositiveInt, PastDate, FutureDate, PositiveFloat, Field, model_validator
 from datetime import date
 
+# Maximum number of goal scenarios in one calorie simulation
+MAX_SCENARIOS = 5000
+
 
 # DTO (Data Transfer Object)
 
@@ -33,6 +36,8 @@ class CustomerUpdateDTO(BaseModel):
 class GymDTO(BaseModel):
     name: str
     address_place: str
+    bmr_formula: Optional[str] = None
+    macro_profile: Optional[str] = None
 
 class ProgressDTO(BaseModel):
     weight: PositiveInt
@@ -42,3 +47,20 @@ class GoalDTO(BaseModel):
     start_date: date
     end_date: FutureDate
 
+class GoalScenarioDTO(BaseModel):
+    weight_goal: PositiveInt
+    start_date: Optional[date] = None
+    end_date: FutureDate
+
+    @model_validator(mode="after")
+    def check_dates(self):
+        if self.start_date and self.start_date >= self.end_date:
+            raise ValueError("End date must be after start date")
+        return self
+
+class CalorieSimulationDTO(BaseModel):
+    customer_id: PositiveInt
+    from_start_date: bool = False
+    bmr_formula: Optional[str] = None
+    macro_profile: Optional[str] = None
+    scenarios: Annotated[List[GoalScenarioDTO], Field(min_length=1, max_length=MAX_SCENARIOS)]
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel, PositiveInt, PositiveFloat, PastDate
 from datetime import date
 
@@ -34,11 +36,15 @@ class GymResponse(BaseModel):
     id: int
     name: str
     address_place: str
+    bmr_formula: Optional[str] = None
+    macro_profile: Optional[str] = None
 
 class SingleGymResponse(BaseModel):
     id: int
     name: str
     address_place: str
+    bmr_formula: Optional[str] = None
+    macro_profile: Optional[str] = None
 
 class ProgressResponse(BaseModel):
     id: PositiveInt
@@ -46,10 +52,29 @@ class ProgressResponse(BaseModel):
     date: date
     weight: PositiveInt
 
+class ProgressAnomalyResponse(BaseModel):
+    id: PositiveInt
+    progress_id: PositiveInt
+    customer_id: PositiveInt
+    date: date
+    weight: PositiveInt
+    expected_weight: float
+    std: float
+    z_score: float
+    detected_on: date
+
 class CustomerProgressResponse(BaseModel):
     date: date
     weight: PositiveInt
 
+class CustomerProgressBucketResponse(BaseModel):
+    bucket: date
+    measurements: PositiveInt
+    min_weight: PositiveInt
+    max_weight: PositiveInt
+    mean_weight: PositiveFloat
+    last_weight: PositiveInt
+
 class CustomerGoalResponse(BaseModel):
     id: int
     weight_goal: PositiveInt
@@ -0,0 +1,157 @@
+import os
+import math
+from datetime import date
+
+from sqlalchemy import select, insert, delete
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models.entities import Progress as ProgressTable
+from models.entities import ProgressStat as ProgressStatTable
+from models.entities import ProgressAnomaly as ProgressAnomalyTable
+from services.functions import SessionLocal, bulk_chunk_size, lock_customer
+
+# Weigh-ins further than this many standard deviations from the mean of the customer are anomalies
+anomaly_z_score = float(os.getenv("ANOMALY_Z_SCORE", 3))
+# Weigh-ins are only checked once the customer has this many earlier weigh-ins
+anomaly_min_measurements = int(os.getenv("ANOMALY_MIN_MEASUREMENTS", 5))
+# Lower bound of the standard deviation in kg, so a customer with a very stable weight is not flagged for every kilo
+anomaly_min_std = float(os.getenv("ANOMALY_MIN_STD", 1))
+
+def update_stats(count, mean, m2, weight):
+    """One step of Welford's algorithm: the count, mean and sum of squared deviations with one more weight"""
+    count += 1
+    delta = weight - mean
+    mean += delta / count
+    m2 += delta * (weight - mean)
+
+    return count, mean, m2
+
+def check_weight(count, mean, m2, weight):
+    """
+    Check a weight against the running statistics of the earlier weigh-ins.
+
+    Returns:
+    - The anomaly (expected weight, standard deviation and z-score), or None
+    """
+    if count < anomaly_min_measurements:
+        return None
+
+    std = max(math.sqrt(m2 / (count - 1)), anomaly_min_std)
+    z_score = (weight - mean) / std
+
+    if abs(z_score) <= anomaly_z_score:
+        return None
+
+    return {"expected_weight": round(mean, 2), "std": round(std, 2), "z_score": round(z_score, 2)}
+
+def check_progress(progress, db):
+    """
+    Check a new weigh-in against the statistics of the customer, record it when
+    it is an anomaly and add it to the statistics. Reads and writes one state
+    row, no history. Must be called before the commit of the weigh-in, after a flush.
+
+    Returns:
+    - The anomaly, or None
+    """
+    # The state is read and replaced under the lock of the customer, concurrent weigh-ins wait
+    lock_customer(progress.customer_id, db)
+
+    state = db.execute(
+        select(ProgressStatTable.count, ProgressStatTable.mean, ProgressStatTable.m2)
+        .where(ProgressStatTable.customer_id == progress.customer_id)
+    ).fetchone()
+    state = dict(state._mapping) if state else None
+    count, mean, m2 = (state["count"], state["mean"], state["m2"]) if state else (0, 0.0, 0.0)
+
+    anomaly = check_weight(count, mean, m2, progress.weight)
+    if anomaly:
+        db.execute(insert(ProgressAnomalyTable).values(
+            progress_id=progress.id,
+            customer_id=progress.customer_id,
+            date=progress.date,
+            weight=progress.weight,
+            detected_on=date.today(),
+            **anomaly
+        ))
+
+    count, mean, m2 = update_stats(count, mean, m2, progress.weight)
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(ProgressStatTable).values(customer_id=progress.customer_id,
+                                                         count=count, mean=mean, m2=m2)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=["customer_id"],
+        set_={"count": statement.excluded.count, "mean": statement.excluded.mean, "m2": statement.excluded.m2}
+    ))
+
+    return anomaly
+
+def get_anomalies_statement(customer_id=None):
+    """The recorded anomalies, of all customers or one"""
+    statement = select(ProgressAnomalyTable)
+    if customer_id is not None:
+        statement = statement.where(ProgressAnomalyTable.customer_id == customer_id)
+
+    return statement
+
+def rescan_progress(db):
+    """
+    Rebuild the statistics and anomalies of all customers in one pass over the
+    progress table, in the order the weigh-ins were stored, fetched and written
+    in chunks of bulk_chunk_size rows.
+
+    Returns:
+    - Number of customers and number of anomalies
+    """
+    db.execute(delete(ProgressAnomalyTable))
+    db.execute(delete(ProgressStatTable))
+
+    result = db.execute(
+        select(ProgressTable.id, ProgressTable.customer_id, ProgressTable.date, ProgressTable.weight)
+        # Progress of deleted customers is left behind without a customer
+        .where(ProgressTable.customer_id.isnot(None))
+        .order_by(ProgressTable.customer_id, ProgressTable.date, ProgressTable.id)
+        .execution_options(yield_per=bulk_chunk_size)
+    )
+
+    customers = anomalies = 0
+    customer_id, state = None, None
+
+    for rows in result.partitions():
+        stats, found = [], []
+
+        for progress_id, row_customer_id, row_date, weight in rows:
+            if row_customer_id != customer_id:
+                if state:
+                    stats.append(dict(zip(("customer_id", "count", "mean", "m2"), (customer_id, *state))))
+                customer_id, state = row_customer_id, (0, 0.0, 0.0)
+                customers += 1
+
+            anomaly = check_weight(*state, weight)
+            if anomaly:
+                found.append({"progress_id": progress_id, "customer_id": customer_id, "date": row_date,
+                              "weight": weight, "detected_on": date.today(), **anomaly})
+
+            state = update_stats(*state, weight)
+
+        if stats:
+            db.execute(insert(ProgressStatTable), stats)
+        if found:
+            db.execute(insert(ProgressAnomalyTable), found)
+            anomalies += len(found)
+
+    if state:
+        db.execute(insert(ProgressStatTable).values(customer_id=customer_id, count=state[0], mean=state[1],
+                                                    m2=state[2]))
+
+    db.commit()
+
+    return customers, anomalies
+
+if __name__ == "__main__":
+    # Full rescan: python -m services.anomalies
+    session = SessionLocal()
+    try:
+        customers, anomalies = rescan_progress(session)
+        print(f"Rescanned the progress of {customers} customers, found {anomalies} anomalies")
+    finally:
+        session.close()
@@ -0,0 +1,212 @@
+import os
+import socket
+from collections import OrderedDict
+from datetime import date, timedelta
+from threading import Lock
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models.entities import CacheGeneration as CacheGenerationTable
+from models.entities import Goal as GoalsTable
+from models.entities import Gym as GymTable
+
+class MidnightCache:
+    """
+    Bounded LRU cache whose entries expire at midnight.
+
+    Used for results that depend on date.today(), like the calorie plans
+    (through calculate_age and the goal deadline).
+
+    Every replica of the API has its own cache. Entries are stored with the
+    generation of their data (see get_generation), an entry of an older
+    generation was invalidated by a write on any replica and is not served.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, generation=None):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            cached_on, cached_generation, value = entry
+
+            # Stored before midnight
+            if cached_on != date.today():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            # Invalidated by a write, possibly on another replica
+            if cached_generation != generation:
+                del self._entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            self._entries[key] = (date.today(), generation, value)
+            self._entries.move_to_end(key)
+
+            # Evict the least recently used entries
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def invalidate_all(self):
+        """Remove all entries, counted as invalidations."""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._reset_counters()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
+
+def get_generation(name, db):
+    """Generation of shared cached data, 0 before the first write"""
+    return db.execute(select(CacheGenerationTable.generation).where(CacheGenerationTable.name == name)).scalar() or 0
+
+def bump_generation(name, db):
+    """
+    Invalidate cached data on every replica, with an atomic increment of its
+    generation. Must be called before the commit of the change, so the new
+    generation becomes visible together with the new data.
+    """
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(CacheGenerationTable).values(name=name, generation=1)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"generation": CacheGenerationTable.generation + 1}
+    ))
+
+# Calorie plans per (customer id, from_start_date), with one generation per customer
+plan_cache = MidnightCache(max_size=int(os.getenv("PLAN_CACHE_SIZE", 10000)))
+
+def plan_generation(customer_id):
+    return f"plans:{int(customer_id)}"
+
+def invalidate_plan(customer_id, db):
+    """Invalidate the cached plans of a customer on every replica, call before committing a change to their data."""
+    bump_generation(plan_generation(customer_id), db)
+    plan_cache.invalidate((int(customer_id), False), (int(customer_id), True))
+
+# Goals ending within the common windows, per (within_days, gym id), with one generation per gym
+expiring_goals_cache = MidnightCache(max_size=int(os.getenv("EXPIRING_GOALS_CACHE_SIZE", 1000)))
+EXPIRING_GOALS_CACHED_WINDOWS = (7, 14, 30)
+
+def expiring_goals_generation(gym_id):
+    """Generation of the expiring goals of the members of a gym, None for the customers without a gym"""
+    return f"expiring_goals:{'' if gym_id is None else int(gym_id)}"
+
+def get_expiring_goals_generation(gym_id, db):
+    """
+    Generation of the cached expiring goals of a gym. The goals of all gyms
+    (gym_id None) are cached with the generations of every gym and of the
+    customers without one, which change when any of them does.
+    """
+    if gym_id is not None:
+        return get_generation(expiring_goals_generation(gym_id), db)
+
+    names = [expiring_goals_generation(None)]
+    names.extend(expiring_goals_generation(id) for id in db.execute(select(GymTable.id)).scalars())
+
+    return tuple(
+        (name, generation) for name, generation in db.execute(
+            select(CacheGenerationTable.name, CacheGenerationTable.generation)
+            .where(CacheGenerationTable.name.in_(names))
+            .order_by(CacheGenerationTable.name)
+        )
+    )
+
+def is_expiring(end_date, today=None):
+    """Whether a goal ending on end_date is in one of the cached windows"""
+    today = today or date.today()
+    return today <= end_date <= today + timedelta(days=max(EXPIRING_GOALS_CACHED_WINDOWS))
+
+def has_expiring_goals(customer_id, db):
+    """Whether a customer has a goal in one of the cached windows, with a range scan on ix_goals_customer_id_end_date"""
+    today = date.today()
+    return db.execute(
+        select(GoalsTable.id)
+        .where(GoalsTable.customer_id == customer_id,
+               GoalsTable.end_date.between(today, today + timedelta(days=max(EXPIRING_GOALS_CACHED_WINDOWS))))
+        .limit(1)
+    ).first() is not None
+
+def invalidate_expiring_goals(db, *gym_ids):
+    """
+    Invalidate the cached expiring goals of gyms (None for the customers without
+    a gym) on every replica, call before committing a change to an expiring goal
+    (see is_expiring) or to the name or gym of a customer with one. Only the
+    generations of these gyms are bumped, in a fixed order, so writes to other
+    gyms do not wait for the same rows.
+    """
+    for name in sorted({expiring_goals_generation(gym_id) for gym_id in gym_ids}):
+        bump_generation(name, db)
+
+    expiring_goals_cache.invalidate(*(
+        (within_days, gym_id) for within_days in EXPIRING_GOALS_CACHED_WINDOWS for gym_id in {*gym_ids, None}
+    ))
+
+def get_cache_stats(db):
+    """
+    Counters of the caches of this replica, plus the writes that invalidated
+    cached data on all replicas (the sum of the generations).
+    """
+    is_plan = CacheGenerationTable.name.like("plans:%")
+    is_expiring_goals = CacheGenerationTable.name.like("expiring_goals:%")
+    shared = db.execute(
+        select(
+            func.coalesce(func.sum(CacheGenerationTable.generation).filter(is_plan), 0).label("plans"),
+            func.coalesce(func.sum(CacheGenerationTable.generation).filter(is_expiring_goals), 0)
+            .label("expiring_goals")
+        )
+    ).one()
+
+    return {
+        "replica": socket.gethostname(),
+        "plans": {**plan_cache.stats(), "shared_invalidations": shared.plans},
+        "expiring_goals": {**expiring_goals_cache.stats(), "shared_invalidations": shared.expiring_goals}
+    }
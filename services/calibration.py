@@ -0,0 +1,190 @@
+import os
+from datetime import date
+
+import numpy as np
+from sqlalchemy import select, insert, delete, func, and_
+
+from models.entities import Goal as GoalsTable
+from models.entities import Progress as ProgressTable
+from models.entities import TdeeCalibration as TdeeCalibrationTable
+from services.forecasts import fit_trends
+from services.functions import SessionLocal, calculate_age, calculation_data_statement, \
+    calculate_daily_calories_and_macros_batch, has_calculation_data, MINIMUM_ACTIVITY_LEVEL, \
+    MAXIMUM_ACTIVITY_LEVEL
+from services.leaderboard import start_weight_subquery
+
+# Customers per chunk of the calibration job
+calibration_chunk_size = int(os.getenv("CALIBRATION_CHUNK_SIZE", 2000))
+# Weigh-ins must span at least this many days for a calibration
+calibration_min_days = int(os.getenv("CALIBRATION_MIN_DAYS", 14))
+
+# Columns of TdeeCalibrationTable returned by the endpoint
+CALIBRATION_FIELDS = ("calculated_on", "measurements", "weight_trend", "planned_intake", "bmr",
+                      "observed_tdee", "activity_level", "suggested_activity_level")
+
+def calibration_data_statement(min_id=None, max_id=None):
+    """
+    The calculation data of calculation_data_statement plus the weight at the
+    start of the goal (start_weight), the weight the plan from the start of the
+    goal was made for.
+    """
+    data = calculation_data_statement(min_id=min_id, max_id=max_id).subquery()
+    before, after = start_weight_subquery(data.c.customer_id, data.c.start_date)
+
+    return select(data, func.coalesce(before, after).label("start_weight")).order_by(data.c.customer_id)
+
+def calibrate_rows(rows, customer_ids, dates, weights, today=None):
+    """
+    Estimate the energy expenditure of customers from how their weight changed
+    while they followed their plan.
+
+    The planned intake is the plan from the start of the goal, for the weight
+    at the start of the goal. A weight trend of x kg per day on that intake
+    means the customer burns x * 7700 kcal per day less than they eat, which
+    gives the observed TDEE and, divided by the BMR, the activity level that
+    would have predicted it.
+
+    Parameters:
+    - rows: dictionaries with the keys of calibration_data_statement, ordered by customer id
+    - customer_ids, dates, weights: weigh-ins of these customers (others are ignored), in any order
+
+    Returns:
+    - One calibration dictionary per row, or None when the customer has no goal or
+      no weigh-ins spanning calibration_min_days days since the start of the goal
+    """
+    today = today or date.today()
+    calibrations = [None] * len(rows)
+    indexes = [i for i, row in enumerate(rows)
+               if has_calculation_data(row) and (row["end_date"] - row["start_date"]).days > 0]
+
+    if not indexes or not len(customer_ids):
+        return calibrations
+
+    rows = [rows[i] for i in indexes]
+    count = len(rows)
+
+    # Group of every weigh-in, only the weigh-ins since the start of the goal count
+    row_ids = np.array([row["customer_id"] for row in rows])
+    customer_ids = np.asarray(customer_ids)
+    groups = np.minimum(np.searchsorted(row_ids, customer_ids), count - 1)
+    days = (np.array(dates, dtype="datetime64[D]") - np.datetime64(today, "D")).astype(np.int64)
+    start_days = (np.array([row["start_date"] for row in rows], dtype="datetime64[D]")
+                  - np.datetime64(today, "D")).astype(np.int64)
+    valid = (row_ids[groups] == customer_ids) & (days >= start_days[groups])
+
+    groups, days = groups[valid], days[valid]
+    slope, _, n = fit_trends(groups, days, np.asarray(weights, dtype=np.float64)[valid], count)
+
+    first_day = np.full(count, np.inf)
+    last_day = np.full(count, -np.inf)
+    np.minimum.at(first_day, groups, days)
+    np.maximum.at(last_day, groups, days)
+
+    batch = calculate_daily_calories_and_macros_batch(
+        [int(row["start_weight"]) for row in rows],
+        [row["weight_goal"] for row in rows],
+        [(row["end_date"] - row["start_date"]).days for row in rows],
+        [row["length"] for row in rows],
+        [calculate_age(row["birth_date"]) for row in rows],
+        [row["gender"] for row in rows],
+        [row["activity_level"] for row in rows],
+        [row.get("bmr_formula") for row in rows],
+        [row.get("macro_profile") for row in rows]
+    )
+
+    observed_tdee = batch["total_daily_calories"] - slope * 7700
+    suggested = np.clip(observed_tdee / batch["bmr"], MINIMUM_ACTIVITY_LEVEL, MAXIMUM_ACTIVITY_LEVEL)
+    calibrated = ~np.isnan(slope) & (last_day - first_day >= calibration_min_days)
+
+    for i, row, ok, measurements, trend, intake, bmr, tdee, level in zip(
+            indexes, rows, calibrated.tolist(), n.tolist(), np.round(slope * 7, 2).tolist(),
+            np.round(batch["total_daily_calories"], 2).tolist(), np.round(batch["bmr"], 2).tolist(),
+            np.round(observed_tdee, 2).tolist(), np.round(suggested, 3).tolist()):
+        if ok:
+            calibrations[i] = {
+                "calculated_on": today,
+                "measurements": measurements,
+                "weight_trend": trend,
+                "planned_intake": intake,
+                "bmr": bmr,
+                "observed_tdee": tdee,
+                "activity_level": row["activity_level"],
+                "suggested_activity_level": level
+            }
+
+    return calibrations
+
+def get_weigh_ins(db, rows):
+    """
+    Weigh-ins of the customers of rows since the start of their own goal, as
+    columns. The goal of calculation_data_statement is the one with the latest
+    start date, so every customer is joined to their latest start date, a range
+    scan on ix_progress_customer_id_date per customer.
+    """
+    rows = [row for row in rows if row["start_date"] is not None]
+    if not rows:
+        return (), (), ()
+
+    starts = (
+        select(GoalsTable.customer_id, func.max(GoalsTable.start_date).label("start_date"))
+        .where(GoalsTable.customer_id >= rows[0]["customer_id"])
+        .where(GoalsTable.customer_id <= rows[-1]["customer_id"])
+        .group_by(GoalsTable.customer_id)
+        .subquery()
+    )
+
+    result = db.execute(
+        select(ProgressTable.customer_id, ProgressTable.date, ProgressTable.weight)
+        .join(starts, and_(ProgressTable.customer_id == starts.c.customer_id,
+                           ProgressTable.date >= starts.c.start_date))
+    ).all()
+
+    return tuple(zip(*result)) if result else ((), (), ())
+
+def calibrate_customer(customer_id, db):
+    """Calibration of one customer, calculated now."""
+    rows = [dict(row) for row in db.execute(
+        calibration_data_statement(min_id=customer_id, max_id=customer_id + 1)
+    ).mappings()]
+
+    if not rows:
+        return None
+
+    return calibrate_rows(rows, *get_weigh_ins(db, rows))[0]
+
+def run_calibration(db):
+    """
+    Recalculate the calibrations of all customers, in chunks of
+    calibration_chunk_size customers. Meant to run nightly.
+
+    Returns:
+    - Number of stored calibrations
+    """
+    db.execute(delete(TdeeCalibrationTable))
+    count = 0
+
+    result = db.execute(calibration_data_statement().execution_options(yield_per=calibration_chunk_size))
+
+    for rows in result.mappings().partitions():
+        rows = [dict(row) for row in rows]
+        calibrations = calibrate_rows(rows, *get_weigh_ins(db, rows))
+        values = [
+            {"customer_id": row["customer_id"], **calibration}
+            for row, calibration in zip(rows, calibrations) if calibration
+        ]
+
+        if values:
+            db.execute(insert(TdeeCalibrationTable), values)
+            count += len(values)
+
+    db.commit()
+
+    return count
+
+if __name__ == "__main__":
+    # Nightly job: python -m services.calibration
+    session = SessionLocal()
+    try:
+        print(f"Calibrated {run_calibration(session)} customers")
+    finally:
+        session.close()
@@ -0,0 +1,132 @@
+from sqlalchemy import insert, delete
+
+from models.entities import DailyPlan as DailyPlanTable
+from services.functions import SessionLocal, calculate_age, get_data_from_db_to_calculate, \
+    get_data_from_db_to_calculate_all, calculate_daily_calories_and_macros, calculate_plans_for_rows, \
+    has_calculation_data, NOT_LOADED
+
+# Columns of DailyPlanTable that hold the data returned by get_data_from_db_to_calculate
+CUSTOMER_DATA_FIELDS = ("weight", "date", "weight_goal", "start_date", "end_date",
+                        "activity_level", "length", "gender", "birth_date", "bmr_formula", "macro_profile")
+
+def deadline_in_days(customer_data, from_start_date):
+    if from_start_date:
+        return (customer_data["end_date"] - customer_data["start_date"]).days
+    else:
+        return (customer_data["end_date"] - customer_data["date"]).days
+
+def calculate_plan(customer_data, from_start_date, age):
+    deadline = deadline_in_days(customer_data, from_start_date)
+
+    # A goal without days left has no plan, the endpoint reports the error
+    if deadline == 0:
+        return None
+
+    return calculate_daily_calories_and_macros(
+        customer_data["weight"],
+        customer_data["weight_goal"],
+        deadline,
+        customer_data["length"],
+        age,
+        customer_data["gender"],
+        customer_data["activity_level"],
+        customer_data["bmr_formula"],
+        customer_data["macro_profile"]
+    )
+
+def refresh_daily_plan(customer_id, db, customer_data=NOT_LOADED):
+    """
+    Recalculate the stored plan of one customer after their progress, goals or
+    details changed. Must be called before the commit of the change, after a flush.
+    customer_data is the result of get_data_from_db_to_calculate, when the caller
+    already loaded it.
+    """
+    if customer_data is NOT_LOADED:
+        customer_data = get_data_from_db_to_calculate(customer_id, db)
+
+    # Customers without progress or goals have no plan
+    if not customer_data:
+        db.query(DailyPlanTable).filter(DailyPlanTable.customer_id == customer_id).delete()
+        return None
+
+    age = calculate_age(customer_data["birth_date"])
+
+    daily_plan = DailyPlanTable(
+        customer_id=customer_id,
+        age=age,
+        plan=calculate_plan(customer_data, False, age),
+        plan_from_start_date=calculate_plan(customer_data, True, age),
+        **{field: customer_data[field] for field in CUSTOMER_DATA_FIELDS}
+    )
+
+    return db.merge(daily_plan)
+
+def get_daily_plan(customer_id, db):
+    return db.get(DailyPlanTable, customer_id)
+
+def get_customer_data(daily_plan):
+    return {field: getattr(daily_plan, field) for field in CUSTOMER_DATA_FIELDS}
+
+def get_plan(daily_plan, from_start_date):
+    """
+    Return the stored plan, recalculated from the stored data if the customer
+    had a birthday since it was stored.
+    """
+    age = calculate_age(daily_plan.birth_date)
+
+    if age != daily_plan.age:
+        return calculate_plan(get_customer_data(daily_plan), from_start_date, age)
+
+    return daily_plan.plan_from_start_date if from_start_date else daily_plan.plan
+
+def calculate_plans_or_none(rows, from_start_date):
+    """Batch calculate the plans of rows, with None for goals without days left."""
+    plans = [None] * len(rows)
+    indexes = [i for i, row in enumerate(rows) if deadline_in_days(row, from_start_date) != 0]
+
+    for i, plan in zip(indexes, calculate_plans_for_rows([rows[i] for i in indexes], from_start_date)):
+        plans[i] = plan
+
+    return plans
+
+def rebuild_daily_plans(db):
+    """
+    Recalculate the plans of all customers, for backfills and recovery.
+
+    Returns:
+    - Number of stored plans
+    """
+    db.execute(delete(DailyPlanTable))
+    count = 0
+
+    for rows in get_data_from_db_to_calculate_all(db):
+        rows = [row for row in rows if has_calculation_data(row)]
+        if not rows:
+            continue
+
+        plans = calculate_plans_or_none(rows, False)
+        plans_from_start_date = calculate_plans_or_none(rows, True)
+
+        db.execute(insert(DailyPlanTable), [
+            {
+                "customer_id": row["customer_id"],
+                "age": calculate_age(row["birth_date"]),
+                "plan": plan,
+                "plan_from_start_date": plan_from_start_date,
+                **{field: row[field] for field in CUSTOMER_DATA_FIELDS}
+            }
+            for row, plan, plan_from_start_date in zip(rows, plans, plans_from_start_date)
+        ])
+        count += len(rows)
+
+    db.commit()
+
+    return count
+
+if __name__ == "__main__":
+    # Full rebuild: python -m services.daily_plans
+    session = SessionLocal()
+    try:
+        print(f"Rebuilt {rebuild_daily_plans(session)} daily plans")
+    finally:
+        session.close()
@@ -0,0 +1,126 @@
+import os
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import select
+
+from models.entities import Customer as CustomerTable
+from models.entities import Progress as ProgressTable
+from services.functions import calculation_data_statement
+
+# Only the weigh-ins of the last days are used for the trend
+forecast_history_days = int(os.getenv("FORECAST_HISTORY_DAYS", 90))
+
+def fit_trends(groups, days, weights, count):
+    """
+    Least squares trend line (weight = intercept + slope * day) per group, for
+    all groups in one pass over the ragged arrays with np.bincount.
+
+    Parameters:
+    - groups: group index (0 to count - 1) of every measurement
+    - days: day number of every measurement
+    - weights: weight of every measurement
+    - count: number of groups
+
+    Returns:
+    - slope (kg per day), intercept and number of measurements per group, the
+      slope and intercept are NaN for groups without two different days
+    """
+    days = np.asarray(days, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+
+    n = np.bincount(groups, minlength=count)
+    sum_x = np.bincount(groups, days, minlength=count)
+    sum_y = np.bincount(groups, weights, minlength=count)
+    sum_xx = np.bincount(groups, days * days, minlength=count)
+    sum_xy = np.bincount(groups, days * weights, minlength=count)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_x = sum_x / n
+        mean_y = sum_y / n
+        sxx = sum_xx - sum_x * mean_x
+        slope = np.where(sxx > 1e-9, (sum_xy - sum_x * mean_y) / sxx, np.nan)
+
+    return slope, mean_y - slope * mean_x, n
+
+def forecast_rows(rows, customer_ids, dates, weights, today=None):
+    """
+    Forecast the weight of customers at the end date of their goal.
+
+    Parameters:
+    - rows: dictionaries with 'customer_id', 'weight_goal' and 'end_date', ordered by customer id
+    - customer_ids, dates, weights: the weigh-ins of these customers, in any order
+
+    Returns:
+    - One forecast dictionary per row, or an error when the customer has no goal or
+      not enough weigh-ins
+    """
+    today = today or date.today()
+    count = len(rows)
+
+    if len(customer_ids):
+        groups = np.searchsorted(np.array([row["customer_id"] for row in rows]), np.asarray(customer_ids))
+        days = (np.array(dates, dtype="datetime64[D]") - np.datetime64(today, "D")).astype(np.int64)
+        slope, intercept, n = fit_trends(groups, days, weights, count)
+    else:
+        slope, intercept, n = np.full(count, np.nan), np.full(count, np.nan), np.zeros(count, dtype=np.int64)
+
+    forecasts = []
+    for row, row_slope, row_intercept, measurements in zip(rows, slope.tolist(), intercept.tolist(), n.tolist()):
+        if row["weight_goal"] is None or np.isnan(row_slope):
+            forecasts.append({"error": "Not enough data"})
+            continue
+
+        projected_weight = row_intercept + row_slope * (row["end_date"] - today).days
+
+        # The trend line reaches the goal in the future if it is moving towards it
+        remaining = row["weight_goal"] - row_intercept
+        if remaining == 0:
+            estimated_goal_date = today
+        elif remaining * row_slope > 0:
+            estimated_goal_date = today + timedelta(days=int(np.ceil(remaining / row_slope)))
+        else:
+            estimated_goal_date = None
+
+        forecasts.append({
+            "weight_goal": row["weight_goal"],
+            "end_date": row["end_date"],
+            "trend_per_week": round(row_slope * 7, 2),
+            "current_trend_weight": round(row_intercept, 2),
+            "projected_weight": round(projected_weight, 2),
+            "estimated_goal_date": estimated_goal_date,
+            "on_track": estimated_goal_date is not None and estimated_goal_date <= row["end_date"],
+            "measurements": measurements
+        })
+
+    return forecasts
+
+def get_weigh_ins(db, customer_id=None, gym_id=None, history_days=None):
+    """Weigh-ins of the last history_days days of one customer or the members of a gym, as columns."""
+    statement = (
+        select(ProgressTable.customer_id, ProgressTable.date, ProgressTable.weight)
+        .where(ProgressTable.date >= date.today() - timedelta(days=history_days or forecast_history_days))
+    )
+
+    if customer_id is not None:
+        statement = statement.where(ProgressTable.customer_id == customer_id)
+    if gym_id is not None:
+        statement = statement.where(
+            ProgressTable.customer_id.in_(select(CustomerTable.id).where(CustomerTable.gym_id == gym_id))
+        )
+
+    rows = db.execute(statement).all()
+    return tuple(zip(*rows)) if rows else ((), (), ())
+
+def forecast_customers(db, customer_id=None, gym_id=None, history_days=None):
+    """Forecasts of one customer or all members of a gym, with one query for the goals and one for the weigh-ins."""
+    # The id range of one customer also limits the window subqueries to their progress and goals
+    statement = calculation_data_statement(
+        gym_id, min_id=customer_id, max_id=customer_id + 1 if customer_id is not None else None
+    )
+
+    rows = [dict(row) for row in db.execute(statement).mappings()]
+    if not rows:
+        return rows, []
+
+    return rows, forecast_rows(rows, *get_weigh_ins(db, customer_id, gym_id, history_days))
@@ -0,0 +1,159 @@
+import os
+import json
+
+import numpy as np
+from fastapi.exceptions import HTTPException
+
+# Registry of the BMR equations and macro profiles. The configuration is
+# validated and compiled into lookup tables once, when the app starts, and
+# both the scalar and the batch calculation index into the same tables.
+
+GOAL_TYPES = ('weightloss', 'maintenance', 'musclegain')
+MACRONUTRIENTS = ('protein', 'carb', 'fat')
+GENDERS = ('male', 'female')
+
+CALORIES_PER_GRAM = (4, 4, 9)
+
+# BMR equations as linear coefficients per gender: (weight in kg, height in cm, age in years, constant)
+BMR_EQUATIONS = {
+    'mifflin_st_jeor': {
+        'male': (10, 6.25, -5, 5),
+        'female': (10, 6.25, -5, -161)
+    },
+    # Revised by Roza and Shizgal (1984)
+    'harris_benedict': {
+        'male': (13.397, 4.799, -5.677, 88.362),
+        'female': (9.247, 3.098, -4.330, 447.593)
+    },
+    # 370 + 21.6 * lean body mass, with the lean body mass from the Boer formula
+    'katch_mcardle': {
+        'male': (21.6 * 0.407, 21.6 * 0.267, 0, 370 - 21.6 * 19.2),
+        'female': (21.6 * 0.252, 21.6 * 0.473, 0, 370 - 21.6 * 48.3)
+    }
+}
+
+DEFAULT_BMR_FORMULA = 'mifflin_st_jeor'
+DEFAULT_MACRO_PROFILE = 'default'
+
+# Macro ratio ranges (min, max) as share of the daily calories, per goal type
+DEFAULT_MACRO_PROFILES = {
+    DEFAULT_MACRO_PROFILE: {
+        'weightloss': {
+            'protein_ratio': (0.35, 0.4),  # Higher protein for muscle preservation
+            'carb_ratio': (0.3, 0.35),
+            'fat_ratio': (0.25, 0.3)
+        },
+        'maintenance': {
+            'protein_ratio': (0.3, 0.35),
+            'carb_ratio': (0.4, 0.45),
+            'fat_ratio': (0.2, 0.25)
+        },
+        'musclegain': {
+            'protein_ratio': (0.4, 0.45),  # Higher protein for muscle growth
+            'carb_ratio': (0.35, 0.4),
+            'fat_ratio': (0.2, 0.25)
+        }
+    }
+}
+
+def validate_macro_profile(name, profile):
+    """Raise a ValueError if a macro profile is not complete or has invalid ranges."""
+    if not isinstance(profile, dict) or set(profile) != set(GOAL_TYPES):
+        raise ValueError(f"Macro profile '{name}' must have exactly the goal types {', '.join(GOAL_TYPES)}")
+
+    for goal_type in GOAL_TYPES:
+        ratios = profile[goal_type]
+        keys = {f'{macro}_ratio' for macro in MACRONUTRIENTS}
+
+        if not isinstance(ratios, dict) or set(ratios) != keys:
+            raise ValueError(f"Macro profile '{name}' ({goal_type}) must have exactly {', '.join(sorted(keys))}")
+
+        for key, ratio_range in ratios.items():
+            if (not isinstance(ratio_range, (list, tuple)) or len(ratio_range) != 2
+                    or not all(isinstance(x, (int, float)) for x in ratio_range)
+                    or not 0 <= ratio_range[0] <= ratio_range[1] <= 1):
+                raise ValueError(f"Macro profile '{name}' ({goal_type}) has an invalid {key}, "
+                                 f"expected [min, max] with 0 <= min <= max <= 1")
+
+def load_macro_profiles(config=None):
+    """
+    Load the macro profiles, the built-in default profile plus the profiles of
+    the configuration: a JSON object {name: {goal type: {macro_ratio: [min, max]}}}
+    from the file MACRO_PROFILES_FILE or the MACRO_PROFILES variable.
+    """
+    if config is None:
+        if os.getenv("MACRO_PROFILES_FILE"):
+            with open(os.getenv("MACRO_PROFILES_FILE")) as file:
+                config = file.read()
+        else:
+            config = os.getenv("MACRO_PROFILES", "{}")
+
+    profiles = {**DEFAULT_MACRO_PROFILES, **json.loads(config)}
+
+    for name, profile in profiles.items():
+        validate_macro_profile(name, profile)
+
+    return profiles
+
+def compile_macro_profiles(profiles):
+    """Midpoint ratios of the profiles as an array indexed by [profile, goal type, macro]."""
+    return tuple(profiles), np.array([
+        [
+            [sum(profile[goal_type][f'{macro}_ratio']) / 2 for macro in MACRONUTRIENTS]
+            for goal_type in GOAL_TYPES
+        ]
+        for profile in profiles.values()
+    ])
+
+MACRO_PROFILES = load_macro_profiles()
+MACRO_PROFILE_NAMES, MACRO_RATIO_TABLE = compile_macro_profiles(MACRO_PROFILES)
+BMR_FORMULAS = tuple(BMR_EQUATIONS)
+
+# Lookup tables indexed by [formula, gender, coefficient] and [profile, goal type, macro]
+BMR_COEFFICIENT_TABLE = np.array([[BMR_EQUATIONS[formula][gender] for gender in GENDERS] for formula in BMR_FORMULAS],
+                                 dtype=np.float64)
+CALORIES_PER_GRAM_TABLE = np.array(CALORIES_PER_GRAM, dtype=np.float64)
+
+# The same tables as tuples of floats for the scalar calculation
+BMR_COEFFICIENTS = tuple(tuple(tuple(x) for x in formula) for formula in BMR_COEFFICIENT_TABLE.tolist())
+MACRO_RATIOS = tuple(tuple(tuple(x) for x in profile) for profile in MACRO_RATIO_TABLE.tolist())
+
+_BMR_FORMULA_INDEXES = {name: i for i, name in enumerate(BMR_FORMULAS)}
+_MACRO_PROFILE_INDEXES = {name: i for i, name in enumerate(MACRO_PROFILE_NAMES)}
+
+def bmr_formula_index(name):
+    """Index of a BMR formula in the tables, None selects the default formula."""
+    try:
+        return _BMR_FORMULA_INDEXES[name or DEFAULT_BMR_FORMULA]
+    except KeyError:
+        raise ValueError(f"Unknown BMR formula '{name}'")
+
+def macro_profile_index(name):
+    """Index of a macro profile in the tables, None selects the default profile."""
+    try:
+        return _MACRO_PROFILE_INDEXES[name or DEFAULT_MACRO_PROFILE]
+    except KeyError:
+        raise ValueError(f"Unknown macro profile '{name}'")
+
+def bmr_formula_indexes(values):
+    """Table indexes of a sequence of BMR formula names, integer arrays are taken as indexes already."""
+    values = np.asarray(values)
+    if values.dtype.kind in "iu":
+        return values
+    return np.array([bmr_formula_index(x) for x in values.tolist()], dtype=np.int64)
+
+def macro_profile_indexes(values):
+    """Table indexes of a sequence of macro profile names, integer arrays are taken as indexes already."""
+    values = np.asarray(values)
+    if values.dtype.kind in "iu":
+        return values
+    return np.array([macro_profile_index(x) for x in values.tolist()], dtype=np.int64)
+
+def check_selection(bmr_formula=None, macro_profile=None):
+    """Raise a 422 for a BMR formula or macro profile that is not in the registry."""
+    try:
+        bmr_formula_index(bmr_formula)
+        macro_profile_index(macro_profile)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"{e}, choose from formulas {', '.join(BMR_FORMULAS)} "
+                                                    f"and profiles {', '.join(MACRO_PROFILE_NAMES)}")
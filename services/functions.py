@@ -1,24 +1,43 @@
 import os
+import json
 from time import strptime
 
+import numpy as np
 from fastapi.exceptions import HTTPException
 
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import select
+from sqlalchemy import select, func, and_
 from datetime import date, datetime
 
 from models.entities import Customer as CustomerTable
 from models.entities import Goal as GoalsTable
 from models.entities import Progress as ProgressTable
+from models.entities import Gym as GymTable
+from services.formulas import GOAL_TYPES, MACRONUTRIENTS, CALORIES_PER_GRAM, CALORIES_PER_GRAM_TABLE, \
+    BMR_COEFFICIENTS, BMR_COEFFICIENT_TABLE, MACRO_RATIOS, MACRO_RATIO_TABLE, bmr_formula_index, \
+    macro_profile_index, bmr_formula_indexes, macro_profile_indexes
 
 load_dotenv()
 
 url = os.getenv("DB_URL")
+# Number of rows fetched per round trip by the bulk loaders
+bulk_chunk_size = int(os.getenv("BULK_CHUNK_SIZE", 5000))
 engine = create_engine(url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Plans below this daily intake are considered unrealistic
+MINIMUM_DAILY_CALORIES = 1200
+
+# Errors of customers without a plan, per customer in the bulk responses
+NO_DATA_ERROR = "No data found"
+NO_DAYS_LEFT_ERROR = "No days left before the goal deadline"
+
+# Allowed range of Customer.activity_level
+MINIMUM_ACTIVITY_LEVEL = 1.2
+MAXIMUM_ACTIVITY_LEVEL = 1.725
+
 def get_db():
     db = SessionLocal()
     try:
@@ -27,18 +46,51 @@ def get_db():
         db.close()
 
 # Functions
-def calculate_age(born):
-    today = date.today()
+def calculate_age(born, today=None):
+    today = today or date.today()
     birth_date = born
     return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
 
+def lock_customer(customer_id, db):
+    """
+    Lock the row of a customer until the commit (FOR UPDATE, PostgreSQL), so the
+    running statistics of concurrent writes of one customer are updated one by one.
+    """
+    db.execute(select(CustomerTable.id).where(CustomerTable.id == customer_id).with_for_update())
+
 def violates_constraint(level):
-    if level < 1.2 or level > 1.725:
+    if level < MINIMUM_ACTIVITY_LEVEL or level > MAXIMUM_ACTIVITY_LEVEL:
         return True
     else:
         return False
 
+# Default of the customer_data parameters of the refresh functions, the data is loaded when not given
+NOT_LOADED = object()
+
 def get_data_from_db_to_calculate(customer_id, db):
+    """
+    Get the data needed to calculate the plan of a customer: the latest progress
+    row, the most recent goal and the customer details.
+
+    The latest progress and goal are looked up separately (ix_progress_customer_id_date
+    and ix_goals_customer_id_start_date), so the cost does not grow with the history.
+    """
+    latest_progress_id = (
+        select(ProgressTable.id)
+        .where(ProgressTable.customer_id == customer_id)
+        .order_by(ProgressTable.date.desc(), ProgressTable.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+    latest_goal_id = (
+        select(GoalsTable.id)
+        .where(GoalsTable.customer_id == customer_id)
+        .order_by(GoalsTable.start_date.desc(), GoalsTable.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
     result = db.execute(
         select(
             ProgressTable.weight,
@@ -49,13 +101,15 @@ def get_data_from_db_to_calculate(customer_id, db):
             CustomerTable.activity_level,
             CustomerTable.length,
             CustomerTable.gender,
-            CustomerTable.birth_date
+            CustomerTable.birth_date,
+            GymTable.bmr_formula,
+            GymTable.macro_profile
         )
-        .join(GoalsTable, GoalsTable.customer_id == ProgressTable.customer_id)
-        .join(CustomerTable, CustomerTable.id == ProgressTable.customer_id)
-        .where(ProgressTable.customer_id == customer_id)
-        .order_by(ProgressTable.date.desc(), GoalsTable.start_date.desc())
-        .limit(1)
+        .select_from(CustomerTable)
+        .join(ProgressTable, ProgressTable.id == latest_progress_id)
+        .join(GoalsTable, GoalsTable.id == latest_goal_id)
+        .outerjoin(GymTable, GymTable.id == CustomerTable.gym_id)
+        .where(CustomerTable.id == customer_id)
     ).fetchone()
 
     # error handling will happen at the endpoint
@@ -66,8 +120,144 @@ def get_data_from_db_to_calculate(customer_id, db):
     result_data = dict(result._mapping)
     return result_data
 
+def get_customer_profile(customer_id, db):
+    """
+    Get the stored data of a customer needed for a calculation without a goal:
+    the latest progress row and the customer details.
+    """
+    result = db.execute(
+        select(
+            ProgressTable.weight,
+            ProgressTable.date,
+            CustomerTable.activity_level,
+            CustomerTable.length,
+            CustomerTable.gender,
+            CustomerTable.birth_date,
+            GymTable.bmr_formula,
+            GymTable.macro_profile
+        )
+        .join(CustomerTable, CustomerTable.id == ProgressTable.customer_id)
+        .outerjoin(GymTable, GymTable.id == CustomerTable.gym_id)
+        .where(ProgressTable.customer_id == customer_id)
+        .order_by(ProgressTable.date.desc(), ProgressTable.id.desc())
+        .limit(1)
+    ).fetchone()
+
+    # error handling will happen at the endpoint
+    if not result:
+        return None
+
+    return dict(result._mapping)
+
+def calculation_data_statement(gym_id=None, min_id=None, max_id=None, limit=None):
+    """
+    Select the calculation data of all customers (or the customers of one gym),
+    see get_data_from_db_to_calculate_all.
+
+    The latest progress row and the most recent goal are picked with window
+    functions. min_id (inclusive) and max_id (exclusive) limit the customer ids,
+    for sharding and pagination, and limit caps the number of customers. The
+    gym and the id range also limit the window subqueries, so a shard or a gym
+    only reads the progress and goals of its own customers.
+    """
+    def selected_customers(customer_id):
+        conditions = []
+        if gym_id is not None:
+            conditions.append(customer_id.in_(select(CustomerTable.id).where(CustomerTable.gym_id == gym_id)))
+        if min_id is not None:
+            conditions.append(customer_id >= min_id)
+        if max_id is not None:
+            conditions.append(customer_id < max_id)
+        return conditions
+
+    latest_progress = (
+        select(
+            ProgressTable.customer_id,
+            ProgressTable.weight,
+            ProgressTable.date,
+            func.row_number().over(
+                partition_by=ProgressTable.customer_id,
+                order_by=(ProgressTable.date.desc(), ProgressTable.id.desc())
+            ).label("row_number")
+        )
+        .where(*selected_customers(ProgressTable.customer_id))
+        .subquery()
+    )
+
+    latest_goal = (
+        select(
+            GoalsTable.customer_id,
+            GoalsTable.weight_goal,
+            GoalsTable.start_date,
+            GoalsTable.end_date,
+            func.row_number().over(
+                partition_by=GoalsTable.customer_id,
+                order_by=(GoalsTable.start_date.desc(), GoalsTable.id.desc())
+            ).label("row_number")
+        )
+        .where(*selected_customers(GoalsTable.customer_id))
+        .subquery()
+    )
+
+    statement = (
+        select(
+            CustomerTable.id.label("customer_id"),
+            latest_progress.c.weight,
+            latest_progress.c.date,
+            latest_goal.c.weight_goal,
+            latest_goal.c.start_date,
+            latest_goal.c.end_date,
+            CustomerTable.activity_level,
+            CustomerTable.length,
+            CustomerTable.gender,
+            CustomerTable.birth_date,
+            GymTable.bmr_formula,
+            GymTable.macro_profile
+        )
+        .outerjoin(GymTable, GymTable.id == CustomerTable.gym_id)
+        .outerjoin(latest_progress, and_(latest_progress.c.customer_id == CustomerTable.id,
+                                         latest_progress.c.row_number == 1))
+        .outerjoin(latest_goal, and_(latest_goal.c.customer_id == CustomerTable.id,
+                                     latest_goal.c.row_number == 1))
+        .order_by(CustomerTable.id.asc())
+    )
+
+    if gym_id is not None:
+        statement = statement.where(CustomerTable.gym_id == gym_id)
+    if min_id is not None:
+        statement = statement.where(CustomerTable.id >= min_id)
+    if max_id is not None:
+        statement = statement.where(CustomerTable.id < max_id)
+    if limit is not None:
+        statement = statement.limit(limit)
+
+    return statement
+
+def get_data_from_db_to_calculate_all(db, gym_id=None, chunk_size=None, min_id=None, max_id=None, limit=None):
+    """
+    Load the calculation data of all customers (or the customers of one gym) in a
+    single query, instead of calling get_data_from_db_to_calculate per customer.
+    The rows are streamed from a server-side cursor.
+
+    Returns:
+    - Generator of lists (chunks of at most `chunk_size` rows) with the same keys as
+      get_data_from_db_to_calculate plus 'customer_id', ordered by customer id.
+      Customers without progress or goals have None for the missing values.
+    """
+    statement = calculation_data_statement(gym_id, min_id, max_id, limit)
+
+    # yield_per streams the result with a server-side cursor where the driver supports it
+    result = db.execute(statement.execution_options(yield_per=chunk_size or bulk_chunk_size))
+
+    # Closes the cursor when the consumer stops early
+    try:
+        for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+    finally:
+        result.close()
+
 def calculate_daily_calories_and_macros(current_weight, weight_goal, deadline_days, height, age, gender,
-                                        activity_level):
+                                        activity_level, bmr_formula=None, macro_profile=None):
     """
     Enhanced calorie and macro calculation with personalized nutritional breakdown.
 
@@ -79,16 +269,17 @@ def calculate_daily_calories_and_macros(current_weight, weight_goal, deadline_da
     - age: Age in years
     - gender: 'male' or 'female'
     - activity_level: between 1.2 and 1.725
+    - bmr_formula: name of a BMR formula in services.formulas, default Mifflin-St Jeor
+    - macro_profile: name of a macro profile in services.formulas, default 'default'
 
     Returns:
     - Dictionary with detailed nutritional information
     """
 
     # BMR calculation
-    if gender == 'male':
-        bmr = 10 * current_weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * current_weight + 6.25 * height - 5 * age - 161
+    weight_coefficient, height_coefficient, age_coefficient, constant = \
+        BMR_COEFFICIENTS[bmr_formula_index(bmr_formula)][0 if gender == 'male' else 1]
+    bmr = weight_coefficient * current_weight + height_coefficient * height + age_coefficient * age + constant
 
     total_energy_exp = bmr * activity_level  # Total Daily Energy Expenditure
 
@@ -100,43 +291,19 @@ def calculate_daily_calories_and_macros(current_weight, weight_goal, deadline_da
     # Daily calorie intake
     daily_calories = total_energy_exp - daily_deficit
 
-    # Macro and micronutrient calculation with nested loops
-    macro_profiles = {
-        'weightloss': {
-            'protein_ratio': (0.35, 0.4),  # Higher protein for muscle preservation
-            'carb_ratio': (0.3, 0.35),
-            'fat_ratio': (0.25, 0.3)
-        },
-        'maintenance': {
-            'protein_ratio': (0.3, 0.35),
-            'carb_ratio': (0.4, 0.45),
-            'fat_ratio': (0.2, 0.25)
-        },
-        'musclegain': {
-            'protein_ratio': (0.4, 0.45),  # Higher protein for muscle growth
-            'carb_ratio': (0.35, 0.4),
-            'fat_ratio': (0.2, 0.25)
-        }
-    }
+    # 0 = weightloss, 1 = maintenance, 2 = musclegain (see GOAL_TYPES)
+    goal_type = 0 if weight_change > 0 else 2 if weight_change < 0 else 1
 
-    goal_type = 'weightloss' if weight_change > 0 else 'musclegain' if weight_change < 0 else 'maintenance'
-
-    # Nested loop to dynamically calculate macro ranges and micronutrient needs
+    # Calculate macro values from the midpoint of the ratio range
     macro_breakdown = {}
-    macronutrient_categories = ['protein', 'carb', 'fat']
-
-    base_value = 0
 
-    for macro in macronutrient_categories:
-        min_ratio, max_ratio = macro_profiles[goal_type][f'{macro}_ratio']
+    ratios = MACRO_RATIOS[macro_profile_index(macro_profile)][goal_type]
 
-        # First nested loop: calculate macro ranges
-        for precision in range(10):  # Allow for precision adjustments
-            base_value = daily_calories * ((min_ratio + max_ratio) / 2)
+    for macro, ratio, calories_per_gram in zip(MACRONUTRIENTS, ratios, CALORIES_PER_GRAM):
+        base_value = daily_calories * ratio
 
-        # Calculate final macro values
         macro_breakdown[macro] = {
-            'grams': round(base_value / (4 if macro != 'fat' else 9), 2),
+            'grams': round(base_value / calories_per_gram, 2),
             'calories': round(base_value, 2),
             'percentage': round((base_value / daily_calories) * 100, 2)
         }
@@ -144,31 +311,168 @@ def calculate_daily_calories_and_macros(current_weight, weight_goal, deadline_da
     return {
         'total_daily_calories': round(daily_calories, 2),
         'macronutrients': macro_breakdown,
-        'goal_type': goal_type
+        'goal_type': GOAL_TYPES[goal_type]
+    }
+
+def calculate_daily_calories_and_macros_batch(current_weights, weight_goals, deadline_days, heights, ages,
+                                              genders, activity_levels, bmr_formulas=None, macro_profiles=None):
+    """
+    Vectorized version of calculate_daily_calories_and_macros for many customers at once.
+
+    Parameters are equal-length sequences (lists or NumPy arrays) with the same meaning
+    as the parameters of calculate_daily_calories_and_macros. bmr_formulas and
+    macro_profiles are sequences of names or table indexes (None for the defaults).
+
+    Returns:
+    - Dictionary of unrounded NumPy arrays: 'bmr', 'total_energy_exp', 'daily_deficit',
+      'total_daily_calories', 'goal_type' (index into GOAL_TYPES) and 'macro_calories',
+      'macro_grams', 'macro_percentages' with one column per entry of MACRONUTRIENTS
+    """
+    current_weights = np.asarray(current_weights, dtype=np.float64)
+    weight_goals = np.asarray(weight_goals, dtype=np.float64)
+    deadline_days = np.asarray(deadline_days, dtype=np.float64)
+    heights = np.asarray(heights, dtype=np.float64)
+    ages = np.asarray(ages, dtype=np.float64)
+    activity_levels = np.asarray(activity_levels, dtype=np.float64)
+
+    # Same behaviour as the scalar function for a goal without any days left
+    if np.any(deadline_days == 0):
+        raise ZeroDivisionError("division by zero")
+
+    # BMR calculation, coefficients per formula and gender
+    formulas = 0 if bmr_formulas is None else bmr_formula_indexes(bmr_formulas)
+    coefficients = BMR_COEFFICIENT_TABLE[formulas, np.where(np.asarray(genders) == 'male', 0, 1)]
+    bmr = (coefficients[..., 0] * current_weights + coefficients[..., 1] * heights + coefficients[..., 2] * ages
+           + coefficients[..., 3])
+
+    total_energy_exp = bmr * activity_levels
+
+    # Caloric deficit calculation
+    weight_change = current_weights - weight_goals
+    daily_deficit = weight_change * 7700 / deadline_days
+
+    daily_calories = total_energy_exp - daily_deficit
+
+    # 0 = weightloss, 1 = maintenance, 2 = musclegain (see GOAL_TYPES)
+    goal_type = np.where(weight_change > 0, 0, np.where(weight_change < 0, 2, 1))
+
+    profiles = 0 if macro_profiles is None else macro_profile_indexes(macro_profiles)
+    macro_calories = daily_calories[:, np.newaxis] * MACRO_RATIO_TABLE[profiles, goal_type]
+
+    return {
+        'bmr': bmr,
+        'total_energy_exp': total_energy_exp,
+        'daily_deficit': daily_deficit,
+        'total_daily_calories': daily_calories,
+        'goal_type': goal_type,
+        'macro_calories': macro_calories,
+        'macro_grams': macro_calories / CALORIES_PER_GRAM_TABLE,
+        'macro_percentages': (macro_calories / daily_calories[:, np.newaxis]) * 100
     }
 
-def calculate_daily_calories_all_customers(customer_ids, from_start_date, db):
+def plans_from_batch(batch):
+    """
+    Convert the arrays of calculate_daily_calories_and_macros_batch into the
+    dictionaries returned by calculate_daily_calories_and_macros.
+    """
+    total_daily_calories = np.round(batch['total_daily_calories'], 2).tolist()
+    goal_types = batch['goal_type'].tolist()
+    grams = np.round(batch['macro_grams'], 2).tolist()
+    calories = np.round(batch['macro_calories'], 2).tolist()
+    percentages = np.round(batch['macro_percentages'], 2).tolist()
+
+    return [
+        {
+            'total_daily_calories': total_daily_calories[i],
+            'macronutrients': {
+                macro: {
+                    'grams': grams[i][j],
+                    'calories': calories[i][j],
+                    'percentage': percentages[i][j]
+                }
+                for j, macro in enumerate(MACRONUTRIENTS)
+            },
+            'goal_type': GOAL_TYPES[goal_types[i]]
+        }
+        for i in range(len(goal_types))
+    ]
+
+def calculate_plans_for_rows(rows, from_start_date):
+    """
+    Calculate the plans for a chunk of rows from get_data_from_db_to_calculate_all
+    in one batch. All rows must have progress and goal data.
+    """
+    deadline_start = "start_date" if from_start_date else "date"
+
+    batch = calculate_daily_calories_and_macros_batch(
+        [int(row["weight"]) for row in rows],
+        [row["weight_goal"] for row in rows],
+        [(row["end_date"] - row[deadline_start]).days for row in rows],
+        [row["length"] for row in rows],
+        [calculate_age(row["birth_date"]) for row in rows],
+        [row["gender"] for row in rows],
+        [row["activity_level"] for row in rows],
+        [row.get("bmr_formula") for row in rows],
+        [row.get("macro_profile") for row in rows]
+    )
+
+    return plans_from_batch(batch)
+
+def has_calculation_data(row):
+    return row["weight"] is not None and row["weight_goal"] is not None
+
+def calculation_error(row, from_start_date):
+    """The error of a row without a plan: missing progress or goals, or a goal without days left"""
+    if not has_calculation_data(row):
+        return NO_DATA_ERROR
+
+    if (row["end_date"] - row["start_date" if from_start_date else "date"]).days == 0:
+        return NO_DAYS_LEFT_ERROR
+
+    return None
+
+def calculate_plans_or_errors(rows, from_start_date):
+    """
+    Like calculate_plans_for_rows, but rows that are missing progress or goals,
+    or have no days left before the goal deadline, get an error instead of a plan.
+    """
+    errors = [calculation_error(row, from_start_date) for row in rows]
+    complete_rows = [row for row, error in zip(rows, errors) if error is None]
+    plans = iter(calculate_plans_for_rows(complete_rows, from_start_date) if complete_rows else [])
+
+    return [next(plans) if error is None else {"error": error} for error in errors]
+
+def calculate_daily_calories_all_customers(from_start_date, db):
     result = []
 
-    for customer_id in customer_ids:
-        data = get_data_from_db_to_calculate(int(customer_id), db)
-        if not data:
+    for rows in get_data_from_db_to_calculate_all(db):
+        if not all(has_calculation_data(row) for row in rows):
             raise HTTPException(status_code=404, detail='No data found')
 
-        weight = int(data["weight"])
-        weight_goal = data["weight_goal"]
-        height = data["length"]
-        age = calculate_age(data["birth_date"])
-        gender = data["gender"]
-        activity_level = data["activity_level"]
+        result.extend(calculate_plans_for_rows(rows, from_start_date))
+
+    return result
 
-        if from_start_date:
-            deadline_in_days = (data["end_date"] - data["start_date"]).days
-        else:
-            deadline_in_days =  (data["end_date"] - data["date"]).days
+def stream_daily_calories_all_customers(from_start_date, db, gym_id=None):
+    """
+    Streaming version of calculate_daily_calories_all_customers.
 
-        calculation = calculate_daily_calories_and_macros(weight, weight_goal, deadline_in_days, height, age, gender, activity_level)
+    Reads the customers in chunks and yields the plans of each chunk as NDJSON
+    (one JSON object per customer per line), so memory use does not grow with
+    the number of customers. Customers that are missing progress or goals, or
+    have no days left before the goal deadline, get an error line instead of
+    failing the whole stream.
 
-        result.append(calculation)
+    The session is closed when the stream ends, because FastAPI already ran the
+    cleanup of the get_db dependency before the response started streaming.
+    """
+    try:
+        for rows in get_data_from_db_to_calculate_all(db, gym_id):
+            plans = calculate_plans_or_errors(rows, from_start_date)
 
-    return result
+            yield "".join(
+                json.dumps({"customer_id": row["customer_id"], **plan}) + "\n"
+                for row, plan in zip(rows, plans)
+            )
+    finally:
+        db.close()
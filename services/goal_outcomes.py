@@ -0,0 +1,189 @@
+import os
+from datetime import date, timedelta
+
+from sqlalchemy import select, insert, delete, func, case, tuple_
+
+from models.entities import Customer as CustomerTable
+from models.entities import Goal as GoalsTable
+from models.entities import Progress as ProgressTable
+from models.entities import GoalOutcome as GoalOutcomeTable
+from models.entities import JobWatermark as JobWatermarkTable
+from services.functions import SessionLocal
+from services.leaderboard import start_weight_subquery
+
+# Goals per chunk of the evaluation job
+goal_outcome_chunk_size = int(os.getenv("GOAL_OUTCOME_CHUNK_SIZE", 2000))
+# Goals are evaluated this many days after their end date, so the weigh-ins around the end date are in
+goal_outcome_grace_days = int(os.getenv("GOAL_OUTCOME_GRACE_DAYS", 3))
+# A maintenance goal is met within this many kg of the goal
+goal_outcome_tolerance = float(os.getenv("GOAL_OUTCOME_TOLERANCE", 1))
+
+JOB_NAME = "goal_outcomes"
+
+def weigh_in_subquery(customer_id, day, after):
+    """The last weigh-in on or before a day, or the first one after it, as (weight, date) scalar subqueries"""
+    def nearest(column):
+        statement = select(column).where(ProgressTable.customer_id == customer_id)
+        if after:
+            statement = statement.where(ProgressTable.date > day).order_by(ProgressTable.date.asc(),
+                                                                            ProgressTable.id.asc())
+        else:
+            statement = statement.where(ProgressTable.date <= day).order_by(ProgressTable.date.desc(),
+                                                                             ProgressTable.id.desc())
+        return statement.limit(1).scalar_subquery()
+
+    return nearest(ProgressTable.weight), nearest(ProgressTable.date)
+
+def outcome_statement(first_end_date, last_end_date):
+    """
+    The goals that ended from first_end_date (inclusive, None for all) to
+    last_end_date (exclusive), in end_date order through ix_goals_end_date_customer_id,
+    with the weigh-ins around the start and end date of every goal.
+    """
+    weight_before, date_before = weigh_in_subquery(GoalsTable.customer_id, GoalsTable.end_date, after=False)
+    weight_after, date_after = weigh_in_subquery(GoalsTable.customer_id, GoalsTable.end_date, after=True)
+    start_weight_before, start_weight_after = start_weight_subquery(GoalsTable.customer_id, GoalsTable.start_date)
+
+    statement = (
+        select(
+            GoalsTable.id.label("goal_id"),
+            GoalsTable.customer_id,
+            CustomerTable.gym_id,
+            GoalsTable.weight_goal,
+            GoalsTable.end_date,
+            func.coalesce(start_weight_before, start_weight_after).label("start_weight"),
+            weight_before.label("weight_before"),
+            date_before.label("date_before"),
+            weight_after.label("weight_after"),
+            date_after.label("date_after")
+        )
+        .outerjoin(CustomerTable, CustomerTable.id == GoalsTable.customer_id)
+        .where(GoalsTable.end_date < last_end_date)
+        .order_by(GoalsTable.end_date, GoalsTable.id)
+    )
+
+    if first_end_date is not None:
+        statement = statement.where(GoalsTable.end_date >= first_end_date)
+
+    return statement
+
+def goal_outcome(row):
+    """
+    The outcome of an ended goal from the weigh-in nearest to the end date. The
+    margin is how far the customer went past the goal, negative when missed.
+    """
+    outcome = {
+        "goal_id": row["goal_id"],
+        "customer_id": row["customer_id"],
+        "gym_id": row["gym_id"],
+        "end_date": row["end_date"],
+        "weight_goal": row["weight_goal"],
+        "start_weight": row["start_weight"],
+        "final_weight": None,
+        "final_date": None,
+        "outcome": "no_data",
+        "margin": None
+    }
+
+    candidates = [
+        (abs((row[f"date_{side}"] - row["end_date"]).days), row[f"date_{side}"], row[f"weight_{side}"])
+        for side in ("before", "after") if row[f"date_{side}"] is not None
+    ]
+    if not candidates:
+        return outcome
+
+    # The weigh-in before the end date wins a tie
+    _, final_date, final_weight = min(candidates, key=lambda x: x[0])
+    start_weight = row["start_weight"]
+
+    if start_weight > row["weight_goal"]:
+        margin = row["weight_goal"] - final_weight
+    elif start_weight < row["weight_goal"]:
+        margin = final_weight - row["weight_goal"]
+    else:
+        margin = goal_outcome_tolerance - abs(final_weight - row["weight_goal"])
+
+    return {
+        **outcome,
+        "final_weight": final_weight,
+        "final_date": final_date,
+        "outcome": "met" if margin >= 0 else "missed",
+        "margin": margin
+    }
+
+def get_watermark(db, name=JOB_NAME):
+    """Watermark of a job, None before its first run"""
+    return db.execute(select(JobWatermarkTable.value).where(JobWatermarkTable.name == name)).scalar()
+
+def evaluate_goal_outcomes(db, today=None):
+    """
+    Evaluate the goals that ended since the last run, in chunks of
+    goal_outcome_chunk_size goals. The watermark is the end date up to which
+    all goals have been evaluated, every run continues from there. Meant to
+    run nightly.
+
+    Returns:
+    - Number of evaluated goals
+    """
+    today = today or date.today()
+    first_end_date = get_watermark(db)
+    last_end_date = today - timedelta(days=goal_outcome_grace_days)
+
+    if first_end_date is not None and first_end_date >= last_end_date:
+        return 0
+
+    statement = outcome_statement(first_end_date, last_end_date)
+    count, last_key = 0, None
+
+    while True:
+        chunk = statement
+        if last_key is not None:
+            chunk = chunk.where(tuple_(GoalsTable.end_date, GoalsTable.id) > tuple_(*last_key))
+
+        rows = [dict(row) for row in db.execute(chunk.limit(goal_outcome_chunk_size)).mappings()]
+        if not rows:
+            break
+
+        # Goals evaluated by an interrupted run are evaluated again
+        db.execute(delete(GoalOutcomeTable).where(GoalOutcomeTable.goal_id.in_([row["goal_id"] for row in rows])))
+        db.execute(insert(GoalOutcomeTable), [{**goal_outcome(row), "evaluated_on": today} for row in rows])
+        db.commit()
+
+        count += len(rows)
+        last_key = (rows[-1]["end_date"], rows[-1]["goal_id"])
+
+    db.merge(JobWatermarkTable(name=JOB_NAME, value=last_end_date))
+    db.commit()
+
+    return count
+
+def get_gym_success_rate(gym_id, db):
+    """Outcomes of the goals of the members of a gym, aggregated over the outcomes table"""
+    row = db.execute(
+        select(
+            func.count().label("goals"),
+            func.sum(case((GoalOutcomeTable.outcome == "met", 1), else_=0)).label("met"),
+            func.sum(case((GoalOutcomeTable.outcome == "missed", 1), else_=0)).label("missed"),
+            func.avg(GoalOutcomeTable.margin).label("average_margin")
+        )
+        .where(GoalOutcomeTable.gym_id == gym_id)
+    ).one()
+
+    met, missed = row.met or 0, row.missed or 0
+
+    return {
+        "goals": row.goals,
+        "met": met,
+        "missed": missed,
+        "no_data": row.goals - met - missed,
+        "success_rate": round(met / (met + missed), 4) if met + missed else None,
+        "average_margin": round(row.average_margin, 2) if row.average_margin is not None else None
+    }
+
+if __name__ == "__main__":
+    # Nightly job: python -m services.goal_outcomes
+    session = SessionLocal()
+    try:
+        print(f"Evaluated {evaluate_goal_outcomes(session)} goals")
+    finally:
+        session.close()
@@ -0,0 +1,321 @@
+import sys
+from collections import Counter
+from datetime import date, timedelta
+
+from sqlalchemy import select, delete, insert, update, or_, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models.entities import Customer as CustomerTable
+from models.entities import Goal as GoalsTable
+from models.entities import Progress as ProgressTable
+from models.entities import GymStatCounter as GymStatCounterTable
+from models.entities import GymStatMember as GymStatMemberTable
+from models.entities import JobWatermark as JobWatermarkTable
+from services.functions import SessionLocal, bulk_chunk_size, calculate_age, lock_customer
+
+# The statistics of a gym are counters per (metric, bucket), changed by the
+# difference between the old and new contribution of a member on every write.
+# Metrics that change with time (age, active goals) are counted per bucket as
+# of the day of the write, the nightly job (move_members) moves the members
+# whose age bucket or active goal changed since.
+
+JOB_NAME = "gym_stats"
+
+AGE_BUCKETS = ((None, 25, "<25"), (25, 35, "25-34"), (35, 45, "35-44"), (45, 55, "45-54"), (55, None, "55+"))
+BMI_CATEGORIES = ((18.5, "underweight"), (25, "normal"), (30, "overweight"), (None, "obese"))
+
+MEMBER_FIELDS = ("gym_id", "gender", "birth_date", "age_bucket", "length", "weight", "bmi_category",
+                 "goal_start_date", "goal_end_date", "active_goal")
+
+def bmi_category(weight, length):
+    """BMI category of a weight in kg and a length in cm"""
+    bmi = weight / (length / 100) ** 2
+
+    for limit, category in BMI_CATEGORIES:
+        if limit is None or bmi < limit:
+            return category
+
+def member_statement():
+    """The customer details with the latest weight and the period of the latest goal, looked up per customer."""
+    latest_weight = (
+        select(ProgressTable.weight)
+        .where(ProgressTable.customer_id == CustomerTable.id)
+        .order_by(ProgressTable.date.desc(), ProgressTable.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+    latest_goal_id = (
+        select(GoalsTable.id)
+        .where(GoalsTable.customer_id == CustomerTable.id)
+        .order_by(GoalsTable.start_date.desc(), GoalsTable.id.desc())
+        .limit(1)
+        .correlate(CustomerTable)
+        .scalar_subquery()
+    )
+
+    return (
+        select(
+            CustomerTable.id.label("customer_id"),
+            CustomerTable.gym_id,
+            CustomerTable.gender,
+            CustomerTable.birth_date,
+            CustomerTable.length,
+            latest_weight.label("weight"),
+            GoalsTable.start_date.label("goal_start_date"),
+            GoalsTable.end_date.label("goal_end_date")
+        )
+        .outerjoin(GoalsTable, GoalsTable.id == latest_goal_id)
+        .order_by(CustomerTable.id.asc())
+    )
+
+def age_bucket(age):
+    """Label of the AGE_BUCKETS bucket of an age"""
+    return next(label for low, high, label in AGE_BUCKETS
+                if (low is None or age >= low) and (high is None or age < high))
+
+def member_from_row(row, today=None):
+    """Values of GymStatMemberTable for a row of member_statement, with the age and active goal of today"""
+    today = today or date.today()
+
+    return {
+        "customer_id": row["customer_id"],
+        "gym_id": row["gym_id"],
+        "gender": row["gender"],
+        "birth_date": row["birth_date"],
+        "age_bucket": age_bucket(calculate_age(row["birth_date"], today)),
+        "length": row["length"],
+        "weight": row["weight"],
+        "bmi_category": bmi_category(row["weight"], row["length"]) if row["weight"] is not None else None,
+        "goal_start_date": row["goal_start_date"],
+        "goal_end_date": row["goal_end_date"],
+        "active_goal": row["goal_start_date"] is not None and row["goal_start_date"] <= today <= row["goal_end_date"]
+    }
+
+def contribution(member):
+    """Counters a member adds to the statistics of their gym, as a Counter of (metric, bucket)"""
+    counters = Counter()
+
+    if not member or member["gym_id"] is None:
+        return counters
+
+    counters["members", ""] = 1
+    counters["gender", member["gender"]] = 1
+    counters["age", member["age_bucket"]] = 1
+    counters["height_sum", ""] = member["length"]
+
+    if member["weight"] is not None:
+        counters["weight", str(member["weight"])] = 1
+        counters["bmi", member["bmi_category"]] = 1
+    if member["active_goal"]:
+        counters["active_goals", ""] = 1
+
+    return counters
+
+def add_counters(db, gym_id, counters):
+    """Add to the counters of a gym in one upsert, and drop the decreased counters that reach zero."""
+    # Sorted, so concurrent writes lock the counter rows of a gym in the same order
+    values = [
+        {"gym_id": gym_id, "metric": metric, "bucket": bucket, "value": value}
+        for (metric, bucket), value in sorted(counters.items()) if value
+    ]
+    if not values:
+        return
+
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(GymStatCounterTable).values(values)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=["gym_id", "metric", "bucket"],
+        set_={"value": GymStatCounterTable.value + statement.excluded.value}
+    ))
+
+    decreased = [(value["metric"], value["bucket"]) for value in values if value["value"] < 0]
+    if decreased:
+        db.execute(delete(GymStatCounterTable).where(
+            GymStatCounterTable.gym_id == gym_id,
+            tuple_(GymStatCounterTable.metric, GymStatCounterTable.bucket).in_(decreased),
+            GymStatCounterTable.value == 0
+        ))
+
+def refresh_gym_stats(customer_id, db, removed=False, today=None):
+    """
+    Move the contribution of one customer to the statistics of their gym after
+    their details, progress or goals changed, or before they are deleted
+    (removed). Must be called before the commit of the change, after a flush.
+    """
+    # The contribution is read, compared and replaced under the lock of the customer
+    lock_customer(customer_id, db)
+
+    previous = db.execute(
+        select(*(getattr(GymStatMemberTable, field) for field in MEMBER_FIELDS))
+        .where(GymStatMemberTable.customer_id == customer_id)
+    ).fetchone()
+    previous = dict(previous._mapping) if previous else None
+
+    current = None
+    if not removed:
+        row = db.execute(member_statement().where(CustomerTable.id == customer_id)).fetchone()
+        row = dict(row._mapping) if row else None
+        current = member_from_row(row, today) if row else None
+
+    old, new = contribution(previous), contribution(current)
+
+    if previous and current and previous["gym_id"] == current["gym_id"]:
+        new.subtract(old)
+        add_counters(db, current["gym_id"], new)
+    else:
+        if old:
+            add_counters(db, previous["gym_id"], Counter({key: -value for key, value in old.items()}))
+        if new:
+            add_counters(db, current["gym_id"], new)
+
+    if previous and not current:
+        db.execute(delete(GymStatMemberTable).where(GymStatMemberTable.customer_id == customer_id))
+    elif previous:
+        db.execute(update(GymStatMemberTable).where(GymStatMemberTable.customer_id == customer_id)
+                   .values({field: current[field] for field in MEMBER_FIELDS}))
+    elif current:
+        db.execute(insert(GymStatMemberTable).values(current))
+
+def remove_gym(gym_id, db):
+    """Drop the statistics of a deleted gym, its members no longer belong to a gym."""
+    db.execute(delete(GymStatCounterTable).where(GymStatCounterTable.gym_id == gym_id))
+    db.execute(update(GymStatMemberTable).where(GymStatMemberTable.gym_id == gym_id).values(gym_id=None))
+
+def get_counters(db, gym_id=None):
+    """Counters of one gym or all gyms, as {gym_id: Counter}"""
+    statement = select(GymStatCounterTable.gym_id, GymStatCounterTable.metric,
+                       GymStatCounterTable.bucket, GymStatCounterTable.value)
+    if gym_id is not None:
+        statement = statement.where(GymStatCounterTable.gym_id == gym_id)
+
+    counters = {}
+    for row_gym_id, metric, bucket, value in db.execute(statement):
+        counters.setdefault(row_gym_id, Counter())[metric, bucket] = value
+
+    return counters
+
+def stats_from_counters(counters):
+    """The statistics of a gym (or the sum of several gyms) from its counters"""
+    members = counters["members", ""]
+
+    weights = sorted((int(bucket), value) for (metric, bucket), value in counters.items() if metric == "weight")
+    weighed = sum(value for _, value in weights)
+
+    return {
+        "members": members,
+        "gender": {gender: counters["gender", gender] for gender in ("male", "female")},
+        "age": {label: counters["age", label] for _, _, label in AGE_BUCKETS},
+        "average_height": round(counters["height_sum", ""] / members, 2) if members else None,
+        "weighed_members": weighed,
+        "average_weight": round(sum(weight * value for weight, value in weights) / weighed, 2) if weighed else None,
+        "median_weight": histogram_median(weights, weighed),
+        "bmi": {category: counters["bmi", category] for _, category in BMI_CATEGORIES},
+        "active_goals": counters["active_goals", ""]
+    }
+
+def histogram_median(histogram, count):
+    """Median of sorted (value, count) pairs with count values in total"""
+    if not count:
+        return None
+
+    middle, seen, lower = (count - 1) // 2, 0, None
+    for value, value_count in histogram:
+        if lower is None and seen + value_count > middle:
+            lower = value
+        if seen + value_count > count // 2:
+            return (lower + value) / 2
+        seen += value_count
+
+def years_before(day, years):
+    """The same day years earlier, February 29 becomes February 28"""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+def get_watermark(db):
+    """Day up to which the members are in the right age bucket and active goal count, None before the first run"""
+    return db.execute(select(JobWatermarkTable.value).where(JobWatermarkTable.name == JOB_NAME)).scalar()
+
+def move_members(db, today=None):
+    """
+    Move the members whose age bucket or active goal changed since the last
+    run to their new buckets. These are the members that reached the lowest
+    age of a bucket, and the members whose goal started or ended, on the days
+    after the watermark. Meant to run nightly, after midnight.
+
+    Returns:
+    - Number of refreshed members
+    """
+    today = today or date.today()
+    last_day = get_watermark(db) or today - timedelta(days=1)
+
+    if last_day >= today:
+        return 0
+
+    birthdays = [
+        GymStatMemberTable.birth_date.between(years_before(last_day, low) + timedelta(days=1), years_before(today, low))
+        for low, _, _ in AGE_BUCKETS if low is not None
+    ]
+    customer_ids = db.execute(
+        select(GymStatMemberTable.customer_id)
+        .where(or_(
+            *birthdays,
+            GymStatMemberTable.goal_start_date.between(last_day + timedelta(days=1), today),
+            GymStatMemberTable.goal_end_date.between(last_day, today - timedelta(days=1))
+        ))
+        .order_by(GymStatMemberTable.customer_id)
+    ).scalars().all()
+
+    for customer_id in customer_ids:
+        refresh_gym_stats(customer_id, db, today=today)
+
+    db.merge(JobWatermarkTable(name=JOB_NAME, value=today))
+    db.commit()
+
+    return len(customer_ids)
+
+def rebuild_gym_stats(db, today=None):
+    """
+    Recalculate the statistics of all gyms, for backfills and recovery.
+
+    Returns:
+    - Number of counted members
+    """
+    today = today or date.today()
+    db.execute(delete(GymStatCounterTable))
+    db.execute(delete(GymStatMemberTable))
+
+    result = db.execute(member_statement().execution_options(yield_per=bulk_chunk_size))
+    counters = {}
+    count = 0
+
+    for rows in result.mappings().partitions():
+        members = [member_from_row(row, today) for row in rows]
+        db.execute(insert(GymStatMemberTable), members)
+
+        for member in members:
+            if member["gym_id"] is not None:
+                counters.setdefault(member["gym_id"], Counter()).update(contribution(member))
+                count += 1
+
+    for gym_id, gym_counters in counters.items():
+        add_counters(db, gym_id, gym_counters)
+
+    db.merge(JobWatermarkTable(name=JOB_NAME, value=today))
+    db.commit()
+
+    return count
+
+if __name__ == "__main__":
+    # Nightly job: python -m services.gym_stats move
+    # Full rebuild: python -m services.gym_stats
+    session = SessionLocal()
+    try:
+        if sys.argv[1:2] == ["move"]:
+            print(f"Moved {move_members(session)} members to their age and active goal buckets")
+        else:
+            print(f"Rebuilt the gym statistics of {rebuild_gym_stats(session)} members")
+    finally:
+        session.close()
@@ -0,0 +1,145 @@
+import os
+
+from sqlalchemy import select, insert, delete
+
+from models.entities import Customer as CustomerTable
+from models.entities import Progress as ProgressTable
+from models.entities import LeaderboardEntry as LeaderboardTable
+from services.functions import SessionLocal, bulk_chunk_size, calculation_data_statement, \
+    get_data_from_db_to_calculate, NOT_LOADED
+
+# Largest number of entries returned by the leaderboard endpoint
+leaderboard_max_top = int(os.getenv("LEADERBOARD_MAX_TOP", 100))
+
+def goal_progress(start_weight, weight, weight_goal):
+    """Percentage of the weight change of the goal achieved, from the weight at the start of the goal"""
+    if start_weight == weight_goal:
+        return 100.0 if weight == weight_goal else 0.0
+
+    return round((start_weight - weight) / (start_weight - weight_goal) * 100, 2)
+
+def start_weight_subquery(customer_id, start_date):
+    """
+    Weight at the start of a goal: the last weigh-in before the start date, or
+    the first one since then for goals that started before any weigh-in.
+    """
+    before = (
+        select(ProgressTable.weight)
+        .where(ProgressTable.customer_id == customer_id, ProgressTable.date < start_date)
+        .order_by(ProgressTable.date.desc(), ProgressTable.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    after = (
+        select(ProgressTable.weight)
+        .where(ProgressTable.customer_id == customer_id, ProgressTable.date >= start_date)
+        .order_by(ProgressTable.date.asc(), ProgressTable.id.asc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+    return before, after
+
+def refresh_leaderboard_entry(customer_id, db, customer_data=NOT_LOADED):
+    """
+    Recalculate the leaderboard entry of one customer after their progress,
+    goals or gym changed. Must be called before the commit of the change, after
+    a flush. Only reads the latest progress, latest goal and start weight, and
+    takes customer_data like refresh_daily_plan.
+    """
+    if customer_data is NOT_LOADED:
+        customer_data = get_data_from_db_to_calculate(customer_id, db)
+
+    # Customers without progress or goals are not on the leaderboard
+    if not customer_data:
+        db.query(LeaderboardTable).filter(LeaderboardTable.customer_id == customer_id).delete()
+        return None
+
+    before, after = start_weight_subquery(customer_id, customer_data["start_date"])
+    start_weight = db.execute(select(before)).scalar()
+    if start_weight is None:
+        start_weight = db.execute(select(after)).scalar()
+
+    entry = LeaderboardTable(
+        customer_id=customer_id,
+        gym_id=db.execute(select(CustomerTable.gym_id).where(CustomerTable.id == customer_id)).scalar(),
+        start_weight=start_weight,
+        weight=customer_data["weight"],
+        weight_goal=customer_data["weight_goal"],
+        goal_progress=goal_progress(start_weight, customer_data["weight"], customer_data["weight_goal"])
+    )
+
+    return db.merge(entry)
+
+def get_leaderboard(gym_id, top, db):
+    """The top entries of a gym, read from the leaderboard index (gym_id, goal_progress desc, customer_id)"""
+    return db.execute(
+        select(
+            LeaderboardTable.customer_id,
+            CustomerTable.first_name,
+            CustomerTable.last_name,
+            LeaderboardTable.start_weight,
+            LeaderboardTable.weight,
+            LeaderboardTable.weight_goal,
+            LeaderboardTable.goal_progress
+        )
+        .join(CustomerTable, CustomerTable.id == LeaderboardTable.customer_id)
+        .where(LeaderboardTable.gym_id == gym_id)
+        .order_by(LeaderboardTable.goal_progress.desc(), LeaderboardTable.customer_id.asc())
+        .limit(top)
+    ).mappings().all()
+
+def rebuild_leaderboard(db):
+    """
+    Recalculate the leaderboard of all gyms, for backfills and recovery.
+
+    Returns:
+    - Number of stored entries
+    """
+    db.execute(delete(LeaderboardTable))
+
+    data = calculation_data_statement().subquery()
+    before, after = start_weight_subquery(data.c.customer_id, data.c.start_date)
+    result = db.execute(
+        select(
+            data.c.customer_id,
+            CustomerTable.gym_id,
+            data.c.weight,
+            data.c.weight_goal,
+            before.label("weight_before"),
+            after.label("weight_after")
+        )
+        .join(CustomerTable, CustomerTable.id == data.c.customer_id)
+        .where(data.c.weight.is_not(None), data.c.weight_goal.is_not(None))
+        .execution_options(yield_per=bulk_chunk_size)
+    )
+
+    count = 0
+    for rows in result.mappings().partitions():
+        values = []
+
+        for row in rows:
+            start_weight = row["weight_before"] if row["weight_before"] is not None else row["weight_after"]
+            values.append({
+                "customer_id": row["customer_id"],
+                "gym_id": row["gym_id"],
+                "start_weight": start_weight,
+                "weight": row["weight"],
+                "weight_goal": row["weight_goal"],
+                "goal_progress": goal_progress(start_weight, row["weight"], row["weight_goal"])
+            })
+
+        db.execute(insert(LeaderboardTable), values)
+        count += len(values)
+
+    db.commit()
+
+    return count
+
+if __name__ == "__main__":
+    # Full rebuild: python -m services.leaderboard
+    session = SessionLocal()
+    try:
+        print(f"Rebuilt {rebuild_leaderboard(session)} leaderboard entries")
+    finally:
+        session.close()
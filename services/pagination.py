@@ -0,0 +1,72 @@
+import os
+import json
+import base64
+from datetime import date
+
+from fastapi.exceptions import HTTPException
+from sqlalchemy import tuple_
+
+# Page sizes of the list endpoints
+default_page_size = int(os.getenv("DEFAULT_PAGE_SIZE", 100))
+max_page_size = int(os.getenv("MAX_PAGE_SIZE", 1000))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(values):
+    """Encode the sort key of the last row of a page into an opaque cursor."""
+    values = [value.isoformat() if isinstance(value, date) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("wrong number of values")
+
+        return [
+            date.fromisoformat(value) if column.type.python_type is date else value
+            for column, value in zip(columns, values)
+        ]
+
+    except Exception:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor '{cursor}'")
+
+def page_size(limit):
+    if limit is None:
+        return default_page_size
+    if limit < 1:
+        raise HTTPException(status_code=422, detail="The limit must be at least 1.")
+    return min(limit, max_page_size)
+
+def paginate(statement, columns, cursor=None, limit=None):
+    """
+    Apply keyset pagination to a select statement or query.
+
+    The rows are ordered by `columns`, which must be unique together (end with
+    the primary key), and only rows after the cursor are selected. One extra row
+    is fetched to know if there is a next page, pass the result to get_page.
+    """
+    if cursor:
+        statement = statement.where(tuple_(*columns) > tuple_(*decode_cursor(cursor, columns)))
+
+    return statement.order_by(*columns).limit(page_size(limit) + 1)
+
+def get_page(rows, limit, sort_key):
+    """
+    Split the rows of a paginated statement into the page and the cursor of the
+    next page (None on the last page). sort_key returns the values of the
+    pagination columns for a row.
+    """
+    size = page_size(limit)
+
+    if not rows or len(rows) <= size:
+        return rows, None
+
+    rows = rows[:size]
+    return rows, encode_cursor(sort_key(rows[-1]))
+
+def set_next_cursor(response, next_cursor):
+    # Lists are returned as is, the cursor of the next page is sent in a header
+    if response is not None and next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -0,0 +1,126 @@
+import os
+import asyncio
+from threading import Lock
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi.exceptions import HTTPException
+from sqlalchemy import select, func
+
+from models.entities import Customer as CustomerTable
+from services.functions import engine, SessionLocal, get_data_from_db_to_calculate_all, calculate_plans_for_rows, \
+    has_calculation_data
+
+# Size of the process pool and default shard size, the shard size can be overridden per call
+plan_workers = int(os.getenv("PLAN_WORKERS", os.cpu_count() or 1))
+plan_shard_size = int(os.getenv("PLAN_SHARD_SIZE", 10000))
+
+# Process pool shared by all requests, started on first use
+executor = None
+executor_lock = Lock()
+
+def get_shards(db, shard_size):
+    """
+    Split the customers into id ranges of at most shard_size customers.
+
+    Only the first id of every shard is fetched from the database.
+
+    Returns:
+    - List of (min_id, max_id) tuples, min_id inclusive and max_id exclusive (None for the last shard)
+    """
+    numbered = select(
+        CustomerTable.id,
+        func.row_number().over(order_by=CustomerTable.id).label("row_number")
+    ).subquery()
+
+    first_ids = db.execute(
+        select(numbered.c.id)
+        .where((numbered.c.row_number - 1) % shard_size == 0)
+        .order_by(numbered.c.id)
+    ).scalars().all()
+
+    return list(zip(first_ids, first_ids[1:] + [None]))
+
+def init_worker():
+    # Connections inherited from the parent process must not be used by the worker
+    engine.dispose(close=False)
+
+def get_executor():
+    """The shared process pool, so the workers are not started again for every request"""
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=plan_workers, initializer=init_worker)
+        return executor
+
+def discard_executor(pool):
+    """
+    Drop a broken process pool, a worker died and the pool takes no more work.
+    The next get_executor starts a new one, unless another request already did.
+    """
+    global executor
+    with executor_lock:
+        if executor is pool:
+            executor = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_executor():
+    """Stop the shared process pool, at shutdown"""
+    global executor
+    with executor_lock:
+        if executor is not None:
+            executor.shutdown()
+            executor = None
+
+def calculate_shard(min_id, max_id, from_start_date):
+    """
+    Load and calculate the plans of one shard, runs in a worker process with its
+    own database connection.
+
+    Returns:
+    - List of plans, or None when a customer in the shard is missing data
+    """
+    db = SessionLocal()
+    try:
+        result = []
+
+        for rows in get_data_from_db_to_calculate_all(db, min_id=min_id, max_id=max_id):
+            if not all(has_calculation_data(row) for row in rows):
+                return None
+
+            result.extend(calculate_plans_for_rows(rows, from_start_date))
+
+        return result
+    finally:
+        db.close()
+
+async def calculate_daily_calories_all_customers_parallel(from_start_date, db, shard_size=None):
+    """
+    Parallel version of calculate_daily_calories_all_customers, which calculates
+    the shards in the shared process pool and merges the results in customer id order.
+    """
+    shards = get_shards(db, shard_size or plan_shard_size)
+
+    if not shards:
+        return []
+
+    loop = asyncio.get_running_loop()
+
+    def run_shards(pool):
+        return asyncio.gather(*(
+            loop.run_in_executor(pool, calculate_shard, min_id, max_id, from_start_date)
+            for min_id, max_id in shards
+        ))
+
+    pool = get_executor()
+    try:
+        shard_results = await run_shards(pool)
+    except BrokenProcessPool:
+        # A worker was killed (out of memory, a crash), retried once in a new pool
+        discard_executor(pool)
+        shard_results = await run_shards(get_executor())
+
+    if any(shard_result is None for shard_result in shard_results):
+        raise HTTPException(status_code=404, detail='No data found')
+
+    return [plan for shard_result in shard_results for plan in shard_result]
@@ -0,0 +1,190 @@
+import os
+import re
+import sys
+from datetime import date
+
+from sqlalchemy import text, MetaData, Table, Column, Integer, Date, Index
+from sqlalchemy.schema import CreateIndex, DropIndex
+
+from services.functions import engine
+
+# Monthly partitions are created this many months ahead of the current month
+progress_partition_months_ahead = int(os.getenv("PROGRESS_PARTITION_MONTHS_AHEAD", 3))
+# Partitions that ended this many months ago get a BRIN index on date instead of their btree,
+# they are no longer written
+progress_brin_after_months = int(os.getenv("PROGRESS_BRIN_AFTER_MONTHS", 1))
+
+PARTITION_NAME = re.compile(r"^progress_(\d{4})_(\d{2})$")
+PARTITION_BOUND = re.compile(r"TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+def month_start(day):
+    return day.replace(day=1)
+
+def add_months(month, months):
+    """First day of the month a number of months after (or before) a month"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+    """Name of the partition of progress with the weigh-ins of a month, progress_YYYY_MM"""
+    return f"progress_{month:%Y_%m}"
+
+def partition_month(name):
+    """Month of a partition, None for tables that are not monthly partitions"""
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+def partition_table(month):
+    """The partition of a month, with the columns of its date indexes"""
+    return Table(partition_name(month), MetaData(), Column("id", Integer), Column("date", Date))
+
+def date_index(month, concurrently=True):
+    """Btree index of a partition on (date, id), while the month is written"""
+    table = partition_table(month)
+    return Index(f"ix_{table.name}_date_id", table.c.date, table.c.id, postgresql_concurrently=concurrently)
+
+def brin_index(month):
+    """BRIN index of a partition on date, once the month is over"""
+    table = partition_table(month)
+    return Index(f"ix_{table.name}_date_brin", table.c.date, postgresql_using="brin", postgresql_concurrently=True)
+
+def partitions_to_create(existing, today, first_month=None):
+    """
+    Months from the current month up to progress_partition_months_ahead without
+    a partition, from first_month on (the end of progress_legacy)
+    """
+    current = month_start(today)
+    return [
+        month for month in (add_months(current, x) for x in range(progress_partition_months_ahead + 1))
+        if month not in existing and (first_month is None or month >= first_month)
+    ]
+
+def partitions_for_brin(existing, today):
+    """Months that ended progress_brin_after_months or more ago"""
+    last = add_months(month_start(today), -progress_brin_after_months)
+    return sorted(month for month in existing if month < last)
+
+def partitions_to_detach(existing, before):
+    """Months before a month, oldest first"""
+    return sorted(month for month in existing if month < month_start(before))
+
+def is_partitioned(connection):
+    """Whether progress is a partitioned table, only on PostgreSQL after migration e7c5a1d9f432"""
+    if connection.dialect.name != "postgresql":
+        return False
+
+    return connection.execute(text(
+        "SELECT 1 FROM pg_partitioned_table JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid "
+        "WHERE pg_class.relname = 'progress' AND pg_class.relnamespace = current_schema()::regnamespace"
+    )).first() is not None
+
+def get_partitions(connection):
+    """Months of the monthly partitions attached to progress"""
+    rows = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'progress' AND parent.relnamespace = current_schema()::regnamespace"
+    )).scalars()
+
+    return {month for month in map(partition_month, rows) if month is not None}
+
+def get_legacy_bound(connection):
+    """First month after progress_legacy, the table attached by migration e7c5a1d9f432, None without it"""
+    bound = connection.execute(text(
+        "SELECT pg_get_expr(relpartbound, oid) FROM pg_class "
+        "WHERE relname = 'progress_legacy' AND relnamespace = current_schema()::regnamespace"
+    )).scalar()
+    match = PARTITION_BOUND.search(bound or "")
+
+    return date.fromisoformat(match.group(1)) if match else None
+
+def has_index(connection, index):
+    return connection.execute(text("SELECT to_regclass(:name)"), {"name": index.name}).scalar() is not None
+
+def maintain_partitions(bind=engine, today=None):
+    """
+    Create the partitions of the coming months and swap the btree index on
+    (date, id) of the partitions of past months for a BRIN index. Runs at
+    startup and nightly, a no-op unless progress is partitioned.
+
+    A new partition is created as a separate table with its btree index and
+    attached afterwards, which only takes a SHARE UPDATE EXCLUSIVE lock on
+    progress, so reads and writes go on. The indexes of past partitions are
+    built and dropped concurrently, on an autocommit connection.
+
+    Returns:
+    - Months of the created partitions and months that got a BRIN index
+    """
+    today = today or date.today()
+
+    with bind.begin() as connection:
+        if not is_partitioned(connection):
+            return [], []
+
+        # One instance at a time, the others find the partitions it created
+        connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('progress_partitions'))"))
+        existing = get_partitions(connection)
+
+        created = partitions_to_create(existing, today, get_legacy_bound(connection))
+        for month in created:
+            name = partition_name(month)
+            connection.execute(text(
+                f"CREATE TABLE {name} (LIKE progress INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            ))
+            # The table is empty, the index is built at once
+            connection.execute(CreateIndex(date_index(month, concurrently=False)))
+            connection.execute(text(
+                f"ALTER TABLE progress ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+            ))
+
+    brin = []
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("SELECT pg_advisory_lock(hashtext('progress_partitions'))"))
+        try:
+            for month in partitions_for_brin(existing, today):
+                if not has_index(connection, date_index(month)):
+                    continue
+
+                # An interrupted run leaves an invalid BRIN index, built again
+                connection.execute(DropIndex(brin_index(month), if_exists=True))
+                connection.execute(CreateIndex(brin_index(month)))
+                connection.execute(DropIndex(date_index(month)))
+                brin.append(month)
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(hashtext('progress_partitions'))"))
+
+    return created, brin
+
+def detach_partitions(before, bind=engine):
+    """
+    Detach the partitions of the months before a month for archival. DETACH
+    PARTITION CONCURRENTLY does not block queries on progress, but cannot run
+    in a transaction, so every partition is detached on an autocommit
+    connection. The detached tables stay as they are, to be dumped and dropped.
+
+    Returns:
+    - Names of the detached tables
+    """
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if not is_partitioned(connection):
+            return []
+
+        detached = []
+        for month in partitions_to_detach(get_partitions(connection), before):
+            name = partition_name(month)
+            connection.execute(text(f"ALTER TABLE progress DETACH PARTITION {name} CONCURRENTLY"))
+            detached.append(name)
+
+    return detached
+
+if __name__ == "__main__":
+    # Nightly job: python -m services.partitions
+    # Archival: python -m services.partitions detach YYYY-MM (detaches the months before YYYY-MM)
+    if sys.argv[1:2] == ["detach"]:
+        detached = detach_partitions(date.fromisoformat(f"{sys.argv[2]}-01"))
+        print(f"Detached {len(detached)} progress partitions: {', '.join(detached)}")
+    else:
+        created, brin = maintain_partitions()
+        print(f"Created {len(created)} progress partitions, added {len(brin)} BRIN indexes")
@@ -0,0 +1,91 @@
+from sqlalchemy import select, func, cast, Float
+
+from models.entities import Customer as CustomerTable
+from models.entities import Progress as ProgressTable
+from services.sql_functions import day_number
+
+# Rolling metrics of the progress series, calculated with window functions over
+# RANGE frames of days, so days without weigh-ins do not shift the windows.
+
+ANALYTICS_FIELDS = ("average_7d", "average_30d", "week_over_week", "trend_per_week")
+
+def analytics_statement(customer_id=None, gym_id=None):
+    """
+    Every weigh-in with:
+    - average_7d, average_30d: mean weight of the last 7 and 30 days
+    - week_over_week: the 7-day mean minus the mean of the 7 days before
+    - trend_per_week: least squares slope of the last 30 days in kg per week,
+      from window sums of the day numbers and weights
+    """
+    day = day_number(ProgressTable.date)
+
+    def window(expression, frame):
+        return expression.over(partition_by=ProgressTable.customer_id, order_by=day, range_=frame)
+
+    last_30_days = (-29, 0)
+    n = window(func.count(), last_30_days)
+    sum_x = window(func.sum(day), last_30_days)
+    sum_y = window(func.sum(ProgressTable.weight), last_30_days)
+    sum_xx = window(func.sum(day * day), last_30_days)
+    sum_xy = window(func.sum(day * ProgressTable.weight), last_30_days)
+
+    # NULL without two different days in the window
+    sxx = cast(n * sum_xx - sum_x * sum_x, Float)
+    slope = (n * sum_xy - sum_x * sum_y) / func.nullif(sxx, 0)
+
+    average_7d = window(func.avg(cast(ProgressTable.weight, Float)), (-6, 0))
+
+    statement = select(
+        ProgressTable.id,
+        ProgressTable.customer_id,
+        ProgressTable.date,
+        ProgressTable.weight,
+        average_7d.label("average_7d"),
+        window(func.avg(cast(ProgressTable.weight, Float)), last_30_days).label("average_30d"),
+        (average_7d - window(func.avg(cast(ProgressTable.weight, Float)), (-13, -7))).label("week_over_week"),
+        (slope * 7).label("trend_per_week")
+    )
+
+    if customer_id is not None:
+        statement = statement.where(ProgressTable.customer_id == customer_id)
+    if gym_id is not None:
+        statement = statement.where(
+            ProgressTable.customer_id.in_(select(CustomerTable.id).where(CustomerTable.gym_id == gym_id))
+        )
+
+    return statement
+
+def analytics_from_row(row):
+    return {
+        "date": row.date,
+        "weight": row.weight,
+        **{field: round(getattr(row, field), 2) if getattr(row, field) is not None else None
+           for field in ANALYTICS_FIELDS}
+    }
+
+def get_progress_analytics(customer_id, db):
+    """Rolling metrics of every weigh-in of a customer, in one query"""
+    statement = analytics_statement(customer_id=customer_id).subquery()
+
+    return [
+        analytics_from_row(row)
+        for row in db.execute(select(statement).order_by(statement.c.date, statement.c.id))
+    ]
+
+def get_latest_analytics(gym_id, db):
+    """The rolling metrics of the latest weigh-in of every member of a gym, in one query"""
+    statement = analytics_statement(gym_id=gym_id).subquery()
+    latest = select(
+        statement,
+        func.row_number().over(
+            partition_by=statement.c.customer_id,
+            order_by=(statement.c.date.desc(), statement.c.id.desc())
+        ).label("row_number")
+    ).subquery()
+
+    return {
+        row.customer_id: analytics_from_row(row)
+        for row in db.execute(
+            select(latest).where(latest.c.row_number == 1).order_by(latest.c.customer_id)
+        )
+    }
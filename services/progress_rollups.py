@@ -0,0 +1,145 @@
+from datetime import timedelta
+
+from sqlalchemy import select, insert, delete, func, cast, Float
+
+from models.entities import Customer as CustomerTable
+from models.entities import Progress as ProgressTable
+from models.entities import ProgressRollup as ProgressRollupTable
+from services.functions import SessionLocal
+from services.sql_functions import date_bucket
+
+def week_start(day):
+    """Monday of the week of a date, the date_bucket of a week"""
+    return day - timedelta(days=day.weekday())
+
+def bucket_statement(unit, customer_id=None, start=None, end=None):
+    """
+    Minimum, maximum, mean and last weight per day, week or month, grouped in
+    SQL. For one customer the rows come from ix_progress_customer_id_date,
+    start (inclusive) and end (exclusive) limit the dates. Progress without a
+    customer is left out.
+    """
+    bucket = date_bucket(unit, ProgressTable.date)
+    rows = select(
+        ProgressTable.customer_id,
+        bucket.label("bucket"),
+        ProgressTable.weight,
+        func.first_value(ProgressTable.weight).over(
+            partition_by=(ProgressTable.customer_id, bucket),
+            order_by=(ProgressTable.date.desc(), ProgressTable.id.desc())
+        ).label("last_weight")
+    )
+
+    if customer_id is not None:
+        rows = rows.where(ProgressTable.customer_id == customer_id)
+    else:
+        # Progress of deleted customers is left behind without a customer
+        rows = rows.where(ProgressTable.customer_id.isnot(None))
+    if start is not None:
+        rows = rows.where(ProgressTable.date >= start)
+    if end is not None:
+        rows = rows.where(ProgressTable.date < end)
+
+    rows = rows.subquery()
+
+    return (
+        select(
+            rows.c.customer_id,
+            rows.c.bucket,
+            func.count().label("measurements"),
+            func.sum(rows.c.weight).label("weight_sum"),
+            func.min(rows.c.weight).label("min_weight"),
+            func.max(rows.c.weight).label("max_weight"),
+            func.max(rows.c.last_weight).label("last_weight")
+        )
+        .group_by(rows.c.customer_id, rows.c.bucket)
+        .order_by(rows.c.customer_id, rows.c.bucket)
+    )
+
+def get_progress_buckets(customer_id, unit, db, start=None, end=None):
+    """Progress of a customer per day, week or month, start (inclusive) and end (exclusive) limit the dates"""
+    return [
+        {
+            "bucket": row.bucket,
+            "measurements": row.measurements,
+            "min_weight": row.min_weight,
+            "max_weight": row.max_weight,
+            "mean_weight": round(row.weight_sum / row.measurements, 2),
+            "last_weight": row.last_weight
+        }
+        for row in db.execute(bucket_statement(unit, customer_id, start, end))
+    ]
+
+def refresh_progress_rollup(customer_id, day, db):
+    """
+    Recalculate the weekly rollup of a customer for the week of a new or changed
+    weigh-in. Must be called before the commit of the change, after a flush.
+    Only reads the progress of that week.
+    """
+    week = week_start(day)
+    row = db.execute(bucket_statement("week", customer_id, week, week + timedelta(days=7))).fetchone()
+
+    db.query(ProgressRollupTable).filter(ProgressRollupTable.customer_id == customer_id,
+                                         ProgressRollupTable.week == week).delete()
+
+    if row is not None:
+        db.execute(insert(ProgressRollupTable).values(
+            customer_id=customer_id,
+            week=week,
+            measurements=row.measurements,
+            weight_sum=row.weight_sum,
+            min_weight=row.min_weight,
+            max_weight=row.max_weight,
+            last_weight=row.last_weight
+        ))
+
+def get_gym_weekly_series(gym_id, db):
+    """
+    Average weight of the members of a gym per week, from the rollups. Every
+    member counts once per week, with their mean weight of that week.
+    """
+    member_mean = cast(ProgressRollupTable.weight_sum, Float) / ProgressRollupTable.measurements
+
+    return [
+        {"week": row.week, "members": row.members, "average_weight": round(row.average_weight, 2)}
+        for row in db.execute(
+            select(
+                ProgressRollupTable.week,
+                func.count().label("members"),
+                func.avg(member_mean).label("average_weight")
+            )
+            .join(CustomerTable, CustomerTable.id == ProgressRollupTable.customer_id)
+            .where(CustomerTable.gym_id == gym_id)
+            .group_by(ProgressRollupTable.week)
+            .order_by(ProgressRollupTable.week)
+        )
+    ]
+
+def rebuild_progress_rollups(db):
+    """
+    Recalculate the weekly rollups of all customers in one INSERT ... SELECT,
+    for backfills and recovery.
+
+    Returns:
+    - Number of stored rollups
+    """
+    db.execute(delete(ProgressRollupTable))
+
+    rollups = bucket_statement("week").subquery()
+    db.execute(
+        insert(ProgressRollupTable).from_select(
+            ["customer_id", "week", "measurements", "weight_sum", "min_weight", "max_weight", "last_weight"],
+            select(rollups)
+        )
+    )
+    db.commit()
+
+    return db.query(ProgressRollupTable).count()
+
+if __name__ == "__main__":
+    # Full rebuild: python -m services.progress_rollups
+    session = SessionLocal()
+    try:
+        print(f"Rebuilt {rebuild_progress_rollups(session)} weekly progress rollups")
+    finally:
+        session.close()
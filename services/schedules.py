@@ -0,0 +1,115 @@
+import os
+import json
+from datetime import date
+
+import numpy as np
+
+from services.functions import get_data_from_db_to_calculate_all, calculate_daily_calories_and_macros_batch, \
+    plans_from_batch, has_calculation_data
+from services.formulas import bmr_formula_indexes, macro_profile_indexes
+
+# Customers per chunk of the batch schedules, every customer adds one row per remaining day
+schedule_chunk_size = int(os.getenv("SCHEDULE_CHUNK_SIZE", 500))
+
+def ages_on_dates(birth_dates, dates, index=None):
+    """
+    Vectorized calculate_age on the given days (datetime64[D] array). With an
+    index, dates[i] is a day of the customer born on birth_dates[index[i]].
+    """
+    years = dates.astype("datetime64[Y]").astype(int) + 1970
+    months = dates.astype("datetime64[M]").astype(int) % 12 + 1
+    days = (dates - dates.astype("datetime64[M]")).astype(int) + 1
+
+    birth_years = np.array([x.year for x in birth_dates])
+    birth_month_days = np.array([x.month * 100 + x.day for x in birth_dates])
+
+    if index is not None:
+        birth_years, birth_month_days = birth_years[index], birth_month_days[index]
+
+    return years - birth_years - (months * 100 + days < birth_month_days)
+
+def calculate_schedules(rows, first_day=None):
+    """
+    Day-by-day plans from first_day (default today) until the goal's end date.
+
+    The weight is projected to go down (or up) linearly from the current weight
+    to the weight goal, which keeps the daily deficit constant. BMR, TDEE,
+    calories and macros are recalculated for the projected weight and age of
+    every day, in one batch over all days of all rows (ragged layout).
+
+    Parameters:
+    - rows: dictionaries with the keys of get_data_from_db_to_calculate
+    - first_day: date of the first day of the schedules
+
+    Returns:
+    - One list of day dictionaries per row, empty when the goal has already ended
+    """
+    first_day = first_day or date.today()
+
+    days = np.array([max((row["end_date"] - first_day).days, 0) for row in rows], dtype=np.int64)
+    total = int(days.sum())
+
+    if total == 0:
+        return [[] for _ in rows]
+
+    # Row of every day and day number within its row
+    row_index = np.repeat(np.arange(len(rows)), days)
+    day_number = np.arange(total) - np.repeat(np.cumsum(days) - days, days)
+
+    weights = np.array([row["weight"] for row in rows], dtype=np.float64)[row_index]
+    weight_goals = np.array([row["weight_goal"] for row in rows], dtype=np.float64)[row_index]
+    days_left = (days[row_index] - day_number).astype(np.float64)
+
+    projected_weights = weights - (weights - weight_goals) * day_number / days[row_index]
+    dates = np.datetime64(first_day, "D") + day_number
+
+    batch = calculate_daily_calories_and_macros_batch(
+        projected_weights,
+        weight_goals,
+        days_left,
+        np.array([row["length"] for row in rows], dtype=np.float64)[row_index],
+        ages_on_dates([row["birth_date"] for row in rows], dates, row_index),
+        np.array([row["gender"] for row in rows])[row_index],
+        np.array([row["activity_level"] for row in rows], dtype=np.float64)[row_index],
+        bmr_formula_indexes([row.get("bmr_formula") for row in rows])[row_index],
+        macro_profile_indexes([row.get("macro_profile") for row in rows])[row_index]
+    )
+
+    schedule = [
+        {
+            "date": day,
+            "projected_weight": weight,
+            "bmr": bmr,
+            "total_energy_exp": total_energy_exp,
+            **plan
+        }
+        for day, weight, bmr, total_energy_exp, plan in zip(
+            dates.astype(str).tolist(),
+            np.round(projected_weights, 2).tolist(),
+            np.round(batch["bmr"], 2).tolist(),
+            np.round(batch["total_energy_exp"], 2).tolist(),
+            plans_from_batch(batch)
+        )
+    ]
+
+    bounds = np.cumsum(days).tolist()
+    return [schedule[start:end] for start, end in zip([0] + bounds[:-1], bounds)]
+
+def stream_schedules(db, gym_id=None):
+    """
+    Schedules of all customers (or the members of one gym) as NDJSON, one line
+    per customer, calculated in chunks of schedule_chunk_size customers.
+    """
+    try:
+        for rows in get_data_from_db_to_calculate_all(db, gym_id, chunk_size=schedule_chunk_size):
+            complete_rows = [row for row in rows if has_calculation_data(row)]
+            schedules = iter(calculate_schedules(complete_rows) if complete_rows else [])
+
+            yield "".join(
+                json.dumps({"customer_id": row["customer_id"], "schedule": next(schedules)}
+                           if has_calculation_data(row) else
+                           {"customer_id": row["customer_id"], "error": "No data found"}) + "\n"
+                for row in rows
+            )
+    finally:
+        db.close()
@@ -0,0 +1,68 @@
+from sqlalchemy import Integer, Date, literal_column
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+# SQL constructs that compile differently per database, production runs on
+# PostgreSQL and the tests on SQLite
+
+class days_between(FunctionElement):
+    """Number of days from the second date to the first one, like (end - start).days"""
+    type = Integer()
+    name = "days_between"
+    inherit_cache = True
+
+@compiles(days_between)
+def compile_days_between(element, compiler, **kw):
+    end, start = list(element.clauses)
+    return "CAST(julianday(%s) - julianday(%s) AS INTEGER)" % (compiler.process(end, **kw),
+                                                                compiler.process(start, **kw))
+
+@compiles(days_between, "postgresql")
+def compile_days_between_postgresql(element, compiler, **kw):
+    # Subtracting two dates gives an integer number of days
+    end, start = list(element.clauses)
+    return "(%s - %s)" % (compiler.process(end, **kw), compiler.process(start, **kw))
+
+DATE_BUCKETS = ("day", "week", "month")
+
+class date_bucket(FunctionElement):
+    """First day of the day, week (starting on Monday) or month of a date, like date_trunc"""
+    type = Date()
+    name = "date_bucket"
+    inherit_cache = True
+
+    def __init__(self, unit, expression, **kwargs):
+        if unit not in DATE_BUCKETS:
+            raise ValueError(f"Unknown date bucket '{unit}'")
+        # The unit is part of the SQL text, so statements per unit are cached separately
+        super().__init__(literal_column(f"'{unit}'"), expression, **kwargs)
+
+@compiles(date_bucket)
+def compile_date_bucket(element, compiler, **kw):
+    unit, expression = list(element.clauses)
+    modifiers = {
+        "'day'": "",
+        # Forward to Sunday (unless it is one), then back to Monday
+        "'week'": ", 'weekday 0', '-6 days'",
+        "'month'": ", 'start of month'"
+    }[unit.name]
+    return "date(%s%s)" % (compiler.process(expression, **kw), modifiers)
+
+@compiles(date_bucket, "postgresql")
+def compile_date_bucket_postgresql(element, compiler, **kw):
+    unit, expression = list(element.clauses)
+    return "CAST(date_trunc(%s, %s) AS DATE)" % (compiler.process(unit, **kw), compiler.process(expression, **kw))
+
+class day_number(FunctionElement):
+    """Number of days since 1970-01-01, an integer to order RANGE window frames by days"""
+    type = Integer()
+    name = "day_number"
+    inherit_cache = True
+
+@compiles(day_number)
+def compile_day_number(element, compiler, **kw):
+    return "CAST(julianday(%s) - 2440587.5 AS INTEGER)" % compiler.process(list(element.clauses)[0], **kw)
+
+@compiles(day_number, "postgresql")
+def compile_day_number_postgresql(element, compiler, **kw):
+    return "(%s - DATE '1970-01-01')" % compiler.process(list(element.clauses)[0], **kw)
@@ -0,0 +1,152 @@
+import json
+from datetime import date
+
+from fastapi.exceptions import HTTPException
+from sqlalchemy import select, case, cast, extract, func, or_, and_, Float, Numeric
+
+from services.sql_functions import days_between
+from services.functions import calculation_data_statement, bulk_chunk_size, NO_DATA_ERROR, NO_DAYS_LEFT_ERROR
+from services.formulas import GOAL_TYPES, MACRONUTRIENTS, CALORIES_PER_GRAM, BMR_FORMULAS, BMR_COEFFICIENTS, \
+    MACRO_PROFILE_NAMES, MACRO_RATIOS, DEFAULT_BMR_FORMULA, DEFAULT_MACRO_PROFILE
+
+def sql_round(expression):
+    # PostgreSQL only has round(numeric, int)
+    return func.round(cast(expression, Numeric), 2)
+
+def bmr_coefficient(formula, is_male, k):
+    """Coefficient k of the BMR formula of the gym, as a CASE over the compiled table"""
+    return case(
+        *[
+            (and_(formula == name, is_male), BMR_COEFFICIENTS[i][0][k])
+            for i, name in enumerate(BMR_FORMULAS)
+        ],
+        *[(formula == name, BMR_COEFFICIENTS[i][1][k]) for i, name in enumerate(BMR_FORMULAS)]
+    )
+
+def macro_ratio(profile, goal_type, j):
+    """Ratio of macro j for the macro profile of the gym and the goal type, as a CASE over the compiled table"""
+    return case(
+        *[
+            (and_(profile == name, goal_type == g), MACRO_RATIOS[i][g][j])
+            for i, name in enumerate(MACRO_PROFILE_NAMES) for g in range(len(GOAL_TYPES))
+        ]
+    )
+
+def plan_statement(from_start_date, gym_id=None, today=None):
+    """
+    Select the plans of all customers (or the customers of one gym), calculated
+    by the database with the same formulas as calculate_daily_calories_and_macros
+    and the BMR formula and macro profile of the gym.
+
+    Only the plans leave the database, the calculation data is not loaded. The
+    plan columns are NULL for customers that are missing progress or goals
+    (missing_data) and for goals without days left.
+    """
+    today = today or date.today()
+    data = calculation_data_statement(gym_id).subquery()
+
+    weight = cast(data.c.weight, Float)
+    weight_goal = cast(data.c.weight_goal, Float)
+    deadline_in_days = days_between(data.c.end_date, data.c.start_date if from_start_date else data.c.date)
+
+    # Same as calculate_age, with today bound as a parameter
+    age = today.year - extract("year", data.c.birth_date) - case(
+        (extract("month", data.c.birth_date) * 100 + extract("day", data.c.birth_date)
+         > today.month * 100 + today.day, 1),
+        else_=0
+    )
+
+    # BMR with the formula of the gym
+    formula = func.coalesce(data.c.bmr_formula, DEFAULT_BMR_FORMULA)
+    is_male = data.c.gender == 'male'
+    bmr = (bmr_coefficient(formula, is_male, 0) * weight + bmr_coefficient(formula, is_male, 1)
+           * cast(data.c.length, Float) + bmr_coefficient(formula, is_male, 2) * age
+           + bmr_coefficient(formula, is_male, 3))
+    total_energy_exp = bmr * data.c.activity_level
+
+    weight_change = weight - weight_goal
+    daily_deficit = weight_change * 7700 / func.nullif(deadline_in_days, 0)
+    daily_calories = total_energy_exp - daily_deficit
+
+    goal_type = case((weight_change > 0, 0), (weight_change < 0, 2), else_=1)
+    profile = func.coalesce(data.c.macro_profile, DEFAULT_MACRO_PROFILE)
+
+    macro_columns = []
+    for j, macro in enumerate(MACRONUTRIENTS):
+        ratio = macro_ratio(profile, goal_type, j)
+        macro_calories = daily_calories * ratio
+
+        macro_columns += [
+            sql_round(macro_calories / CALORIES_PER_GRAM[j]).label(f"{macro}_grams"),
+            sql_round(macro_calories).label(f"{macro}_calories"),
+            sql_round(ratio * 100).label(f"{macro}_percentage")
+        ]
+
+    return (
+        select(
+            data.c.customer_id,
+            or_(data.c.weight.is_(None), data.c.weight_goal.is_(None)).label("missing_data"),
+            sql_round(daily_calories).label("total_daily_calories"),
+            goal_type.label("goal_type"),
+            *macro_columns
+        )
+        .order_by(data.c.customer_id.asc())
+    )
+
+def plan_from_row(row):
+    """Convert a row of plan_statement into the dictionary of calculate_daily_calories_and_macros."""
+    if row["total_daily_calories"] is None:
+        # Same behaviour as the app-side calculation for a goal without any days left
+        raise ZeroDivisionError("division by zero")
+
+    return {
+        'total_daily_calories': float(row["total_daily_calories"]),
+        'macronutrients': {
+            macro: {
+                'grams': float(row[f"{macro}_grams"]),
+                'calories': float(row[f"{macro}_calories"]),
+                'percentage': float(row[f"{macro}_percentage"])
+            }
+            for macro in MACRONUTRIENTS
+        },
+        'goal_type': GOAL_TYPES[row["goal_type"]]
+    }
+
+def plan_or_error(row):
+    """The plan of a row of plan_statement, or the error of a customer without a plan"""
+    if row["missing_data"]:
+        return {"error": NO_DATA_ERROR}
+
+    # The plan columns are NULL for a goal without days left
+    if row["total_daily_calories"] is None:
+        return {"error": NO_DAYS_LEFT_ERROR}
+
+    return plan_from_row(row)
+
+def get_plans_from_db(from_start_date, db, gym_id=None, chunk_size=None):
+    """Generator of chunks of plan_statement rows, streamed like get_data_from_db_to_calculate_all."""
+    statement = plan_statement(from_start_date, gym_id)
+    result = db.execute(statement.execution_options(yield_per=chunk_size or bulk_chunk_size))
+
+    for partition in result.mappings().partitions():
+        yield partition
+
+def calculate_daily_calories_all_customers_sql(from_start_date, db):
+    """SQL-side version of calculate_daily_calories_all_customers."""
+    result = []
+
+    for rows in get_plans_from_db(from_start_date, db):
+        if any(row["missing_data"] for row in rows):
+            raise HTTPException(status_code=404, detail='No data found')
+
+        result.extend(plan_from_row(row) for row in rows)
+
+    return result
+
+def stream_daily_calories_all_customers_sql(from_start_date, db):
+    """SQL-side version of stream_daily_calories_all_customers."""
+    try:
+        for rows in get_plans_from_db(from_start_date, db):
+            yield "".join(json.dumps({"customer_id": row["customer_id"], **plan_or_error(row)}) + "\n" for row in rows)
+    finally:
+        db.close()
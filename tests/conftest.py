@@ -0,0 +1,12 @@
+import pytest
+
+from services.cache import plan_cache, expiring_goals_cache
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Cached plans and goals should not leak between tests."""
+    plan_cache.clear()
+    expiring_goals_cache.clear()
+    yield
+    plan_cache.clear()
+    expiring_goals_cache.clear()
@@ -0,0 +1,61 @@
+from datetime import date
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from models.entities import Progress
+from services import anomalies
+from services.anomalies import update_stats, check_weight, check_progress
+
+def test_update_stats():
+    """It should give the same mean and variance as a calculation over all weights"""
+    weights = [80, 82, 79, 85, 81, 80, 78]
+    count, mean, m2 = 0, 0.0, 0.0
+    for weight in weights:
+        count, mean, m2 = update_stats(count, mean, m2, weight)
+
+    assert count == len(weights)
+    assert mean == pytest.approx(np.mean(weights))
+    assert m2 / (count - 1) == pytest.approx(np.var(weights, ddof=1))
+
+def stats(weights):
+    count, mean, m2 = 0, 0.0, 0.0
+    for weight in weights:
+        count, mean, m2 = update_stats(count, mean, m2, weight)
+    return count, mean, m2
+
+def test_check_weight_outlier():
+    """It should flag a weight far from the mean, in both directions"""
+    state = stats([80, 82, 79, 81, 80, 78])
+
+    assert check_weight(*state, 81) is None
+    assert check_weight(*state, 95)["z_score"] > anomalies.anomaly_z_score
+    assert check_weight(*state, 60)["z_score"] < -anomalies.anomaly_z_score
+    assert check_weight(*state, 95)["expected_weight"] == 80
+
+def test_check_weight_too_few_measurements():
+    """It should not check weights before there are enough earlier weigh-ins"""
+    assert check_weight(*stats([80, 80]), 200) is None
+
+def test_check_weight_minimum_std():
+    """It should not flag small changes of a customer with a stable weight"""
+    state = stats([80] * 10)
+
+    assert check_weight(*state, 82) is None
+    assert check_weight(*state, 84)["std"] == anomalies.anomaly_min_std
+
+def test_check_progress_locks_and_upserts():
+    """It should lock the customer before reading the state and write the state with an upsert"""
+    mock_db = MagicMock()
+    mock_db.get_bind.return_value.dialect.name = "postgresql"
+    mock_db.execute.return_value.fetchone.return_value = None
+
+    assert check_progress(Progress(id=1, customer_id=1, date=date(2024, 6, 1), weight=80), mock_db) is None
+
+    statements = [str(call.args[0].compile(dialect=postgresql.dialect())) for call in mock_db.execute.call_args_list]
+    assert "FOR UPDATE" in statements[0]
+    assert "progress_stats" in statements[1]
+    assert "ON CONFLICT (customer_id) DO UPDATE" in statements[-1]
+    mock_db.merge.assert_not_called()
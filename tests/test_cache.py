@@ -0,0 +1,75 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+
+from services.cache import MidnightCache
+
+def test_cache_hit_and_miss():
+    cache = MidnightCache(max_size=10)
+
+    assert cache.get((1, False)) is None
+    cache.set((1, False), {"realism": True})
+
+    assert cache.get((1, False)) == {"realism": True}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_cache_evicts_least_recently_used():
+    cache = MidnightCache(max_size=2)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    cache.get(1)  # 2 is now the least recently used
+    cache.set(3, "c")
+
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+    assert cache.get(3) == "c"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+def test_cache_expires_at_midnight():
+    cache = MidnightCache(max_size=10)
+    cache.set(1, "a")
+
+    tomorrow = date.today() + timedelta(days=1)
+    with patch("services.cache.date") as mock_date:
+        mock_date.today.return_value = tomorrow
+        assert cache.get(1) is None
+
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["size"] == 0
+
+def test_cache_invalidate():
+    cache = MidnightCache(max_size=10)
+    cache.set((1, False), "a")
+    cache.set((1, True), "b")
+    cache.set((2, False), "c")
+
+    cache.invalidate((1, False), (1, True))
+
+    assert cache.get((1, False)) is None
+    assert cache.get((1, True)) is None
+    assert cache.get((2, False)) == "c"
+    assert cache.stats()["invalidations"] == 2
+
+def test_cache_invalidate_all():
+    cache = MidnightCache(max_size=10)
+    cache.set((7, None), "a")
+    cache.set((7, 1), "b")
+    cache.get((7, None))
+
+    cache.invalidate_all()
+
+    assert cache.get((7, None)) is None
+    assert cache.stats()["invalidations"] == 2
+    # The counters are kept, unlike clear
+    assert cache.stats()["hits"] == 1
+
+def test_cache_generation():
+    """It should not serve an entry stored for an older generation, bumped by a write on any replica"""
+    cache = MidnightCache(max_size=10)
+    cache.set(1, "a", generation=3)
+
+    assert cache.get(1, generation=3) == "a"
+    assert cache.get(1, generation=4) is None
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,72 @@
+from datetime import date, timedelta
+
+import pytest
+
+from services.calibration import calibrate_rows
+
+TODAY = date(2024, 6, 1)
+
+def customer_row(customer_id, **kwargs):
+    return {
+        "customer_id": customer_id,
+        "weight": 87,
+        "start_weight": 87,
+        "date": TODAY,
+        "weight_goal": 80,
+        "start_date": TODAY - timedelta(days=30),
+        "end_date": TODAY + timedelta(days=70),
+        "activity_level": 1.5,
+        "length": 180,
+        "gender": "male",
+        "birth_date": date(1990, 1, 1),
+        **kwargs
+    }
+
+def weigh_ins(customer_id, kg_per_day, days=31, first_weight=90):
+    return [(customer_id, TODAY - timedelta(days=days - 1 - x), first_weight + kg_per_day * x) for x in range(days)]
+
+def test_calibrate_rows():
+    """The activity level should match when the weight changes as planned, and be lower when it changes slower"""
+    # Arrange
+    rows = [customer_row(1), customer_row(2), customer_row(3), customer_row(4, weight_goal=None)]
+
+    # 7 kg in 100 days is a deficit of 539 kcal per day, or 0.07 kg per day
+    data = weigh_ins(1, -0.07) + weigh_ins(2, -0.02) + weigh_ins(3, -0.07, days=10) + weigh_ins(4, -0.1)
+    data += [(1, TODAY - timedelta(days=60), 120)]  # before the start of the goal
+
+    # Act
+    calibrations = calibrate_rows(rows, *zip(*data), today=TODAY)
+
+    # Assert
+    assert calibrations[0]["measurements"] == 31
+    assert calibrations[0]["weight_trend"] == -0.49
+    assert calibrations[0]["observed_tdee"] == pytest.approx(calibrations[0]["bmr"] * 1.5, abs=0.01)
+    assert calibrations[0]["suggested_activity_level"] == 1.5
+
+    assert calibrations[1]["observed_tdee"] == pytest.approx(calibrations[0]["observed_tdee"] - 385, abs=0.01)
+    assert calibrations[1]["suggested_activity_level"] < 1.5
+
+    # Not enough days of weigh-ins, no goal
+    assert calibrations[2] is None
+    assert calibrations[3] is None
+
+def test_calibrate_rows_clipped():
+    """The suggested activity level should stay within the allowed range"""
+    data = weigh_ins(1, 0.2) + weigh_ins(2, -0.5)
+
+    calibrations = calibrate_rows([customer_row(1), customer_row(2)], *zip(*data), today=TODAY)
+
+    assert calibrations[0]["suggested_activity_level"] == 1.2
+    assert calibrations[1]["suggested_activity_level"] == 1.725
+
+def test_calibrate_rows_start_weight():
+    """The planned intake should be the plan for the weight at the start of the goal, not the latest weight"""
+    data = weigh_ins(1, -0.07) + weigh_ins(2, -0.07)
+
+    calibrations = calibrate_rows([customer_row(1), customer_row(2, weight=83)], *zip(*data), today=TODAY)
+
+    assert calibrations[1]["planned_intake"] == calibrations[0]["planned_intake"]
+    assert calibrations[1]["suggested_activity_level"] == calibrations[0]["suggested_activity_level"] == 1.5
+
+def test_calibrate_rows_without_weigh_ins():
+    assert calibrate_rows([customer_row(1)], (), (), (), today=TODAY) == [None]
@@ -0,0 +1,85 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from fastapi import HTTPException
+from datetime import date, timedelta
+
+from routers.calories import simulate_daily_calorie_intake
+from schemas.dtos import CalorieSimulationDTO, GoalScenarioDTO
+from services.functions import calculate_daily_calories_and_macros, calculate_age
+
+mock_customer_data = {
+    "weight": 90,
+    "date": date.today() - timedelta(days=2),
+    "length": 180,
+    "birth_date": date(1990, 1, 1),
+    "gender": "male",
+    "activity_level": 1.4
+}
+
+@pytest.mark.asyncio
+async def test_simulate_daily_calorie_intake():
+    # Arrange
+    mock_db = MagicMock()
+    simulation = CalorieSimulationDTO(customer_id=1, scenarios=[
+        GoalScenarioDTO(weight_goal=85, end_date=date.today() + timedelta(days=60)),
+        GoalScenarioDTO(weight_goal=60, end_date=date.today() + timedelta(days=30)),
+        GoalScenarioDTO(weight_goal=95, end_date=date.today() + timedelta(days=90))
+    ])
+
+    # Act
+    with patch("routers.calories.get_customer_profile", return_value=mock_customer_data):
+        response = await simulate_daily_calorie_intake(simulation, db=mock_db)
+
+    # Assert
+    age = calculate_age(mock_customer_data["birth_date"])
+    assert [x["deadline_in_days"] for x in response["scenarios"]] == [62, 32, 92]
+    assert response["scenarios"][0]["detailed_daily_cal_intake"] == \
+        calculate_daily_calories_and_macros(90, 85, 62, 180, age, "male", 1.4)
+    assert [x["realism"] for x in response["scenarios"]] == [True, False, True]
+    assert response["scenarios"][2]["detailed_daily_cal_intake"]["goal_type"] == "musclegain"
+
+    # Nothing is written
+    mock_db.add.assert_not_called()
+    mock_db.commit.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_simulate_daily_calorie_intake_from_start_date():
+    mock_db = MagicMock()
+    simulation = CalorieSimulationDTO(customer_id=1, from_start_date=True, scenarios=[
+        GoalScenarioDTO(weight_goal=85, start_date=date.today() + timedelta(days=10),
+                        end_date=date.today() + timedelta(days=60)),
+        GoalScenarioDTO(weight_goal=85, end_date=date.today() + timedelta(days=60))
+    ])
+
+    with patch("routers.calories.get_customer_profile", return_value=mock_customer_data):
+        response = await simulate_daily_calorie_intake(simulation, db=mock_db)
+
+    assert [x["deadline_in_days"] for x in response["scenarios"]] == [50, 60]
+
+@pytest.mark.asyncio
+async def test_simulate_daily_calorie_intake_customer_not_found():
+    mock_db = MagicMock()
+    simulation = CalorieSimulationDTO(customer_id=99, scenarios=[
+        GoalScenarioDTO(weight_goal=85, end_date=date.today() + timedelta(days=60))
+    ])
+
+    with patch("routers.calories.get_customer_profile", return_value=None):
+        with pytest.raises(HTTPException) as exc:
+            await simulate_daily_calorie_intake(simulation, db=mock_db)
+
+    assert exc.value.status_code == 404
+    assert exc.value.detail == "the customer with id 99 does not exist or is missing essential data"
+
+@pytest.mark.asyncio
+async def test_simulate_daily_calorie_intake_server_error():
+    mock_db = MagicMock()
+    simulation = CalorieSimulationDTO(customer_id=1, scenarios=[
+        GoalScenarioDTO(weight_goal=85, end_date=date.today() + timedelta(days=60))
+    ])
+
+    with patch("routers.calories.get_customer_profile", side_effect=Exception("Database error")):
+        with pytest.raises(HTTPException) as exc:
+            await simulate_daily_calorie_intake(simulation, db=mock_db)
+
+    assert exc.value.status_code == 500
+    assert exc.value.detail == "An error occurred: Database error"
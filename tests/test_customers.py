@@ -9,6 +9,8 @@ from schemas.responses import CustomerResponse, SingleCustomerResponse, Customer
 from models.entities import Customer as CustomerTable
 from models.entities import Goal as GoalsTable
 from models.entities import Progress as ProgressTable
+from models.entities import DailyPlan as DailyPlanTable
+from services.functions import calculate_age
 from datetime import timedelta, datetime, date
 
 
@@ -604,7 +606,8 @@ async def test_get_daily_calorie_intake_success():
         "fats": 70
     }
 
-    with patch("routers.customers.get_data_from_db_to_calculate", return_value=mock_customer_data):
+    with patch("routers.customers.get_daily_plan", return_value=None), \
+            patch("routers.customers.get_data_from_db_to_calculate", return_value=mock_customer_data):
         with patch("routers.customers.calculate_daily_calories_and_macros", return_value=mock_calculation_result):
             response = await get_daily_calorie_intake(customer_id=customer_id, db=mock_db)
 
@@ -617,7 +620,8 @@ async def test_get_daily_calorie_intake_customer_not_found():
     mock_db = MagicMock()
     customer_id = 99
 
-    with patch("routers.customers.get_data_from_db_to_calculate", return_value=None):
+    with patch("routers.customers.get_daily_plan", return_value=None), \
+            patch("routers.customers.get_data_from_db_to_calculate", return_value=None):
         with pytest.raises(HTTPException) as exc:
             await get_daily_calorie_intake(customer_id=customer_id, db=mock_db)
 
@@ -629,9 +633,29 @@ async def test_get_daily_calorie_intake_server_error():
     mock_db = MagicMock()
     customer_id = 1
 
-    with patch("routers.customers.get_data_from_db_to_calculate", side_effect=Exception("Database error")):
+    with patch("routers.customers.get_daily_plan", return_value=None), \
+            patch("routers.customers.get_data_from_db_to_calculate", side_effect=Exception("Database error")):
         with pytest.raises(HTTPException) as exc:
             await get_daily_calorie_intake(customer_id=customer_id, db=mock_db)
 
         assert exc.value.status_code == 500
-        assert exc.value.detail == "An error occurred: Database error"
\ No newline at end of file
+        assert exc.value.detail == "An error occurred: Database error"
+
+@pytest.mark.asyncio
+async def test_get_daily_calorie_intake_stored_plan():
+    mock_db = MagicMock()
+    mock_plan = DailyPlanTable(
+        customer_id=1, weight=70, date=date.today() - timedelta(days=10), weight_goal=65,
+        start_date=date.today() - timedelta(days=30), end_date=date.today() + timedelta(days=30),
+        activity_level=1.4, length=175, gender="male", birth_date=date(1990, 1, 1),
+        age=calculate_age(date(1990, 1, 1)), plan={"total_daily_calories": 2000}, plan_from_start_date=None
+    )
+
+    with patch("routers.customers.get_daily_plan", return_value=mock_plan), \
+            patch("routers.customers.get_data_from_db_to_calculate") as mock_get_data:
+        response = await get_daily_calorie_intake(customer_id=1, db=mock_db)
+
+        mock_get_data.assert_not_called()
+        assert response["customer_data"]["weight_goal"] == 65
+        assert response["detailed_daily_cal_intake"] == {"total_daily_calories": 2000}
+        assert response["realism"] is True
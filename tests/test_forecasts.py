@@ -0,0 +1,75 @@
+import random
+from datetime import date, timedelta
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from services.forecasts import fit_trends, forecast_rows, forecast_customers
+
+def test_fit_trends_matches_polyfit():
+    """The grouped fit should give the least squares line of every group"""
+    # Arrange
+    rng = random.Random(1)
+    series = [[(rng.randint(-90, 0), rng.uniform(50, 120)) for _ in range(rng.randint(2, 40))] for _ in range(200)]
+    series = [x for x in series if len({day for day, _ in x}) > 1]
+    groups = [i for i, x in enumerate(series) for _ in x]
+    days, weights = zip(*[point for x in series for point in x])
+
+    # Act
+    slope, intercept, n = fit_trends(np.array(groups), days, weights, len(series))
+
+    # Assert
+    for i, x in enumerate(series):
+        expected_slope, expected_intercept = np.polyfit(*zip(*x), 1)
+        assert slope[i] == pytest.approx(expected_slope)
+        assert intercept[i] == pytest.approx(expected_intercept)
+        assert n[i] == len(x)
+
+def test_fit_trends_not_enough_data():
+    """Groups without two different days should have no trend"""
+    slope, intercept, n = fit_trends(np.array([0, 0, 1]), [-3, -3, -1], [80, 81, 70], 3)
+
+    assert np.isnan(slope).all()
+    assert n.tolist() == [2, 1, 0]
+
+def test_forecast_rows():
+    """It should project the weight at the end date and the date the goal is reached"""
+    # Arrange
+    today = date(2024, 1, 1)
+    rows = [
+        {"customer_id": 1, "weight_goal": 80, "end_date": date(2024, 3, 1)},
+        {"customer_id": 2, "weight_goal": 80, "end_date": date(2024, 3, 1)},
+        {"customer_id": 5, "weight_goal": 60, "end_date": date(2024, 3, 1)},
+        {"customer_id": 7, "weight_goal": None, "end_date": None}
+    ]
+    customer_ids = [1] * 11 + [2] * 11 + [5]
+    dates = [today - timedelta(days=x) for x in range(11)] * 2 + [today]
+    weights = [90 + x * 0.1 for x in range(11)] + [90 - x * 0.1 for x in range(11)] + [65]
+
+    # Act
+    forecasts = forecast_rows(rows, customer_ids, dates, weights, today)
+
+    # Assert
+    assert forecasts[0]["trend_per_week"] == -0.7
+    assert forecasts[0]["projected_weight"] == 84
+    assert forecasts[0]["estimated_goal_date"] == today + timedelta(days=100)
+    assert forecasts[0]["on_track"] is False
+    assert forecasts[0]["measurements"] == 11
+
+    assert forecasts[1]["estimated_goal_date"] is None
+    assert forecasts[1]["on_track"] is False
+
+    assert forecasts[2] == {"error": "Not enough data"}
+    assert forecasts[3] == {"error": "Not enough data"}
+
+def test_forecast_customers_one_customer():
+    """It should only read the progress and goals of the customer in the window subqueries"""
+    mock_db = MagicMock()
+    mock_db.execute.return_value.mappings.return_value = []
+
+    assert forecast_customers(mock_db, customer_id=5) == ([], [])
+
+    statement = str(mock_db.execute.call_args.args[0].compile(compile_kwargs={"literal_binds": True}))
+    assert "progress.customer_id >= 5 AND progress.customer_id < 6" in statement
+    assert "goals.customer_id >= 5 AND goals.customer_id < 6" in statement
@@ -0,0 +1,86 @@
+import json
+import random
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from services.formulas import load_macro_profiles, compile_macro_profiles, bmr_formula_index, check_selection, \
+    BMR_FORMULAS, DEFAULT_MACRO_PROFILES
+from services.functions import calculate_daily_calories_and_macros, calculate_daily_calories_and_macros_batch, \
+    plans_from_batch
+
+def custom_profile(protein=(0.3, 0.3), carb=(0.4, 0.4), fat=(0.3, 0.3)):
+    return {
+        goal_type: {"protein_ratio": protein, "carb_ratio": carb, "fat_ratio": fat}
+        for goal_type in ("weightloss", "maintenance", "musclegain")
+    }
+
+def test_bmr_formulas():
+    """The BMR formulas should give the published values"""
+    # Arrange
+    inputs = ([80, 60], [70, 55], [30] * 2, [180, 165], [30, 40], ["male", "female"], [1.2] * 2)
+
+    # Act
+    bmr = {
+        formula: calculate_daily_calories_and_macros_batch(*inputs, [formula] * 2)["bmr"]
+        for formula in BMR_FORMULAS
+    }
+
+    # Assert
+    assert bmr["mifflin_st_jeor"] == pytest.approx([1780, 1270.25])
+    assert bmr["harris_benedict"] == pytest.approx([1853.632, 1340.383])
+    assert bmr["katch_mcardle"] == pytest.approx([370 + 21.6 * 61.42, 370 + 21.6 * 44.865])
+
+def test_batch_matches_scalar_per_formula():
+    """The scalar and batch paths should give the same plans for every formula"""
+    # Arrange
+    rng = random.Random(3)
+    inputs = [
+        (rng.randint(45, 150), rng.randint(45, 150), rng.choice([7, 30, 365]), rng.randint(150, 210),
+         rng.randint(16, 90), rng.choice(["male", "female"]), rng.uniform(1.2, 1.725), rng.choice(BMR_FORMULAS))
+        for _ in range(1000)
+    ]
+
+    # Act
+    result = plans_from_batch(calculate_daily_calories_and_macros_batch(*zip(*inputs)))
+
+    # Assert
+    assert result == [calculate_daily_calories_and_macros(*x) for x in inputs]
+
+def test_load_macro_profiles():
+    """Configured profiles should be added to the default profile and compiled to midpoint ratios"""
+    # Act
+    profiles = load_macro_profiles(json.dumps({"keto": custom_profile(carb=(0.05, 0.1), fat=(0.6, 0.7))}))
+    names, ratios = compile_macro_profiles(profiles)
+
+    # Assert
+    assert names == ("default", "keto")
+    assert ratios.shape == (2, 3, 3)
+    assert ratios[1, 0].tolist() == pytest.approx([0.3, 0.075, 0.65])
+    assert ratios[0, 0].tolist() == pytest.approx([0.375, 0.325, 0.275])
+    assert profiles["default"] == DEFAULT_MACRO_PROFILES["default"]
+
+@pytest.mark.parametrize("profile", [
+    {"weightloss": custom_profile()["weightloss"]},               # missing goal types
+    {**custom_profile(), "maintenance": {"protein_ratio": [0.3, 0.4]}},  # missing macros
+    custom_profile(protein=(0.5, 0.4)),                           # min above max
+    custom_profile(fat=(0.3, 1.2)),                               # above 100%
+    custom_profile(carb="0.4")                                    # not a range
+])
+def test_load_macro_profiles_invalid(profile):
+    with pytest.raises(ValueError):
+        load_macro_profiles(json.dumps({"broken": profile}))
+
+def test_unknown_selection():
+    """Unknown names should be rejected"""
+    assert bmr_formula_index(None) == bmr_formula_index("mifflin_st_jeor")
+
+    with pytest.raises(ValueError):
+        bmr_formula_index("made_up")
+
+    with pytest.raises(HTTPException) as exc:
+        check_selection(macro_profile="made_up")
+
+    assert exc.value.status_code == 422
+    assert "made_up" in exc.value.detail
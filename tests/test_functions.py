@@ -0,0 +1,87 @@
+import random
+
+import pytest
+from fastapi import HTTPException
+from unittest.mock import MagicMock, patch
+from datetime import date, timedelta
+
+from services.functions import calculate_daily_calories_and_macros, calculate_daily_calories_and_macros_batch, \
+    plans_from_batch, calculate_daily_calories_all_customers, calculate_age, calculation_data_statement
+
+# Test batch engine
+def test_batch_matches_scalar():
+    """
+    The batch engine should give exactly the same numbers as the scalar function
+    """
+    # Arrange
+    rng = random.Random(42)
+    inputs = [
+        (
+            rng.randint(45, 150),               # current weight
+            rng.randint(45, 150),               # weight goal
+            rng.choice([-30, 1, 7, 30, 365]),   # deadline in days
+            rng.randint(150, 210),              # height
+            rng.randint(16, 90),                # age
+            rng.choice(['male', 'female']),     # gender
+            rng.uniform(1.2, 1.725)             # activity level
+        )
+        for _ in range(5000)
+    ]
+    inputs.append((80, 80, 30, 180, 30, 'male', 1.4))  # maintenance
+
+    # Act
+    batch = calculate_daily_calories_and_macros_batch(*zip(*inputs))
+    result = plans_from_batch(batch)
+
+    # Assert
+    assert result == [calculate_daily_calories_and_macros(*x) for x in inputs]
+
+def test_batch_zero_deadline():
+    with pytest.raises(ZeroDivisionError):
+        calculate_daily_calories_and_macros_batch([80], [70], [0], [180], [30], ['male'], [1.4])
+
+def test_calculate_daily_calories_all_customers():
+    # Arrange
+    mock_db = MagicMock()
+    mock_customer_data = {
+        "customer_id": 1,
+        "weight": 70,
+        "date": date.today() - timedelta(days=10),
+        "weight_goal": 65,
+        "start_date": date.today() - timedelta(days=30),
+        "end_date": date.today() + timedelta(days=30),
+        "length": 175,
+        "birth_date": date(1990, 1, 1),
+        "gender": "male",
+        "activity_level": 1.4
+    }
+
+    # Act
+    with patch("services.functions.get_data_from_db_to_calculate_all",
+               return_value=iter([[mock_customer_data], [mock_customer_data]])):
+        result = calculate_daily_calories_all_customers(False, mock_db)
+
+    # Assert
+    expected = calculate_daily_calories_and_macros(70, 65, 40, 175, calculate_age(date(1990, 1, 1)), "male", 1.4)
+    assert result == [expected, expected]
+
+def test_calculate_daily_calories_all_customers_missing_data():
+    mock_db = MagicMock()
+    mock_customer_data = {"customer_id": 1, "weight": None, "weight_goal": None}
+
+    with patch("services.functions.get_data_from_db_to_calculate_all", return_value=iter([[mock_customer_data]])):
+        with pytest.raises(HTTPException) as exc:
+            calculate_daily_calories_all_customers(False, mock_db)
+
+    assert exc.value.status_code == 404
+    assert exc.value.detail == "No data found"
+
+def test_calculation_data_statement_bounded_windows():
+    """The window subqueries should only read the progress and goals of the selected customers"""
+    sql = str(calculation_data_statement(gym_id=1, min_id=10, max_id=20).compile())
+    subqueries = sql.split("FROM progress")[1], sql.split("FROM goals")[1]
+
+    for subquery in subqueries:
+        window_filter = subquery.split(") AS anon")[0]
+        assert "customer_id IN (SELECT customers.id" in window_filter
+        assert "customer_id >= :" in window_filter and "customer_id < :" in window_filter
@@ -0,0 +1,58 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+
+import pytest
+
+from services import goal_outcomes
+from services.goal_outcomes import goal_outcome
+
+END_DATE = date(2024, 6, 1)
+
+def goal_row(weight_goal=80, start_weight=90, before=None, after=None):
+    return {
+        "goal_id": 1,
+        "customer_id": 1,
+        "gym_id": 1,
+        "weight_goal": weight_goal,
+        "end_date": END_DATE,
+        "start_weight": start_weight,
+        "weight_before": before[1] if before else None,
+        "date_before": END_DATE - timedelta(days=before[0]) if before else None,
+        "weight_after": after[1] if after else None,
+        "date_after": END_DATE + timedelta(days=after[0]) if after else None
+    }
+
+def test_goal_outcome_nearest_weigh_in():
+    """It should use the weigh-in nearest to the end date"""
+    outcome = goal_outcome(goal_row(before=(5, 82), after=(2, 79)))
+
+    assert outcome["final_weight"] == 79
+    assert outcome["final_date"] == END_DATE + timedelta(days=2)
+    assert outcome["outcome"] == "met"
+    assert outcome["margin"] == 1
+
+def test_goal_outcome_tie():
+    """It should prefer the weigh-in before the end date on a tie"""
+    assert goal_outcome(goal_row(before=(2, 82), after=(2, 79)))["final_weight"] == 82
+
+@pytest.mark.parametrize("weight_goal, start_weight, final_weight, expected, margin", [
+    (80, 90, 82, "missed", -2),
+    (80, 70, 82, "met", 2),
+    (80, 70, 78, "missed", -2),
+    (80, 80, 81, "met", 0),
+    (80, 80, 83, "missed", -2)
+])
+def test_goal_outcome_direction(weight_goal, start_weight, final_weight, expected, margin):
+    """It should compare in the direction of the goal, with a tolerance for maintenance goals"""
+    with patch.object(goal_outcomes, "goal_outcome_tolerance", 1):
+        outcome = goal_outcome(goal_row(weight_goal, start_weight, before=(0, final_weight)))
+
+    assert outcome["outcome"] == expected
+    assert outcome["margin"] == margin
+
+def test_goal_outcome_no_data():
+    """It should record goals without weigh-ins as no_data"""
+    outcome = goal_outcome(goal_row(start_weight=None))
+
+    assert outcome["outcome"] == "no_data"
+    assert outcome["margin"] is None
@@ -1,4 +1,5 @@
 import pytest
+from datetime import date
 from unittest.mock import MagicMock
 from fastapi import HTTPException
 from routers.goals import read_goals, get_goal_by_id, delete_goal
@@ -108,7 +109,8 @@ async def test_get_goal_by_id_exception():
 async def test_delete_goal_success():
     # Arrange
     mock_db = MagicMock()
-    mock_goal = GoalsTable(id=1, customer_id=1, weight_goal=75.0, start_date="2023-01-01", end_date="2023-06-01")
+    mock_goal = GoalsTable(id=1, customer_id=1, weight_goal=75.0, start_date=date(2023, 1, 1),
+                           end_date=date(2023, 6, 1))
     mock_db.query.return_value.filter.return_value.first.return_value = mock_goal
 
     # Act
@@ -0,0 +1,112 @@
+from collections import Counter
+from datetime import date
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from services.gym_stats import bmi_category, contribution, histogram_median, stats_from_counters, \
+    refresh_gym_stats, member_from_row, years_before, add_counters
+
+TODAY = date(2024, 6, 1)
+
+@pytest.mark.parametrize("weight, expected", [(55, "underweight"), (70, "normal"), (85, "overweight"), (100, "obese")])
+def test_bmi_category(weight, expected):
+    """It should put the BMI of a 180 cm tall member in the right category"""
+    assert bmi_category(weight, 180) == expected
+
+@pytest.mark.parametrize("histogram, count, expected", [
+    ([(70, 1)], 1, 70),
+    ([(70, 1), (80, 1)], 2, 75),
+    ([(60, 2), (70, 1), (90, 3)], 6, 80),
+    ([(60, 3), (70, 1), (90, 1)], 5, 60),
+    ([], 0, None)
+])
+def test_histogram_median(histogram, count, expected):
+    """It should find the median of the values of a histogram"""
+    assert histogram_median(histogram, count) == expected
+
+def row(gym_id, gender, birth_date, length, weight, goal_start_date=None, goal_end_date=None):
+    """Row of member_statement"""
+    return {"customer_id": 1, "gym_id": gym_id, "gender": gender, "birth_date": birth_date, "length": length,
+            "weight": weight, "goal_start_date": goal_start_date, "goal_end_date": goal_end_date}
+
+def test_contribution_without_gym():
+    """It should not count customers that are not a member of a gym"""
+    assert contribution(member_from_row(row(None, "male", date(1990, 3, 10), 180, 80), TODAY)) == Counter()
+    assert contribution(None) == Counter()
+
+def test_member_from_row():
+    """It should bucket the age as calculated for the plans and only count started goals as active"""
+    # Born in December 1999, still 24
+    member = member_from_row(row(1, "female", date(1999, 12, 1), 175, None, date(2024, 7, 1), date(2024, 9, 1)),
+                             TODAY)
+
+    assert member["age_bucket"] == "<25"
+    assert member["active_goal"] is False
+    assert member_from_row(row(1, "female", date(1999, 6, 1), 175, None, date(2024, 5, 1), TODAY),
+                           TODAY)["age_bucket"] == "25-34"
+
+def test_stats_from_counters():
+    """It should calculate the statistics from the contributions of the members"""
+    members = [
+        row(1, "male", date(1990, 3, 10), 180, 80, date(2024, 5, 1), date(2024, 7, 1)),
+        row(1, "female", date(2001, 8, 1), 165, 70, date(2024, 4, 1), date(2024, 5, 1)),
+        row(1, "female", date(1960, 1, 1), 170, None),
+        row(1, "female", date(1999, 12, 1), 175, None, date(2024, 7, 1), date(2024, 9, 1))
+    ]
+
+    counters = Counter()
+    for member in members:
+        counters.update(contribution(member_from_row(member, TODAY)))
+
+    stats = stats_from_counters(counters)
+
+    assert stats["members"] == 4
+    assert stats["gender"] == {"male": 1, "female": 3}
+    assert stats["age"] == {"<25": 2, "25-34": 1, "35-44": 0, "45-54": 0, "55+": 1}
+    assert stats["average_height"] == 172.5
+    assert stats["weighed_members"] == 2
+    assert stats["average_weight"] == 75
+    assert stats["median_weight"] == 75
+    assert stats["bmi"] == {"underweight": 0, "normal": 1, "overweight": 1, "obese": 0}
+    # The goals that ended before today or start after today are not active
+    assert stats["active_goals"] == 1
+
+def test_stats_from_no_counters():
+    """It should give empty statistics for a gym without members"""
+    stats = stats_from_counters(Counter())
+
+    assert stats["members"] == 0
+    assert stats["average_height"] is None
+    assert stats["median_weight"] is None
+
+@pytest.mark.parametrize("day, expected", [
+    (date(2024, 6, 1), date(1999, 6, 1)),
+    (date(2024, 2, 29), date(1999, 2, 28))
+])
+def test_years_before(day, expected):
+    assert years_before(day, 25) == expected
+
+def test_add_counters_sorted():
+    """It should upsert the counters of a gym in a fixed order and only clean up the decreased ones"""
+    mock_db = MagicMock()
+    mock_db.get_bind.return_value.dialect.name = "postgresql"
+
+    add_counters(mock_db, 1, Counter({("weight", "80"): 1, ("age", "<25"): -1, ("members", ""): 0}))
+
+    upsert, cleanup = (call.args[0] for call in mock_db.execute.call_args_list)
+    params = upsert.compile(dialect=postgresql.dialect()).params
+    assert [params[f"metric_m{i}"] for i in range(2)] == ["age", "weight"]
+    assert "('age', '<25')" in str(cleanup.compile(dialect=postgresql.dialect(),
+                                                   compile_kwargs={"literal_binds": True}))
+
+def test_refresh_gym_stats_locks_customer():
+    """It should lock the customer row before reading their previous contribution"""
+    mock_db = MagicMock()
+    mock_db.execute.return_value.fetchone.return_value = None
+
+    refresh_gym_stats(1, mock_db)
+
+    lock = mock_db.execute.call_args_list[0].args[0]
+    assert "FOR UPDATE" in str(lock.compile(dialect=postgresql.dialect()))
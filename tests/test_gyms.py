@@ -72,7 +72,7 @@ mock_customer_responses = [
 async def test_read_gyms():
     mock_db = MagicMock()
 
-    mock_db.query.return_value.all.return_value = mock_gyms
+    mock_db.query.return_value.order_by.return_value.limit.return_value.all.return_value = mock_gyms
 
     result = await get_gyms(db=mock_db)
 
@@ -81,7 +81,7 @@ async def test_read_gyms():
 @pytest.mark.asyncio
 async def test_get_gyms_empty_table():
     mock_db = MagicMock()
-    mock_db.query.return_value.all.return_value = []
+    mock_db.query.return_value.order_by.return_value.limit.return_value.all.return_value = []
 
     with pytest.raises(HTTPException) as e:
         await get_gyms(db=mock_db)
@@ -92,7 +92,7 @@ async def test_get_gyms_empty_table():
 @pytest.mark.asyncio
 async def test_get_gyms_with_place_name_found():
     mock_db = MagicMock()
-    mock_db.query.return_value.filter.return_value.all.return_value = [mock_gyms[0]]
+    mock_db.query.return_value.filter.return_value.order_by.return_value.limit.return_value.all.return_value = [mock_gyms[0]]
 
     result = await get_gyms(db=mock_db, address_place="hot gym")
 
@@ -101,7 +101,7 @@ async def test_get_gyms_with_place_name_found():
 @pytest.mark.asyncio
 async def test_get_gyms_with_place_name_not_found():
     mock_db = MagicMock()
-    mock_db.query.return_value.filter.return_value.all.return_value = []
+    mock_db.query.return_value.filter.return_value.order_by.return_value.limit.return_value.all.return_value = []
 
     with pytest.raises(HTTPException) as exc:
         await get_gyms(db=mock_db, address_place="not that hot gym")
@@ -213,7 +213,7 @@ async def test_get_customers_by_gym_id_no_customers_found():
     mock_db = MagicMock()
     mock_query = MagicMock()
     mock_query.filter.return_value.first.return_value = mock_gyms[0]  # Mock gym retrieval
-    mock_query.filter.return_value.all.return_value = []  # No customers found
+    mock_query.filter.return_value.order_by.return_value.limit.return_value.all.return_value = []  # No customers found
     mock_db.query.return_value = mock_query
 
     with pytest.raises(HTTPException) as exc:
@@ -241,7 +241,7 @@ async def test_get_customers_by_gym_id_success():
     mock_db = MagicMock()
     mock_query = MagicMock()
     mock_query.filter.return_value.first.return_value = mock_gyms[0]  # Mock gym retrieval
-    mock_query.filter.return_value.all.return_value = mock_customers  # Mock customers retrieval
+    mock_query.filter.return_value.order_by.return_value.limit.return_value.all.return_value = mock_customers  # Mock customers retrieval
     mock_db.query.return_value = mock_query
 
     response = await get_customers_by_gym_id(gym_id=1, db=mock_db)
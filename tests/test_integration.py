@@ -1,15 +1,31 @@
 import os
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch, MagicMock
 from datetime import datetime, date, timedelta
 
 import pytest
 from dotenv import load_dotenv
 from fastapi.testclient import TestClient
 from main import app
-from services.functions import get_db
-from sqlalchemy import create_engine
+from services.functions import get_db, get_data_from_db_to_calculate
+from services.daily_plans import rebuild_daily_plans, refresh_daily_plan
+from services.parallel import get_shards, get_executor, shutdown_executor
+from services.calibration import run_calibration, get_weigh_ins
+from services.leaderboard import rebuild_leaderboard
+from services.gym_stats import rebuild_gym_stats, move_members, years_before
+from services.progress_rollups import rebuild_progress_rollups, week_start
+from services.anomalies import rescan_progress
+from services.goal_outcomes import evaluate_goal_outcomes
+from services import goal_outcomes
+from sqlalchemy import create_engine, event, update
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
-from models.entities import Base, Customer, Gym, Goal, Progress
+from services.cache import expiring_goals_cache, bump_generation, plan_generation, expiring_goals_generation
+from models.entities import Base, Customer, Gym, Goal, Progress, DailyPlan, TdeeCalibration, LeaderboardEntry, \
+    GymStatCounter, ProgressRollup, ProgressStat, ProgressAnomaly, GoalOutcome
 from tests.test_customers import mock_customers
 
 load_dotenv()
@@ -52,6 +68,14 @@ def db():
         transaction.rollback()
         connection.close()
 
+def committed_session():
+    """
+    Session that really commits. Every request rolls back the shared test
+    connection when its session closes, so data that has to survive more than
+    one request is committed through here.
+    """
+    return TestingSessionLocal()
+
 ##########################################################################
 #  S E T U P  T A B L E S
 ##########################################################################
@@ -517,7 +541,14 @@ async def test_create_progress(db: Session):
     # Perform the POST request using TestClient
     customer_id = new_progress["customer_id"]
     print(customer_id)
-    result = client.post(f"customers/{customer_id}/progress", json=new_progress)
+
+    # The plan and leaderboard refreshes share one load of the calculation data
+    load = MagicMock(wraps=get_data_from_db_to_calculate)
+    with patch("routers.customers.get_data_from_db_to_calculate", load), \
+            patch("services.daily_plans.get_data_from_db_to_calculate", load), \
+            patch("services.leaderboard.get_data_from_db_to_calculate", load):
+        result = client.post(f"customers/{customer_id}/progress", json=new_progress)
+    assert load.call_count == 1
 
     # Print diagnostic information
     print("Response status code:", result.status_code)
@@ -584,4 +615,1244 @@ async def test_get_progress_not_found(db: Session):
     response = client.get("/progress/9999")  # A gym that does not exist
     assert response.status_code == 404
 
-    drop_tables()
\ No newline at end of file
+    drop_tables()
+
+##########################################################################
+#  D A I L Y  I N T A K E  T E S T   C A S E S
+##########################################################################
+
+def count_queries(statements):
+    """Collect every statement sent to the test database."""
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    return before_cursor_execute
+
+@pytest.mark.asyncio
+async def test_get_daily_intake_all(db: Session):
+    """It should calculate the plans of all customers with a fixed number of queries"""
+    create_tables(db)
+    fill_tables(db)
+
+    extra_customer = Customer(first_name='Extra', last_name='Member', gender='female',
+                              birth_date=datetime(1999, 2, 2).date(), length=170, gym_id=1, activity_level=1.4)
+    db.add(extra_customer)
+    db.commit()
+    db.refresh(extra_customer)
+    db.add(Progress(customer_id=extra_customer.id, weight=65, date=date.today()))
+    db.add(Goal(customer_id=extra_customer.id, weight_goal=65,
+                start_date=date.today(), end_date=date.today() + timedelta(days=60)))
+    db.commit()
+
+    statements = []
+    listener = count_queries(statements)
+    event.listen(test_engine, "before_cursor_execute", listener)
+    try:
+        response = client.get("/daily_intake_all")
+    finally:
+        event.remove(test_engine, "before_cursor_execute", listener)
+
+    assert response.status_code == 200
+    assert [x["goal_type"] for x in response.json()["data"]] == ["weightloss", "musclegain", "maintenance"]
+
+    # One query, no matter how many customers there are
+    assert len([x for x in statements if x.lstrip().upper().startswith("SELECT")]) == 1
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_get_daily_intake_all_not_found(db: Session):
+    """It should return 404 when there are no customers"""
+    create_tables(db)
+
+    response = client.get("/daily_intake_all")
+    assert response.status_code == 404
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_get_daily_intake_all_stream(db: Session):
+    """It should stream one NDJSON line per customer"""
+    create_tables(db)
+
+    # The request session is closed before the response streams
+    session = committed_session()
+    fill_tables(session)
+    session.add(Customer(first_name='No', last_name='Data', gender='female',
+                         birth_date=datetime(1999, 2, 2).date(), length=170, gym_id=1, activity_level=1.4))
+    session.commit()
+    session.close()
+
+    response = client.get("/daily_intake_all?stream=ndjson")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    lines = [json.loads(x) for x in response.text.splitlines()]
+    assert [x["customer_id"] for x in lines] == [1, 2, 3]
+    assert lines[0]["goal_type"] == "weightloss"
+    assert lines[2] == {"customer_id": 3, "error": "No data found"}
+
+    # A latest weigh-in on the goal end date leaves no days, only that customer gets an error
+    session = committed_session()
+    session.add(Progress(customer_id=2, weight=55, date=date.today() - timedelta(days=14)))
+    session.commit()
+    session.close()
+
+    lines = [json.loads(x) for x in client.get("/daily_intake_all?stream=ndjson").text.splitlines()]
+    assert [x["customer_id"] for x in lines] == [1, 2, 3]
+    assert lines[0]["goal_type"] == "weightloss"
+    assert lines[1] == {"customer_id": 2, "error": "No days left before the goal deadline"}
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_get_daily_intake_all_stream_accept_header(db: Session):
+    """It should stream when the client accepts NDJSON"""
+    create_tables(db)
+
+    session = committed_session()
+    fill_tables(session)
+    session.close()
+
+    response = client.get("/daily_intake_all", headers={"Accept": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 2
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_get_daily_intake_all_stream_not_found(db: Session):
+    """It should return 404 before streaming when there are no customers"""
+    create_tables(db)
+
+    response = client.get("/daily_intake_all?stream=ndjson")
+    assert response.status_code == 404
+
+    drop_tables()
+
+def assert_plans_close(actual, expected):
+    """Plans should match up to the last rounded digit, the databases round half away from zero"""
+    assert actual["goal_type"] == expected["goal_type"]
+    assert actual["total_daily_calories"] == pytest.approx(expected["total_daily_calories"], abs=0.011)
+
+    for macro, values in expected["macronutrients"].items():
+        for key, value in values.items():
+            assert actual["macronutrients"][macro][key] == pytest.approx(value, abs=0.011)
+
+@pytest.mark.asyncio
+async def test_get_daily_intake_all_sql_parity(db: Session):
+    """The SQL-side calculation should give the same plans as the Python implementation"""
+    create_tables(db)
+    session = committed_session()
+    session.add(Gym(name="Big Gym", address_place="Zwolle"))
+    session.commit()
+
+    rng = random.Random(7)
+    for i in range(300):
+        customer = Customer(first_name=f'Customer{i}', last_name='Parity', gender=rng.choice(['male', 'female']),
+                            birth_date=date.today() - timedelta(days=rng.randint(16 * 365, 80 * 365)),
+                            length=rng.randint(150, 210), gym_id=1, activity_level=rng.uniform(1.2, 1.725))
+        session.add(customer)
+        session.flush()
+        session.add(Progress(customer_id=customer.id, weight=rng.randint(45, 150),
+                             date=date.today() - timedelta(days=rng.randint(0, 60))))
+        session.add(Goal(customer_id=customer.id, weight_goal=rng.randint(45, 150),
+                         start_date=date.today() - timedelta(days=rng.randint(61, 120)),
+                         end_date=date.today() + timedelta(days=rng.randint(1, 365))))
+    session.commit()
+    session.close()
+
+    for params in ({}, {"from_start_date": True}):
+        expected = client.get("/daily_intake_all", params=params).json()["data"]
+        actual = client.get("/daily_intake_all", params={**params, "sql": True}).json()["data"]
+
+        assert len(actual) == len(expected) == 300
+        for actual_plan, expected_plan in zip(actual, expected):
+            assert_plans_close(actual_plan, expected_plan)
+
+    # Streaming mode
+    lines = client.get("/daily_intake_all", params={"stream": "ndjson", "sql": True}).text.splitlines()
+    assert [json.loads(x)["customer_id"] for x in lines] == list(range(1, 301))
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_get_daily_intake_all_sql_not_found(db: Session):
+    """The SQL-side calculation should fail like the Python one on missing data"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.add(Customer(first_name='No', last_name='Data', gender='female',
+                         birth_date=datetime(1999, 2, 2).date(), length=170, gym_id=1, activity_level=1.4))
+    session.commit()
+    session.close()
+
+    assert client.get("/daily_intake_all", params={"sql": True}).status_code == 404
+
+    lines = client.get("/daily_intake_all", params={"stream": "ndjson", "sql": True}).text.splitlines()
+    assert json.loads(lines[-1]) == {"customer_id": 3, "error": "No data found"}
+
+    # A goal without days left is an error line too, like in the Python stream
+    session = committed_session()
+    session.add(Progress(customer_id=2, weight=55, date=date.today() - timedelta(days=14)))
+    session.commit()
+    session.close()
+
+    response = client.get("/daily_intake_all", params={"stream": "ndjson", "sql": True})
+    lines = [json.loads(x) for x in response.text.splitlines()]
+    assert [x["customer_id"] for x in lines] == [1, 2, 3]
+    assert lines[0]["goal_type"] == "weightloss"
+    assert lines[1] == {"customer_id": 2, "error": "No days left before the goal deadline"}
+
+    drop_tables()
+
+def fill_long_history(session, customer_id, days=730, goals=20):
+    """Daily weigh-ins for `days` days and `goals` historic goals"""
+    first_day = date.today() - timedelta(days=days)
+
+    session.add_all([Progress(customer_id=customer_id, weight=100 - x // 30, date=first_day + timedelta(days=x))
+                     for x in range(days)])
+    session.add_all([Goal(customer_id=customer_id, weight_goal=90 - x,
+                          start_date=first_day + timedelta(days=x * 37),
+                          end_date=first_day + timedelta(days=x * 37 + 60))
+                     for x in range(goals)])
+    session.commit()
+
+@pytest.mark.asyncio
+async def test_get_daily_calorie_intake_long_history(db: Session):
+    """It should find the latest progress and goal with index lookups, whatever the history length"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    fill_long_history(session, 2)
+    session.close()
+
+    queries = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        queries.append((statement, parameters))
+
+    event.listen(test_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.get("/customers/2/daily_calorie_intake")
+    finally:
+        event.remove(test_engine, "before_cursor_execute", before_cursor_execute)
+
+    assert response.status_code == 200
+    customer_data = response.json()["customer_data"]
+    assert customer_data["date"] == str(date.today() - timedelta(days=1))
+    assert customer_data["weight"] == 76
+    assert customer_data["weight_goal"] == 71
+
+    # No scan or sort of the progress and goals of the customer
+    statement, parameters = next(x for x in queries if "progress" in x[0] and "goals" in x[0])
+    with test_engine.connect() as connection:
+        plan = " ".join(row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+
+    assert "ix_progress_customer_id_date" in plan
+    assert "ix_goals_customer_id_start_date" in plan
+    assert "TEMP B-TREE" not in plan
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_daily_plan_maintained_on_writes(db: Session):
+    """It should keep the stored daily plan up to date when progress and goals are written"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+
+    # No stored plan yet, the plan is calculated on the fly
+    response = client.get("/customers/1/daily_calorie_intake")
+    assert response.status_code == 200
+    assert session.query(DailyPlan).filter_by(customer_id=1).first() is None
+
+    result = client.post("/customers/1/goals", json={
+        "weight_goal": 75, "start_date": str(date.today()), "end_date": str(date.today() + timedelta(days=90))
+    })
+    assert result.status_code == 201
+
+    daily_plan = session.query(DailyPlan).filter_by(customer_id=1).first()
+    assert daily_plan.weight_goal == 75
+    assert daily_plan.weight == 80
+
+    result = client.post("/customers/1/progress", json={"weight": 78})
+    assert result.status_code == 201
+
+    session.refresh(daily_plan)
+    assert daily_plan.weight == 78
+    assert daily_plan.date == date.today()
+    stored_plan = daily_plan.plan
+    session.close()
+
+    response = client.get("/customers/1/daily_calorie_intake")
+    assert response.status_code == 200
+    assert response.json()["detailed_daily_cal_intake"] == stored_plan
+    assert response.json()["customer_data"]["weight"] == 78
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_rebuild_daily_plans(db: Session):
+    """It should store the plan of every customer with progress and goals"""
+    create_tables(db)
+    fill_tables(db)
+
+    assert rebuild_daily_plans(db) == 2
+    assert db.query(DailyPlan).count() == 2
+    stored_plan = db.get(DailyPlan, 2).plan
+
+    response = client.get("/customers/2/daily_calorie_intake")
+    assert response.status_code == 200
+    assert response.json()["detailed_daily_cal_intake"] == stored_plan
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_daily_plan_cache(db: Session):
+    """It should serve repeated plan requests from the cache until the customer's data changes"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.close()
+
+    first = client.get("/customers/1/daily_calorie_intake")
+    second = client.get("/customers/1/daily_calorie_intake")
+    assert first.json() == second.json()
+
+    stats = client.get("/cache/stats").json()["plans"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+    # Writing progress invalidates the cached plan
+    result = client.post("/customers/1/progress", json={"weight": 78})
+    assert result.status_code == 201
+
+    third = client.get("/customers/1/daily_calorie_intake")
+    assert third.json()["customer_data"]["weight"] == 78
+    assert client.get("/cache/stats").json()["plans"]["invalidations"] == 1
+
+    # A write on another replica only bumps the shared generation, the cached plan is not served
+    session = committed_session()
+    session.execute(update(Progress).where(Progress.customer_id == 1, Progress.date == date.today())
+                    .values(weight=77))
+    refresh_daily_plan(1, session)
+    bump_generation(plan_generation(1), session)
+    session.commit()
+    session.close()
+
+    fourth = client.get("/customers/1/daily_calorie_intake")
+    assert fourth.json()["customer_data"]["weight"] == 77
+
+    stats = client.get("/cache/stats").json()
+    assert stats["replica"]
+    assert stats["plans"]["invalidations"] == 2
+    assert stats["plans"]["shared_invalidations"] == 2
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_get_shards(db: Session):
+    """It should split the customers into id ranges"""
+    create_tables(db)
+    fill_tables(db)
+
+    for i in range(3):
+        db.add(Customer(first_name=f'Member{i}', last_name='Extra', gender='male',
+                        birth_date=datetime(1990, 1, 1).date(), length=180, gym_id=1, activity_level=1.4))
+    db.commit()
+
+    assert get_shards(db, 2) == [(1, 3), (3, 5), (5, None)]
+    assert get_shards(db, 10) == [(1, None)]
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_get_daily_intake_all_parallel(db: Session):
+    """It should give the same plans in parallel mode as in the normal mode"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.close()
+
+    expected = client.get("/daily_intake_all").json()
+
+    # Threads instead of processes, the in-memory test database is not shared between processes
+    with patch("services.parallel.ProcessPoolExecutor", ThreadPoolExecutor), \
+            patch("services.parallel.SessionLocal", TestingSessionLocal), \
+            patch("services.parallel.plan_shard_size", 1):
+        response = client.get("/daily_intake_all?parallel=true")
+        pool = get_executor()
+        # The pool is shared by the requests
+        assert client.get("/daily_intake_all?parallel=true").json() == expected
+        assert get_executor() is pool
+        shutdown_executor()
+
+    assert response.status_code == 200
+    assert response.json() == expected
+
+    drop_tables()
+
+class BrokenPool(ThreadPoolExecutor):
+    """Pool whose worker died, the first one started is broken"""
+    started = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        BrokenPool.started += 1
+        self.broken = BrokenPool.started == 1
+
+    def submit(self, *args, **kwargs):
+        if self.broken:
+            raise BrokenProcessPool("A child process terminated abruptly")
+        return super().submit(*args, **kwargs)
+
+@pytest.mark.asyncio
+async def test_get_daily_intake_all_parallel_broken_pool(db: Session):
+    """It should replace a broken process pool and calculate the plans in the new one"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.close()
+
+    expected = client.get("/daily_intake_all").json()
+
+    with patch("services.parallel.ProcessPoolExecutor", BrokenPool), \
+            patch("services.parallel.SessionLocal", TestingSessionLocal):
+        response = client.get("/daily_intake_all?parallel=true")
+        assert BrokenPool.started == 2
+        assert not get_executor().broken
+        shutdown_executor()
+
+    assert response.status_code == 200
+    assert response.json() == expected
+
+    drop_tables()
+
+##########################################################################
+#  P A G I N A T I O N  T E S T   C A S E S
+##########################################################################
+
+def get_all_pages(url):
+    """Follow the X-Next-Cursor header and collect the pages of a list endpoint."""
+    pages = []
+    cursor = None
+
+    while True:
+        response = client.get(url, params={"limit": 1, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        pages.append(response.json())
+
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return pages
+
+@pytest.mark.asyncio
+async def test_list_endpoints_paginate(db: Session):
+    """It should page through the list endpoints with cursors"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.close()
+
+    customers = get_all_pages("/customers")
+    assert [page[0]["id"] for page in customers] == [1, 2]
+
+    gyms = get_all_pages("/gyms")
+    assert [page[0]["id"] for page in gyms] == [1, 2]
+
+    progress = get_all_pages("/progress")
+    assert [page[0]["id"] for page in progress] == [1, 2]
+
+    # Goals are sorted by end date
+    goals = get_all_pages("/goals")
+    assert [page[0]["id"] for page in goals] == [2, 1]
+
+    gym_customers = get_all_pages("/gyms/1/customers")
+    assert [page["customers"][0]["id"] for page in gym_customers] == [1]
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_list_endpoint_invalid_cursor(db: Session):
+    """It should reject cursors it did not create"""
+    create_tables(db)
+    fill_tables(db)
+
+    response = client.get("/customers", params={"cursor": "garbage"})
+    assert response.status_code == 400
+
+    drop_tables()
+
+##########################################################################
+#  G Y M  D A I L Y  I N T A K E  T E S T   C A S E S
+##########################################################################
+
+@pytest.mark.asyncio
+async def test_get_daily_intake_by_gym_id(db: Session):
+    """It should return the plans of the members of one gym keyed by customer id"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.add(Customer(first_name='No', last_name='Data', gender='female',
+                         birth_date=datetime(1999, 2, 2).date(), length=170, gym_id=1, activity_level=1.4))
+    session.commit()
+    session.close()
+
+    all_plans = client.get("/daily_intake_all?stream=ndjson").text.splitlines()
+
+    response = client.get("/gyms/1/daily_intake")
+    assert response.status_code == 200
+    assert response.json()["gym"] == "Big Gym"
+    assert list(response.json()["data"]) == ["1", "3"]
+    assert {"customer_id": 1, **response.json()["data"]["1"]} == json.loads(all_plans[0])
+    assert response.json()["data"]["3"] == {"error": "No data found"}
+
+    # A member without days left before the goal deadline only fails their own entry
+    session = committed_session()
+    session.add(Goal(customer_id=3, weight_goal=60, start_date=date.today() - timedelta(days=5),
+                     end_date=date.today()))
+    session.add(Progress(customer_id=3, weight=65, date=date.today()))
+    session.commit()
+    session.close()
+
+    response = client.get("/gyms/1/daily_intake")
+    assert response.status_code == 200
+    assert response.json()["data"]["3"] == {"error": "No days left before the goal deadline"}
+    assert {"customer_id": 1, **response.json()["data"]["1"]} == json.loads(all_plans[0])
+
+    # Pagination
+    first_page = client.get("/gyms/1/daily_intake", params={"limit": 1})
+    assert list(first_page.json()["data"]) == ["1"]
+    second_page = client.get("/gyms/1/daily_intake",
+                             params={"limit": 1, "cursor": first_page.headers["X-Next-Cursor"]})
+    assert list(second_page.json()["data"]) == ["3"]
+    assert "X-Next-Cursor" not in second_page.headers
+
+    # Streaming
+    lines = client.get("/gyms/1/daily_intake?stream=ndjson").text.splitlines()
+    assert [json.loads(x)["customer_id"] for x in lines] == [1, 3]
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_get_daily_intake_by_gym_id_not_found(db: Session):
+    """It should return 404 for an unknown gym"""
+    create_tables(db)
+
+    response = client.get("/gyms/99/daily_intake")
+    assert response.status_code == 404
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_get_daily_calorie_intake_schedule(db: Session):
+    """It should return the day-by-day plan until the end date of the goal"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.add(Goal(customer_id=1, weight_goal=75, start_date=date.today(),
+                     end_date=date.today() + timedelta(days=30)))
+    session.commit()
+    session.close()
+
+    response = client.get("/customers/1/daily_calorie_intake/schedule")
+    assert response.status_code == 200
+    schedule = response.json()["schedule"]
+    assert len(schedule) == 30
+    assert schedule[0]["date"] == str(date.today())
+    assert schedule[0]["projected_weight"] == 80
+    assert schedule[-1]["projected_weight"] < 76
+    assert response.json()["realism"] is True
+
+    # Batch variant, one line per member of the gym
+    lines = client.get("/gyms/1/daily_intake/schedule").text.splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0]) == {"customer_id": 1, "schedule": schedule}
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_get_daily_calorie_intake_schedule_ended(db: Session):
+    """It should return 400 for an ended goal and 404 for a missing customer"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.close()
+
+    assert client.get("/customers/1/daily_calorie_intake/schedule").status_code == 400
+    assert client.get("/customers/99/daily_calorie_intake/schedule").status_code == 404
+    assert client.get("/gyms/99/daily_intake/schedule").status_code == 404
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_get_weight_forecast(db: Session):
+    """It should forecast the weight of a customer and of all members of a gym"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.add(Goal(customer_id=1, weight_goal=75, start_date=date.today(),
+                     end_date=date.today() + timedelta(days=20)))
+    session.add_all([Progress(customer_id=1, weight=80 + x, date=date.today() - timedelta(days=x * 7))
+                     for x in range(4)])
+    session.commit()
+    session.close()
+
+    response = client.get("/customers/1/forecast")
+    assert response.status_code == 200
+    forecast = response.json()["forecast"]
+    assert forecast["trend_per_week"] == -1
+    assert forecast["projected_weight"] == pytest.approx(77.14, abs=0.01)
+    assert forecast["estimated_goal_date"] == str(date.today() + timedelta(days=35))
+    assert forecast["on_track"] is False
+
+    # The old weigh-in of customer 1 is outside the history window
+    assert forecast["measurements"] == 4
+
+    # Customer 2 has a single old weigh-in
+    assert client.get("/customers/2/forecast").status_code == 404
+    assert client.get("/customers/99/forecast").status_code == 404
+
+    response = client.get("/gyms/1/forecast")
+    assert response.status_code == 200
+    assert response.json()["data"] == {"1": forecast}
+    assert client.get("/gyms/2/forecast").json()["data"] == {"2": {"error": "Not enough data"}}
+    assert client.get("/gyms/99/forecast").status_code == 404
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_tdee_calibration(db: Session):
+    """It should calibrate the activity level from the weigh-ins, live and with the nightly job"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.add(Goal(customer_id=1, weight_goal=70, start_date=date.today() - timedelta(days=14),
+                     end_date=date.today() + timedelta(days=86)))
+    session.add_all([Progress(customer_id=1, weight=84 - x, date=date.today() - timedelta(days=28 - x * 7))
+                     for x in range(5)])
+    session.commit()
+
+    response = client.get("/customers/1/calibration")
+    assert response.status_code == 200
+    calibration = response.json()["calibration"]
+    # Only the weigh-ins since the start of the goal
+    assert calibration["measurements"] == 3
+    assert calibration["weight_trend"] == -1
+    assert calibration["activity_level"] == 1.5
+
+    # Customer 2 has no weigh-ins since the start of the goal
+    assert client.get("/customers/2/calibration").status_code == 404
+
+    # Every customer only gets their weigh-ins since the start of their own goal
+    session.add(Goal(customer_id=2, weight_goal=55, start_date=date.today() - timedelta(days=1),
+                     end_date=date.today() + timedelta(days=60)))
+    session.add(Progress(customer_id=2, weight=60, date=date.today() - timedelta(days=7)))
+    session.commit()
+    customer_ids, dates, _ = get_weigh_ins(session, [{"customer_id": 1, "start_date": date.today() - timedelta(days=14)},
+                                                     {"customer_id": 2, "start_date": date.today() - timedelta(days=1)}])
+    assert sorted(customer_ids) == [1, 1, 1]
+    assert min(dates) == date.today() - timedelta(days=14)
+
+    assert run_calibration(session) == 1
+    assert session.get(TdeeCalibration, 1).suggested_activity_level == calibration["suggested_activity_level"]
+    session.close()
+
+    assert client.get("/customers/1/calibration").json()["calibration"] == calibration
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_leaderboard(db: Session):
+    """It should keep the leaderboard of a gym up to date on progress and goal writes"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.add(Customer(first_name='Extra', last_name='Member', gender='female',
+                         birth_date=datetime(1999, 2, 2).date(), length=170, gym_id=1, activity_level=1.4))
+    session.add(Progress(customer_id=3, weight=90, date=date.today() - timedelta(days=30)))
+    session.commit()
+
+    # No entries before any write
+    assert client.get("/gyms/1/leaderboard").json()["data"] == []
+
+    end_date = (date.today() + timedelta(days=60)).isoformat()
+    for customer_id, weight_goal in ((1, 70), (3, 80)):
+        assert client.post(f"/customers/{customer_id}/goals", json={
+            "weight_goal": weight_goal, "start_date": date.today().isoformat(), "end_date": end_date
+        }).status_code == 201
+    assert client.post("/customers/1/progress", json={"weight": 75}).status_code == 201
+    assert client.post("/customers/3/progress", json={"weight": 88}).status_code == 201
+
+    statements = []
+    listener = count_queries(statements)
+    event.listen(test_engine, "before_cursor_execute", listener)
+    try:
+        response = client.get("/gyms/1/leaderboard", params={"top": 5})
+    finally:
+        event.remove(test_engine, "before_cursor_execute", listener)
+
+    assert response.status_code == 200
+    assert [(x["rank"], x["customer_id"], x["goal_progress"]) for x in response.json()["data"]] == [(1, 1, 50), (2, 3, 20)]
+    # Read from the leaderboard only, not from the progress table
+    assert not [x for x in statements if "progress" in x.lower().replace("goal_progress", "")]
+
+    assert [x["customer_id"] for x in client.get("/gyms/1/leaderboard", params={"top": 1}).json()["data"]] == [1]
+    assert client.get("/gyms/1/leaderboard", params={"top": 0}).status_code == 422
+    assert client.get("/gyms/99/leaderboard").status_code == 404
+
+    # Without a goal the customer leaves the leaderboard
+    goal_id = session.query(Goal).filter(Goal.customer_id == 3).one().id
+    assert client.delete(f"/goals/{goal_id}").status_code == 200
+    assert [x["customer_id"] for x in client.get("/gyms/1/leaderboard").json()["data"]] == [1]
+
+    # The rebuild gives the same entries, plus customer 2 that was never written to
+    maintained = {x.customer_id: x.goal_progress for x in session.query(LeaderboardEntry)}
+    assert rebuild_leaderboard(session) == 2
+    session.expire_all()
+    assert {x.customer_id: x.goal_progress for x in session.query(LeaderboardEntry)} == {**maintained, 2: 0}
+    session.close()
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_gym_stats(db: Session):
+    """It should keep the gym statistics up to date on customer, progress and goal writes"""
+    create_tables(db)
+    session = committed_session()
+    session.add_all([Gym(name="Big Gym", address_place="Zwolle"), Gym(name="Profit", address_place="Nijmegen")])
+    session.commit()
+
+    for first_name, gender, length in (("John", "male", 180), ("Jane", "female", 165), ("Extra", "female", 170)):
+        assert client.post("/customers", json={
+            "first_name": first_name, "last_name": "Doe", "gender": gender, "birth_date": "1990-01-01",
+            "length": length, "gym_id": 1, "activity_level": 1.4
+        }).status_code == 201
+
+    for customer_id, weight in ((1, 90), (1, 80), (2, 70), (3, 60)):
+        assert client.post(f"/customers/{customer_id}/progress", json={"weight": weight}).status_code == 201
+    assert client.post("/customers/2/goals", json={
+        "weight_goal": 60, "start_date": date.today().isoformat(),
+        "end_date": (date.today() + timedelta(days=30)).isoformat()
+    }).status_code == 201
+
+    statements = []
+    listener = count_queries(statements)
+    event.listen(test_engine, "before_cursor_execute", listener)
+    try:
+        stats = client.get("/gyms/1/stats").json()
+    finally:
+        event.remove(test_engine, "before_cursor_execute", listener)
+
+    # Read from the counters, not from the customers and progress tables
+    assert not [x for x in statements if "FROM customers" in x or "FROM progress" in x]
+
+    assert stats["members"] == 3
+    assert stats["gender"] == {"male": 1, "female": 2}
+    assert stats["average_height"] == 171.67
+    assert stats["average_weight"] == 70
+    assert stats["median_weight"] == 70
+    assert stats["bmi"] == {"underweight": 0, "normal": 2, "overweight": 1, "obese": 0}
+    assert stats["active_goals"] == 1
+
+    # A goal that starts tomorrow is not active yet
+    assert client.post("/customers/1/goals", json={
+        "weight_goal": 75, "start_date": (date.today() + timedelta(days=1)).isoformat(),
+        "end_date": (date.today() + timedelta(days=30)).isoformat()
+    }).status_code == 201
+    assert client.get("/gyms/1/stats").json()["active_goals"] == 1
+
+    # Moving and deleting members
+    assert client.patch("/customers/3", json={"gym_id": 2}).status_code == 200
+    assert client.delete("/customers/2").status_code == 200
+
+    all_stats = client.get("/gyms/stats").json()
+    assert all_stats["data"]["1"]["members"] == 1
+    assert all_stats["data"]["1"]["active_goals"] == 0
+    assert all_stats["data"]["2"]["median_weight"] == 60
+    assert all_stats["total"]["members"] == 2
+    assert all_stats["total"]["gender"] == {"male": 1, "female": 1}
+
+    assert client.get("/gyms/99/stats").status_code == 404
+
+    # The rebuild gives the same counters
+    maintained = {(x.gym_id, x.metric, x.bucket): x.value for x in session.query(GymStatCounter)}
+    assert rebuild_gym_stats(session) == 2
+    session.expire_all()
+    assert {(x.gym_id, x.metric, x.bucket): x.value for x in session.query(GymStatCounter)} == maintained
+
+    # The nightly job moves the member turning 25 and the goals that start or end, like a rebuild on that day
+    assert client.patch("/customers/1", json={
+        "birth_date": years_before(date.today() + timedelta(days=5), 25).isoformat()
+    }).status_code == 200
+    for days, moved in ((5, 1), (31, 1)):
+        assert move_members(session, today=date.today() + timedelta(days=days)) == moved
+        session.expire_all()
+        moved_counters = {(x.gym_id, x.metric, x.bucket): x.value for x in session.query(GymStatCounter)}
+        rebuild_gym_stats(session, today=date.today() + timedelta(days=days))
+        session.expire_all()
+        assert {(x.gym_id, x.metric, x.bucket): x.value for x in session.query(GymStatCounter)} == moved_counters
+    assert moved_counters[1, "age", "25-34"] == 1
+    assert (1, "active_goals", "") not in moved_counters
+    session.close()
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_progress_buckets(db: Session):
+    """It should group the progress of a customer per week and month, and keep the weekly gym series up to date"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    monday = week_start(date.today()) - timedelta(days=28)
+    session.add_all([Progress(customer_id=1, weight=weight, date=monday + timedelta(days=days))
+                     for days, weight in ((0, 90), (2, 86), (4, 88), (7, 85), (14, 84), (15, 83))])
+    session.commit()
+
+    response = client.get("/customers/1/progress", params={"bucket": "week"})
+    assert response.status_code == 200
+    buckets = response.json()["progress"]
+    # The old weigh-in of fill_tables plus three weeks
+    assert len(buckets) == 4
+    assert buckets[1] == {"bucket": monday.isoformat(), "measurements": 3, "min_weight": 86, "max_weight": 90,
+                          "mean_weight": 88, "last_weight": 88}
+    assert buckets[3]["last_weight"] == 83
+
+    months = client.get("/customers/1/progress", params={"bucket": "month"}).json()["progress"]
+    assert sum(x["measurements"] for x in months) == 7
+    assert all(x["bucket"].endswith("-01") for x in months)
+
+    assert client.get("/customers/1/progress", params={"bucket": "year"}).status_code == 422
+    assert len(client.get("/customers/1/progress").json()["progress"]) == 7
+
+    # The rollups of new weigh-ins are maintained, the backfill is rebuilt
+    assert rebuild_progress_rollups(session) == 5
+    session.add(Customer(first_name='Extra', last_name='Member', gender='female',
+                         birth_date=datetime(1999, 2, 2).date(), length=170, gym_id=1, activity_level=1.4))
+    session.commit()
+    assert client.post("/customers/1/progress", json={"weight": 81}).status_code == 201
+    assert client.post("/customers/3/progress", json={"weight": 60}).status_code == 201
+    assert client.post("/customers/3/progress", json={"weight": 61}).status_code == 201
+
+    series = client.get("/gyms/1/progress/weekly").json()["data"]
+    assert series[-1] == {"week": week_start(date.today()).isoformat(), "members": 2, "average_weight": 70.75}
+    assert series[-2]["average_weight"] == 83.5
+
+    maintained = {(x.customer_id, x.week): x.last_weight for x in session.query(ProgressRollup)}
+    assert rebuild_progress_rollups(session) == len(maintained)
+    session.expire_all()
+    assert {(x.customer_id, x.week): x.last_weight for x in session.query(ProgressRollup)} == maintained
+    session.close()
+
+    # The progress left behind by a deleted customer is not rolled up
+    assert client.delete("/customers/3").status_code == 200
+    session = committed_session()
+    assert session.query(Progress).filter(Progress.customer_id.is_(None)).count() == 2
+    assert rebuild_progress_rollups(session) == len(maintained) - 1
+    assert session.query(ProgressRollup).filter(ProgressRollup.customer_id.is_(None)).count() == 0
+    session.close()
+
+    assert client.get("/gyms/99/progress/weekly").status_code == 404
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_progress_analytics(db: Session):
+    """It should calculate the rolling metrics of the progress with window functions in one query"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    # Customer 1 loses 0.5 kg per day (3.5 kg per week) from 20 days ago
+    first_day = date.today() - timedelta(days=20)
+    session.add_all([Progress(customer_id=1, weight=100 - days // 2, date=first_day + timedelta(days=days))
+                     for days in range(0, 21, 2)])
+    session.commit()
+    session.close()
+
+    statements = []
+    listener = count_queries(statements)
+    event.listen(test_engine, "before_cursor_execute", listener)
+    try:
+        response = client.get("/customers/1/progress/analytics")
+    finally:
+        event.remove(test_engine, "before_cursor_execute", listener)
+
+    assert response.status_code == 200
+    assert len(statements) == 1
+    analytics = response.json()["analytics"]
+    assert len(analytics) == 12
+
+    # The old weigh-in of fill_tables is outside of every window of the new ones
+    assert analytics[0]["trend_per_week"] is None
+    assert analytics[0]["week_over_week"] is None
+    assert analytics[1]["average_7d"] == 100
+
+    latest = analytics[-1]
+    assert latest["weight"] == 90
+    # Weigh-ins of the last 7 days: 93, 92, 91, 90, and of the 7 days before: 96, 95, 94
+    assert latest["average_7d"] == 91.5
+    assert latest["week_over_week"] == -3.5
+    assert latest["trend_per_week"] == -3.5
+
+    gym_analytics = client.get("/gyms/1/progress/analytics").json()["data"]
+    assert gym_analytics == {"1": latest}
+    assert client.get("/gyms/2/progress/analytics").json()["data"]["2"]["average_30d"] == 50
+
+    assert client.get("/customers/99/progress/analytics").status_code == 404
+    assert client.get("/gyms/99/progress/analytics").status_code == 404
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_progress_anomalies(db: Session):
+    """It should flag weigh-ins far from the running statistics of the customer"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.add_all([Progress(customer_id=1, weight=weight, date=date.today() - timedelta(days=10 - x))
+                     for x, weight in enumerate((81, 79, 80, 82, 80))])
+    session.commit()
+    # Statistics of the weigh-ins stored before
+    assert rescan_progress(session) == (2, 0)
+
+    response = client.post("/customers/1/progress", json={"weight": 81})
+    assert response.status_code == 201
+    assert response.json()["anomaly"] is None
+
+    response = client.post("/customers/1/progress", json={"weight": 95})
+    anomaly = response.json()["anomaly"]
+    assert anomaly["expected_weight"] == 80.43
+    assert anomaly["z_score"] > 3
+
+    feed = client.get("/progress/anomalies").json()
+    assert [(x["customer_id"], x["weight"], x["z_score"]) for x in feed] == [(1, 95, anomaly["z_score"])]
+    assert client.get("/progress/anomalies", params={"customer_id": 2}).json() == []
+
+    session.expire_all()
+    assert session.get(ProgressStat, 1).count == 8
+
+    # The rescan finds the same anomalies and statistics
+    maintained = session.get(ProgressStat, 1).mean
+    assert rescan_progress(session) == (2, 1)
+    session.expire_all()
+    assert session.get(ProgressStat, 1).mean == pytest.approx(maintained)
+    assert session.query(ProgressAnomaly).one().z_score == anomaly["z_score"]
+    session.close()
+
+    assert client.delete("/customers/1").status_code == 200
+    assert client.get("/progress/anomalies").json() == []
+
+    # The progress left behind by the deleted customer is skipped
+    session = committed_session()
+    assert session.query(Progress).filter(Progress.customer_id.is_(None)).count() == 8
+    assert rescan_progress(session) == (1, 0)
+    assert [x.customer_id for x in session.query(ProgressStat)] == [2]
+    session.close()
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_goal_outcomes(db: Session):
+    """It should evaluate the ended goals incrementally and aggregate the outcomes per gym"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    # Customer 1 reaches the goal of 70 kg that ended yesterday, customer 2 misses the goal of 60 kg
+    session.add_all([
+        Progress(customer_id=1, weight=72, date=date.today() - timedelta(days=5)),
+        Progress(customer_id=1, weight=69, date=date.today()),
+        Progress(customer_id=2, weight=55, date=date.today() - timedelta(days=13))
+    ])
+    session.commit()
+
+    statements = []
+    listener = count_queries(statements)
+    event.listen(test_engine, "before_cursor_execute", listener)
+    try:
+        with patch.object(goal_outcomes, "goal_outcome_grace_days", 0), \
+                patch.object(goal_outcomes, "goal_outcome_chunk_size", 1):
+            assert evaluate_goal_outcomes(session) == 2
+    finally:
+        event.remove(test_engine, "before_cursor_execute", listener)
+
+    # One query per chunk of goals plus one to find the end of the last chunk
+    assert len([x for x in statements if x.lstrip().upper().startswith("SELECT") and "FROM goals" in x]) == 3
+
+    outcomes = {x.customer_id: x for x in session.query(GoalOutcome)}
+    assert (outcomes[1].outcome, outcomes[1].final_weight, outcomes[1].margin) == ("met", 69, 1)
+    assert (outcomes[2].outcome, outcomes[2].final_weight, outcomes[2].margin) == ("missed", 55, -5)
+
+    # The next run only looks at the goals that ended since
+    session.add(Goal(customer_id=1, weight_goal=65, start_date=date.today() - timedelta(days=30),
+                     end_date=date.today()))
+    session.commit()
+    with patch.object(goal_outcomes, "goal_outcome_grace_days", 0):
+        assert evaluate_goal_outcomes(session) == 0
+        assert evaluate_goal_outcomes(session, today=date.today() + timedelta(days=1)) == 1
+    assert session.query(GoalOutcome).count() == 3
+    session.close()
+
+    response = client.get("/gyms/1/goal_outcomes").json()
+    assert (response["goals"], response["met"], response["missed"], response["success_rate"]) == (2, 1, 1, 0.5)
+    assert client.get("/gyms/2/goal_outcomes").json()["success_rate"] == 0
+    assert client.get("/gyms/99/goal_outcomes").status_code == 404
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_get_expiring_goals(db: Session):
+    """It should list the goals ending in the next days with a range scan, cached until midnight"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.add_all([
+        Goal(customer_id=1, weight_goal=75, start_date=date.today() - timedelta(days=10),
+             end_date=date.today() + timedelta(days=days))
+        for days in (0, 6, 13, 40)
+    ] + [Goal(customer_id=2, weight_goal=55, start_date=date.today(), end_date=date.today() + timedelta(days=3))])
+    session.commit()
+    session.close()
+
+    queries = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        queries.append((statement, parameters))
+
+    event.listen(test_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.get("/goals/expiring", params={"within_days": 7})
+        assert client.get("/goals/expiring", params={"within_days": 7}).json() == response.json()
+    finally:
+        event.remove(test_engine, "before_cursor_execute", before_cursor_execute)
+
+    assert response.status_code == 200
+    assert [(x["customer_id"], x["end_date"]) for x in response.json()] == [
+        (1, str(date.today())), (2, str(date.today() + timedelta(days=3))), (1, str(date.today() + timedelta(days=6)))
+    ]
+    assert response.json()[1]["customer_name"] == "Jane Smith"
+
+    # The second request was served from the cache, after reading the generations of the gyms
+    queries = [query for query in queries if "cache_generations" not in query[0] and "FROM gyms" not in query[0]]
+    assert len(queries) == 1
+    assert expiring_goals_cache.stats()["hits"] == 1
+
+    with test_engine.connect() as connection:
+        plan = " ".join(row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {queries[0][0]}",
+                                                                       queries[0][1]))
+    assert "ix_goals_end_date_customer_id" in plan
+
+    assert [x["customer_id"] for x in client.get("/goals/expiring", params={"within_days": 7, "gym_id": 2}).json()] == [2]
+    assert len(client.get("/goals/expiring", params={"within_days": 20}).json()) == 4
+    assert client.get("/goals/expiring", params={"within_days": -1}).status_code == 422
+
+    # Goal writes invalidate the cache
+    assert client.post("/customers/2/goals", json={
+        "weight_goal": 58, "start_date": str(date.today()), "end_date": str(date.today() + timedelta(days=1))
+    }).status_code == 201
+    assert len(client.get("/goals/expiring", params={"within_days": 7}).json()) == 4
+
+    # Goals deleted on another replica bump the generation of their gym, the cached goals are not served
+    session = committed_session()
+    session.query(Goal).filter(Goal.customer_id == 2).delete()
+    bump_generation(expiring_goals_generation(2), session)
+    session.commit()
+    session.close()
+
+    invalidations = expiring_goals_cache.stats()["invalidations"]
+    assert [x["customer_id"] for x in client.get("/goals/expiring", params={"within_days": 7}).json()] == [1, 1]
+    assert expiring_goals_cache.stats()["invalidations"] == invalidations + 1
+
+    # Writes that cannot change a cached window leave the generations alone
+    shared = client.get("/cache/stats").json()["expiring_goals"]["shared_invalidations"]
+    assert client.patch("/customers/1", json={"activity_level": 1.4}).status_code == 200
+    assert client.post("/customers/2/goals", json={
+        "weight_goal": 58, "start_date": str(date.today()), "end_date": str(date.today() + timedelta(days=60))
+    }).status_code == 201
+    assert client.get("/cache/stats").json()["expiring_goals"]["shared_invalidations"] == shared
+
+    # A new name only invalidates the goals of the gym of the customer (and of all gyms)
+    assert client.get("/goals/expiring", params={"within_days": 7, "gym_id": 2}).status_code == 200
+    assert client.patch("/customers/1", json={"first_name": "Johnny"}).status_code == 200
+    assert client.get("/cache/stats").json()["expiring_goals"]["shared_invalidations"] == shared + 1
+
+    hits = expiring_goals_cache.stats()["hits"]
+    assert client.get("/goals/expiring", params={"within_days": 7}).json()[0]["customer_name"] == "Johnny Doe"
+    assert client.get("/goals/expiring", params={"within_days": 7, "gym_id": 2}).json() == []
+    assert expiring_goals_cache.stats()["hits"] == hits + 1
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_goal_and_progress_filters(db: Session):
+    """It should filter goals and progress by date range, customer and gym with index range scans"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.add_all([
+        Progress(customer_id=customer_id, weight=weight, date=date.today() - timedelta(days=days))
+        for customer_id, weight, days in ((1, 79, 20), (1, 78, 10), (2, 51, 12), (2, 52, 2))
+    ])
+    session.commit()
+    session.close()
+
+    today = date.today()
+    queries = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        queries.append((statement, parameters))
+
+    requests = [
+        ("/goals/", {"from": str(today - timedelta(days=10)), "to": str(today)}, [1]),
+        ("/goals/", {"customer_id": 2, "from": str(today - timedelta(days=30))}, [2]),
+        ("/goals/", {"gym_id": 2}, [2]),
+        ("/progress/", {"from": str(today - timedelta(days=15)), "to": str(today)}, [2, 1, 2]),
+        ("/progress/", {"customer_id": 1, "from": str(today - timedelta(days=30))}, [1, 1]),
+        ("/progress/", {"gym_id": 2, "to": str(today - timedelta(days=5))}, [2, 2]),
+    ]
+
+    plans = []
+    for url, params, customer_ids in requests:
+        queries.clear()
+        event.listen(test_engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            response = client.get(url, params=params)
+        finally:
+            event.remove(test_engine, "before_cursor_execute", before_cursor_execute)
+
+        assert response.status_code == 200
+        assert [x["customer_id"] for x in response.json()] == customer_ids
+
+        with test_engine.connect() as connection:
+            plans.append(" ".join(row[-1] for row in connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {queries[0][0]}", queries[0][1])))
+
+    # Every combination is a range scan over an index, never a full table scan
+    for plan in plans:
+        assert "SCAN goals" not in plan and "SCAN progress" not in plan
+        assert "USING INDEX" in plan or "USING COVERING INDEX" in plan
+
+    assert "ix_goals_end_date_customer_id" in plans[0]
+    assert "ix_goals_customer_id_end_date" in plans[1]
+    assert "ix_progress_date_id" in plans[3]
+    assert "ix_progress_customer_id_date" in plans[4]
+
+    # Pages of a filtered list follow the date order
+    first_page = client.get("/progress/", params={"from": str(today - timedelta(days=15)), "limit": 2})
+    next_page = client.get("/progress/", params={"from": str(today - timedelta(days=15)), "limit": 2,
+                                                 "cursor": first_page.headers["X-Next-Cursor"]})
+    assert [x["weight"] for x in first_page.json() + next_page.json()] == [51, 78, 52]
+
+    assert client.get("/goals/", params={"from": str(today), "to": str(today - timedelta(days=1))}).status_code == 422
+    assert client.get("/progress/", params={"from": "yesterday"}).status_code == 422
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_progress_date_bounds(db: Session):
+    """It should bound the customer progress by date, so partitions can be pruned"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.add_all([
+        Progress(customer_id=1, weight=weight, date=date.today() - timedelta(days=days))
+        for weight, days in ((79, 40), (78, 10))
+    ])
+    session.commit()
+    session.close()
+
+    today = date.today()
+    response = client.get("/customers/1/progress", params={"from": str(today - timedelta(days=60))})
+    assert [x["weight"] for x in response.json()["progress"]] == [79, 78]
+
+    response = client.get("/customers/1/progress", params={"bucket": "day", "to": str(today - timedelta(days=10))})
+    assert [x["last_weight"] for x in response.json()["progress"]] == [80, 79, 78]
+
+    assert client.get("/customers/1/progress", params={"from": str(today),
+                                                      "to": str(today - timedelta(days=1))}).status_code == 422
+
+    progress_id = client.get("/progress/", params={"customer_id": 1}).json()[-1]["id"]
+    assert client.get(f"/progress/{progress_id}", params={"date": str(today - timedelta(days=10))}).json()["weight"] == 78
+    assert client.get(f"/progress/{progress_id}", params={"date": str(today)}).status_code == 404
+
+    # The startup hook leaves a plain progress table alone
+    with TestClient(app) as startup_client:
+        assert startup_client.get("/").status_code == 200
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_formula_selection(db: Session):
+    """It should use the BMR formula of the gym, unless the request selects another one"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+    session.add(Goal(customer_id=1, weight_goal=75, start_date=date.today(),
+                     end_date=date.today() + timedelta(days=60)))
+    session.commit()
+    session.close()
+
+    default_plan = client.get("/customers/1/daily_calorie_intake").json()["detailed_daily_cal_intake"]
+    harris_benedict_plan = client.get("/customers/1/daily_calorie_intake",
+                                      params={"bmr_formula": "harris_benedict"}).json()["detailed_daily_cal_intake"]
+    assert harris_benedict_plan != default_plan
+
+    assert client.get("/customers/1/daily_calorie_intake", params={"bmr_formula": "made_up"}).status_code == 422
+    assert client.post("/gyms", json={"name": "Odd Gym", "address_place": "Ede",
+                                      "macro_profile": "made_up"}).status_code == 422
+
+    # Gym setting
+    assert client.post("/gyms", json={"name": "Lab Gym", "address_place": "Ede",
+                                      "bmr_formula": "harris_benedict"}).status_code == 201
+    assert client.patch("/customers/1", json={"gym_id": 3}).status_code == 200
+
+    assert client.get("/gyms/3").json()["bmr_formula"] == "harris_benedict"
+    assert client.get("/customers/1/daily_calorie_intake").json()["detailed_daily_cal_intake"] == harris_benedict_plan
+    assert client.get("/daily_intake_all").json()["data"][0] == harris_benedict_plan
+
+    # The SQL-side calculation uses the same tables
+    sql_plan = client.get("/daily_intake_all", params={"sql": True}).json()["data"][0]
+    assert_plans_close(sql_plan, harris_benedict_plan)
+
+    drop_tables()
+
+##########################################################################
+#  C A L O R I E  S I M U L A T I O N  T E S T   C A S E S
+##########################################################################
+
+@pytest.mark.asyncio
+async def test_simulate_daily_calorie_intake(db: Session):
+    """It should evaluate goal scenarios for a customer without writing anything"""
+    create_tables(db)
+    session = committed_session()
+    fill_tables(session)
+
+    scenarios = [
+        {"weight_goal": 75, "end_date": str(date.today() + timedelta(days=days))}
+        for days in range(10, 400, 10)
+    ]
+    response = client.post("/calories/simulate", json={"customer_id": 1, "scenarios": scenarios})
+
+    assert response.status_code == 200
+    assert len(response.json()["scenarios"]) == len(scenarios)
+    assert response.json()["customer_data"]["weight"] == 80
+    assert session.query(Goal).count() == 2
+    session.close()
+
+    drop_tables()
+
+@pytest.mark.asyncio
+async def test_simulate_daily_calorie_intake_bad_request(db: Session):
+    """It should reject scenarios that end before they start"""
+    create_tables(db)
+    fill_tables(db)
+
+    response = client.post("/calories/simulate", json={"customer_id": 1, "scenarios": [{
+        "weight_goal": 75, "start_date": str(date.today() + timedelta(days=20)),
+        "end_date": str(date.today() + timedelta(days=10))
+    }]})
+    assert response.status_code == 422
+
+    response = client.post("/calories/simulate", json={"customer_id": 1, "scenarios": []})
+    assert response.status_code == 422
+
+    drop_tables()
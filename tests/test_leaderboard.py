@@ -0,0 +1,22 @@
+import pytest
+
+from services.leaderboard import goal_progress
+
+def test_goal_progress_weightloss():
+    """It should give the share of the weight to lose that is lost"""
+    assert goal_progress(90, 85, 80) == 50
+    assert goal_progress(90, 80, 80) == 100
+    assert goal_progress(90, 75, 80) == 150
+
+def test_goal_progress_musclegain():
+    """It should give the share of the weight to gain that is gained"""
+    assert goal_progress(70, 73, 80) == 30
+
+def test_goal_progress_wrong_direction():
+    """It should be negative when the weight moves away from the goal"""
+    assert goal_progress(90, 92, 80) == -20
+
+@pytest.mark.parametrize("weight, expected", [(80, 100), (82, 0)])
+def test_goal_progress_maintenance(weight, expected):
+    """It should be complete only at the goal when the goal is the start weight"""
+    assert goal_progress(80, weight, 80) == expected
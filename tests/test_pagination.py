@@ -0,0 +1,31 @@
+import pytest
+from datetime import date
+from fastapi import HTTPException
+from unittest.mock import patch
+
+from models.entities import Goal as GoalsTable
+from services.pagination import encode_cursor, decode_cursor, page_size, get_page
+
+def test_cursor_round_trip():
+    columns = [GoalsTable.end_date, GoalsTable.id]
+    cursor = encode_cursor([date(2025, 1, 31), 12])
+
+    assert decode_cursor(cursor, columns) == [date(2025, 1, 31), 12]
+
+def test_invalid_cursor():
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor("not-a-cursor", [GoalsTable.id])
+
+    assert exc.value.status_code == 400
+
+def test_page_size_is_capped():
+    with patch("services.pagination.max_page_size", 50):
+        assert page_size(10) == 10
+        assert page_size(5000) == 50
+
+def test_get_page():
+    rows, next_cursor = get_page([1, 2, 3], 2, lambda x: [x])
+
+    assert rows == [1, 2]
+    assert next_cursor == encode_cursor([2])
+    assert get_page([1, 2], 2, lambda x: [x]) == ([1, 2], None)
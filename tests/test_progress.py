@@ -3,7 +3,7 @@ from unittest.mock import MagicMock
 from fastapi import HTTPException
 from routers.progress import get_progress, get_progress_by_id
 from models.entities import Progress as ProgressTable
-from datetime import datetime
+from datetime import datetime, date
 
 from schemas.responses import ProgressResponse
 
@@ -36,12 +36,22 @@ async def test_get_progress_database_error():
 @pytest.mark.asyncio
 async def test_get_progress_response_ok():
     mock_db = MagicMock()
-    mock_db.query.return_value.all.return_value = mock_progresses
+    mock_db.query.return_value.order_by.return_value.limit.return_value.all.return_value = mock_progresses
 
     response = await get_progress(db=mock_db)
 
     assert response == mock_progress_responses
 
+@pytest.mark.asyncio
+async def test_get_progress_reversed_range():
+    mock_db = MagicMock()
+
+    with pytest.raises(HTTPException) as exc:
+        await get_progress(from_date=date(2025, 2, 1), to_date=date(2025, 1, 1), db=mock_db)
+
+    assert exc.value.status_code == 422
+    mock_db.query.assert_not_called()
+
 @pytest.mark.asyncio
 async def test_get_progress_by_id_not_found():
     mock_db = MagicMock()
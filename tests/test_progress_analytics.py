@@ -0,0 +1,25 @@
+from datetime import date
+
+from sqlalchemy import create_engine, select, literal
+from sqlalchemy.dialects import postgresql
+
+from services.progress_analytics import analytics_statement
+from services.sql_functions import day_number
+
+def test_day_number_sqlite():
+    """SQLite should count the days since 1970-01-01 like PostgreSQL"""
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection:
+        assert connection.execute(select(day_number(literal(date(1970, 1, 1))))).scalar() == 0
+        assert connection.execute(select(day_number(literal(date(2024, 6, 1))))).scalar() == \
+            (date(2024, 6, 1) - date(1970, 1, 1)).days
+
+def test_analytics_statement_postgresql():
+    """The windows should be RANGE frames over the day number on PostgreSQL"""
+    sql = str(analytics_statement(customer_id=1).compile(dialect=postgresql.dialect(),
+                                                        compile_kwargs={"literal_binds": True}))
+
+    assert "(progress.date - DATE '1970-01-01')" in sql
+    assert "RANGE BETWEEN 29 PRECEDING AND CURRENT ROW" in sql
+    assert "RANGE BETWEEN 13 PRECEDING AND 7 PRECEDING" in sql
+    assert "julianday" not in sql
@@ -0,0 +1,35 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import create_engine, select, literal
+from sqlalchemy.dialects import postgresql
+
+from services.progress_rollups import week_start, bucket_statement
+from services.sql_functions import date_bucket
+
+@pytest.mark.parametrize("day", [date(2024, 6, 3) + timedelta(days=x) for x in range(7)])
+def test_week_start(day):
+    """It should give the Monday of the week"""
+    assert week_start(day) == date(2024, 6, 3)
+
+@pytest.mark.parametrize("unit, expected", [
+    ("day", date(2024, 6, 9)), ("week", date(2024, 6, 3)), ("month", date(2024, 6, 1))
+])
+def test_date_bucket_sqlite(unit, expected):
+    """SQLite should give the same buckets as date_trunc"""
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection:
+        # Sunday, the last day of its week
+        assert connection.execute(select(date_bucket(unit, literal(date(2024, 6, 9))))).scalar() == expected
+
+def test_date_bucket_postgresql():
+    """It should use date_trunc on PostgreSQL"""
+    sql = str(bucket_statement("week", 1).compile(dialect=postgresql.dialect()))
+
+    assert "CAST(date_trunc('week', progress.date) AS DATE)" in sql
+    assert "first_value(progress.weight)" in sql
+
+def test_date_bucket_unknown_unit():
+    """It should only accept the supported units"""
+    with pytest.raises(ValueError):
+        date_bucket("year; DROP TABLE progress", literal(date(2024, 6, 9)))
@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from services.functions import calculate_daily_calories_and_macros
+from services.schedules import calculate_schedules, ages_on_dates
+
+def customer_row(**kwargs):
+    return {
+        "weight": 90,
+        "date": date(2024, 1, 1),
+        "weight_goal": 80,
+        "start_date": date(2024, 1, 1),
+        "end_date": date(2024, 4, 10),
+        "activity_level": 1.5,
+        "length": 180,
+        "gender": "male",
+        "birth_date": date(1990, 3, 1),
+        **kwargs
+    }
+
+def test_ages_on_dates():
+    """The vectorized ages should match calculate_age, also around (leap day) birthdays"""
+    # Arrange
+    birth_dates = [date(1990, 3, 1), date(2000, 2, 29), date(1985, 12, 31)]
+    days = [date(2023, 1, 1) + timedelta(days=x) for x in range(800)]
+
+    for birth_date in birth_dates:
+        # Act
+        ages = ages_on_dates([birth_date], np.array(days, dtype="datetime64[D]"), np.zeros(len(days), dtype=int))
+
+        # Assert
+        expected = [day.year - birth_date.year - ((day.month, day.day) < (birth_date.month, birth_date.day))
+                    for day in days]
+        assert ages.tolist() == expected
+
+def test_calculate_schedules():
+    """The schedule should run until the end date with a linearly projected weight"""
+    # Arrange
+    first_day = date(2024, 1, 1)
+
+    # Act
+    schedule = calculate_schedules([customer_row()], first_day)[0]
+
+    # Assert
+    assert len(schedule) == 100
+    assert schedule[0]["date"] == "2024-01-01"
+    assert schedule[-1]["date"] == "2024-04-09"
+    assert schedule[0]["projected_weight"] == 90
+    assert schedule[50]["projected_weight"] == 85
+    assert schedule[-1]["projected_weight"] == 80.1
+
+    # The first day is the static plan, later days need less calories for the lower weight
+    first = {key: value for key, value in schedule[0].items()
+             if key not in ("date", "projected_weight", "bmr", "total_energy_exp")}
+    assert first == calculate_daily_calories_and_macros(90, 80, 100, 180, 33, "male", 1.5)
+    assert schedule[-1]["total_daily_calories"] < schedule[0]["total_daily_calories"]
+    assert schedule[-1]["bmr"] < schedule[0]["bmr"]
+
+    # Birthday on March 1st
+    assert schedule[59]["bmr"] - schedule[60]["bmr"] > 5
+
+def test_calculate_schedules_many_rows():
+    """Schedules of many rows should equal the schedules of the single rows"""
+    # Arrange
+    first_day = date(2024, 1, 1)
+    rows = [
+        customer_row(),
+        customer_row(end_date=date(2023, 12, 1)),
+        customer_row(weight=60, weight_goal=65, gender="female", end_date=date(2024, 1, 11)),
+        customer_row(weight_goal=90, end_date=date(2024, 1, 2))
+    ]
+
+    # Act
+    schedules = calculate_schedules(rows, first_day)
+
+    # Assert
+    assert [len(x) for x in schedules] == [100, 0, 10, 1]
+    assert schedules == [calculate_schedules([row], first_day)[0] for row in rows]
+    assert schedules[2][0]["goal_type"] == "musclegain"
+    assert schedules[3][0]["goal_type"] == "maintenance"
+
+def test_calculate_schedules_ended():
+    """Goals that have ended should give empty schedules"""
+    assert calculate_schedules([customer_row(end_date=date(2023, 1, 1))], date(2024, 1, 1)) == [[]]
@@ -0,0 +1,19 @@
+from datetime import date
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from services.sql_plans import plan_statement
+
+def test_plan_statement_postgresql():
+    """The plan query should only use PostgreSQL date arithmetic on PostgreSQL"""
+    sql = str(plan_statement(False, today=date(2024, 1, 1)).compile(dialect=postgresql.dialect()))
+
+    assert "julianday" not in sql
+    assert "EXTRACT(year FROM" in sql
+    assert "round(CAST(" in sql
+
+def test_plan_statement_sqlite():
+    sql = str(plan_statement(True, gym_id=1, today=date(2024, 1, 1)).compile(dialect=sqlite.dialect()))
+
+    assert "julianday" in sql
+    assert "start_date" in sql